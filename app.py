@@ -10,7 +10,7 @@ from datetime import datetime, timedelta
 from utils.practice_tracker import PracticeTracker
 from utils.math_problems import get_problem
 from sqlalchemy import func
-from database import db
+from database import ReadReplica, configure_engine, create_tables, db, engine_options
 from extensions import socketio
 
 # Configure logging
@@ -50,7 +50,48 @@ def create_app(test_config=None):
         database_url = 'sqlite:///fluency.db'
     
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    
+    # Optional read-only replica for dashboards and analytics (see database.ReadReplica)
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        if replica_url.startswith('postgres://'):
+            replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+        app.config['REPLICA_DATABASE_URI'] = replica_url
+    app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', 5.0))  # Seconds
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Write-behind buffering of practice attempts and quiz answers (see services.attempt_buffer)
+    app.config['ATTEMPT_BUFFER_ENABLED'] = os.environ.get('ATTEMPT_BUFFER', 'False').lower() == 'true'
+    app.config['ATTEMPT_BUFFER_FLUSH_MS'] = int(os.environ.get('ATTEMPT_BUFFER_FLUSH_MS', 250))
+    app.config['ATTEMPT_BUFFER_MAX_ROWS'] = int(os.environ.get('ATTEMPT_BUFFER_MAX_ROWS', 200))
+    app.config['ATTEMPT_BUFFER_MAX_RETRIES'] = int(os.environ.get('ATTEMPT_BUFFER_MAX_RETRIES', 5))
+    app.config['ATTEMPT_BUFFER_MAX_QUEUE'] = int(os.environ.get('ATTEMPT_BUFFER_MAX_QUEUE', 10000))
+    
+    # How often heartbeats are written to active_session (see services.presence)
+    app.config['PRESENCE_FLUSH_SECONDS'] = int(os.environ.get('PRESENCE_FLUSH_SECONDS', 30))
+    app.config['PRESENCE_SNAPSHOT_SECONDS'] = float(os.environ.get('PRESENCE_SNAPSHOT_SECONDS', 1))
+    app.config['CLASS_ROSTER_SECONDS'] = int(os.environ.get('CLASS_ROSTER_SECONDS', 60))
+    
+    # Logged-in users are cached per process (see services.identity)
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))  # Seconds
+    
+    # Lets a Prometheus scraper read /metrics without an admin session
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    
+    # Most SQL statements a request or socket event should need (see services.query_budget)
+    app.config['QUERY_BUDGET_PER_REQUEST'] = int(os.environ.get('QUERY_BUDGET_PER_REQUEST', 50))
+    app.config['QUERY_BUDGET_PER_EVENT'] = int(os.environ.get('QUERY_BUDGET_PER_EVENT', 20))
+    
+    # Active-students live stream (see services.live_updates)
+    app.config['LIVE_UPDATE_INTERVAL'] = float(os.environ.get('LIVE_UPDATE_INTERVAL', 5.0))  # Seconds
+    app.config['LIVE_UPDATE_QUEUE_SIZE'] = int(os.environ.get('LIVE_UPDATE_QUEUE_SIZE', 10))
+    
+    # Periodic maintenance jobs (see services.scheduler); intervals in seconds
+    app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER', 'True').lower() == 'true'
+    app.config['SESSION_CLEANUP_SECONDS'] = int(os.environ.get('SESSION_CLEANUP_SECONDS', 300))
+    app.config['QUIZ_PRUNE_SECONDS'] = int(os.environ.get('QUIZ_PRUNE_SECONDS', 3600))
+    app.config['FACT_STATS_REFRESH_SECONDS'] = int(os.environ.get('FACT_STATS_REFRESH_SECONDS', 86400))
     
     # Email configuration
     app.config['SMTP_HOST'] = os.environ.get('SMTP_HOST')
@@ -68,6 +109,9 @@ def create_app(test_config=None):
     if test_config is not None:
         app.config.update(test_config)
     
+    # Pool profile for the final database URL; the engine is built by db.init_app below
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    
     # Load .env file if it exists
     env_path = os.path.join(os.path.dirname(__file__), '.env')
     if os.path.exists(env_path):
@@ -79,7 +123,6 @@ def create_app(test_config=None):
     # Debug after loading .env
     logger.debug("After load_dotenv:")
     logger.debug(f"GOOGLE_CLIENT_ID exists: {os.environ.get('GOOGLE_CLIENT_ID') is not None}")
-    logger.debug(f"All environment variables: {list(os.environ.keys())}")
     
     # Allow OAuth over HTTP for local development
     if os.environ.get('FLASK_DEBUG') == 'True':
@@ -98,12 +141,18 @@ def create_app(test_config=None):
     from models.user import User
     from models.class_ import Class
     from models.practice_attempt import PracticeAttempt
+    from models.user_fact_stat import UserFactStat
+    from models.attempt_window import AttemptWindow
     from models.assignment import Assignment, AssignmentProgress, AttemptHistory
     from models.quiz import Quiz, QuizParticipant, QuizQuestion
+    from models.job_lease import JobLease
     
     # Create database tables
     with app.app_context():
-        db.create_all()
+        # Pragmas and the write queue must be in place before the first connection
+        app.extensions['sqlite_write_queue'] = configure_engine(db.engine)
+        # Existing databases get newer tables and columns from `flask db upgrade`
+        create_tables()
     
     # Import WebSocket handlers
     from websockets.quiz import (
@@ -178,9 +227,45 @@ def create_app(test_config=None):
     app.register_blueprint(progress_bp)
     app.register_blueprint(assignment_bp)
     
+    # Optional write-behind for attempts; flushes itself on interpreter exit
+    from services.attempt_buffer import AttemptBuffer
+    AttemptBuffer(app)
+    
+    # Who is online lives in memory; active_session is written in batches
+    from services.presence import ClassPresenceIndex, PresenceTracker
+    PresenceTracker(app)
+    ClassPresenceIndex(app)
+    
+    # One producer feeds every open active-students stream
+    from services.live_updates import StudentUpdateHub
+    StudentUpdateHub(app)
+    
+    # Maintenance jobs, lease-locked so one worker runs each; started by the server entry points
+    from services.scheduler import Scheduler
+    Scheduler(app)
+    
+    # Dashboards read from the replica when one is configured and fresh
+    ReadReplica(app)
+    
+    # Request, SQL, Socket.IO and pool metrics, served at /metrics
+    from services.metrics import Metrics
+    Metrics(app)
+    
+    # Warn (fail, under TESTING) when a request runs more statements than it should
+    from services.query_budget import init_query_budgets
+    init_query_budgets(app)
+    
+    # Level decisions are memoized for exactly one request
+    from services.mastery_engine import drop_mastery_engine
+    app.teardown_request(drop_mastery_engine)
+    
+    # Requests and socket events resolve current_user from cached snapshots
+    from services.identity import IdentityCache
+    identity_cache = IdentityCache(app)
+    
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity_cache.load(int(user_id))
     
     @app.cli.command("reset-db")
     def reset_db():
@@ -191,16 +276,8 @@ def create_app(test_config=None):
         db.create_all()
         print("Stamping alembic version...")
         from flask_migrate import stamp
-        # Get the migration directory
-        migrations_dir = os.path.join(os.path.dirname(__file__), 'migrations', 'versions')
-        # Get the latest revision file
-        revision_files = [f for f in os.listdir(migrations_dir) if f.endswith('.py')]
-        if revision_files:
-            latest_revision = revision_files[0].split('_')[0]
-            print(f"Stamping with revision: {latest_revision}")
-            stamp(revision=latest_revision)
-        else:
-            print("No revision files found")
+        # create_all built the newest schema, so no revision is left to run
+        stamp(directory=os.path.join(os.path.dirname(__file__), 'migrations'), revision='head')
         print("Database reset complete!")
     
     @app.template_filter('timeago')
@@ -218,33 +295,7 @@ def create_app(test_config=None):
         else:
             return "just now"
     
-    def calculate_difficulty_level(user_id, operation, current_level):
-        """Calculate the appropriate difficulty level based on user performance."""
-        # Get recent attempts (last 10) for the current level
-        recent_attempts = PracticeAttempt.query.filter_by(
-            user_id=user_id,
-            operation=operation,
-            level=current_level
-        ).order_by(PracticeAttempt.created_at.desc()).limit(10).all()
-        
-        if not recent_attempts:
-            return current_level
-        
-        # Calculate success rate
-        correct_count = sum(1 for attempt in recent_attempts if attempt.is_correct)
-        success_rate = correct_count / len(recent_attempts)
-        
-        # Get average time for correct attempts
-        correct_times = [a.time_taken for a in recent_attempts if a.is_correct and a.time_taken]
-        avg_time = sum(correct_times) / len(correct_times) if correct_times else float('inf')
-        
-        # Decision logic for level adjustment
-        if success_rate >= 0.9 and avg_time < 5.0:  # 90% accuracy and under 5 seconds
-            return min(current_level + 1, 5 if operation == 'addition' else 12)
-        elif success_rate < 0.7:  # Less than 70% accuracy
-            return max(current_level - 1, 1)
-        
-        return current_level
+    from services.attempt_buffer import save_attempt
     
     @app.route('/record_attempt', methods=['POST'])
     @login_required
@@ -260,7 +311,7 @@ def create_app(test_config=None):
             is_correct=data['isCorrect'],
             time_taken=data.get('timeTaken')
         )
-        db.session.add(attempt)
+        save_attempt(attempt)
         db.session.commit()
         return jsonify({'success': True})
     
@@ -268,6 +319,7 @@ def create_app(test_config=None):
 
 if __name__ == '__main__':
     app = create_app()
+    app.extensions['scheduler'].start()
     # Run with WebSocket on port 5001
     socketio.run(
         app,
@@ -1,3 +1,334 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Optional
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.elements import TextClause
+import logging
 
-db = SQLAlchemy()
+logger = logging.getLogger(__name__)
+
+_WRITE_STATEMENT = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b', re.IGNORECASE)
+
+_REPLICA_READS = 'replica_reads'  # session.info flag: reads may go to the replica
+_PRIMARY_ONLY = 'primary_only'    # session.info flag: this session has written
+
+class RoutingSession(Session):
+    """Session that can send reads to the read replica.
+
+    Reads go to the replica only inside replica_reads() (or a
+    read_from_replica view), only while the replica is within
+    REPLICA_MAX_LAG of the primary, and never once the session has written,
+    so a request always sees its own writes. Flushes and DML always use the
+    primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get(_REPLICA_READS) and not self.info.get(_PRIMARY_ONLY)
+                and not self._flushing and not _is_write(clause) and has_app_context()):
+            replica = current_app.extensions.get('read_replica')
+            engine = replica.usable_engine() if replica is not None else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _is_write(clause) -> bool:
+    if clause is None:
+        return False
+    if getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None:
+        return True
+    return isinstance(clause, TextClause) and bool(_WRITE_STATEMENT.match(clause.text))
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stick_to_primary(session, flush_context):
+    session.info[_PRIMARY_ONLY] = True
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _stick_to_primary_on_dml(orm_execute_state):
+    if _is_write(orm_execute_state.statement):
+        orm_execute_state.session.info[_PRIMARY_ONLY] = True
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Production pool, per worker process. Under eventlet the pool's locks and
+# waits are green (monkey patched), so it can be shared by every green
+# thread; size it for how many of them may hold a connection at once.
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 5
+DEFAULT_POOL_TIMEOUT = 30     # Seconds a request waits for a connection before erroring
+DEFAULT_POOL_RECYCLE = 1800   # Seconds; replace connections before a proxy/server idles them out
+
+def engine_options(database_url: str, environ=os.environ) -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URL.
+
+    Server databases get a bounded QueuePool that pings connections on
+    checkout and recycles them, sized by DB_POOL_SIZE, DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT and DB_POOL_RECYCLE. Must be in the config before
+    db.init_app, which builds the engine.
+    """
+    if make_url(database_url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': int(environ.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)),
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE)),
+        'pool_pre_ping': True,
+        'pool_use_lifo': True  # Reuse warm connections so idle extras age out
+    }
+
+# SQLite file databases (what small schools run): WAL lets readers carry on
+# while one connection writes, and NORMAL sync is durable under WAL except
+# across power loss. Tunable with the SQLITE_* environment variables.
+DEFAULT_SQLITE_BUSY_TIMEOUT_MS = 5000
+DEFAULT_SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_SQLITE_CACHE_SIZE_KB = 64 * 1024
+
+def sqlite_pragmas(environ=os.environ) -> Dict[str, object]:
+    """Pragmas set on every new SQLite connection, in order."""
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(environ.get('SQLITE_BUSY_TIMEOUT_MS', DEFAULT_SQLITE_BUSY_TIMEOUT_MS)),
+        'mmap_size': int(environ.get('SQLITE_MMAP_SIZE', DEFAULT_SQLITE_MMAP_SIZE)),
+        'cache_size': -int(environ.get('SQLITE_CACHE_SIZE_KB', DEFAULT_SQLITE_CACHE_SIZE_KB))  # Negative = KiB
+    }
+
+class SQLiteWriteQueue:
+    """Single-writer queue for one SQLite engine within a process.
+
+    SQLite allows one writing transaction at a time. Left to itself, a
+    second writer spins in the busy handler or, when it already holds a
+    read snapshot, fails straight away with "database is locked". Here a
+    connection takes the queue's lock at its first write statement and
+    gives it up at commit or rollback, so writers in this process (threads
+    or green threads) wait their turn on a cheap lock instead. Writers in
+    other processes are left to busy_timeout.
+    """
+    HOLDER = 'sqlite_write_queue'  # connection.info flag while a connection holds the lock
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.transactions = 0  # Write transactions admitted
+        self.timeouts = 0      # Writers that gave up waiting and went ahead anyway
+
+    def install(self, engine) -> 'SQLiteWriteQueue':
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'commit', self._release)
+        event.listen(engine, 'rollback', self._release)
+        # Connections returned to the pool without an explicit end
+        event.listen(engine, 'reset', self._release_reset)
+        event.listen(engine, 'checkin', self._release_record)
+        return self
+
+    def _acquire(self, info: dict) -> None:
+        if info.get(self.HOLDER):
+            return
+        if self._lock.acquire(timeout=self.timeout):
+            info[self.HOLDER] = True
+            self.transactions += 1
+        else:
+            # Let SQLite's own busy handling decide rather than deadlock
+            self.timeouts += 1
+            logger.warning(f"Waited {self.timeout}s for the SQLite write queue; writing without it")
+
+    def _release_info(self, info: dict) -> None:
+        if info.pop(self.HOLDER, False):
+            self._lock.release()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if _WRITE_STATEMENT.match(statement):
+            self._acquire(conn.info)
+
+    def _release(self, conn):
+        self._release_info(conn.info)
+
+    def _release_record(self, dbapi_connection, connection_record):
+        if connection_record is not None:
+            self._release_info(connection_record.info)
+
+    def _release_reset(self, dbapi_connection, connection_record, reset_state):
+        self._release_record(dbapi_connection, connection_record)
+
+def configure_engine(engine, environ=os.environ) -> Optional[SQLiteWriteQueue]:
+    """Connection-level setup engine_options can't express.
+
+    For SQLite files: sets sqlite_pragmas() on each new connection and,
+    unless SQLITE_WRITE_QUEUE=false, installs a SQLiteWriteQueue (returned).
+    Call before the engine's first connection.
+    """
+    url = engine.url
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    pragmas = sqlite_pragmas(environ)
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    if environ.get('SQLITE_WRITE_QUEUE', 'true').lower() == 'false':
+        return None
+    return SQLiteWriteQueue(pragmas['busy_timeout'] / 1000).install(engine)
+
+def make_psycopg2_green() -> bool:
+    """Make psycopg2 yield to the eventlet hub instead of blocking the worker.
+
+    psycopg2 talks to the server in C, out of reach of monkey patching;
+    without a wait callback one slow query stalls every green thread in the
+    process. Call after eventlet.monkey_patch(). Returns False when psycopg2
+    isn't installed.
+    """
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    from eventlet.hubs import trampoline
+
+    def wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                trampoline(conn.fileno(), read=True)
+            elif state == extensions.POLL_WRITE:
+                trampoline(conn.fileno(), write=True)
+            else:
+                raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+    extensions.set_wait_callback(wait_callback)
+    return True
+
+# Tables added by a migration after the initial one. Add new ones here
+MIGRATION_TABLES = ('user_fact_stats', 'attempt_window', 'job_lease')
+
+def create_tables() -> None:
+    """db.create_all() for a blank database; on an existing one, leave migrations' tables to them.
+
+    create_all only creates missing tables and never alters existing ones.
+    On an older database it would create MIGRATION_TABLES at their newest
+    shape next to tables still missing columns, and `flask db upgrade`
+    (which runs create_app first) would then stop on "table already exists".
+    """
+    if not inspect(db.engine).get_table_names():
+        db.create_all()
+        return
+    db.metadata.create_all(db.engine, tables=[
+        table for name, table in db.metadata.tables.items() if name not in MIGRATION_TABLES
+    ])
+
+# Replica lag in seconds, for dialects that can report it. Postgres reports 0
+# when the replica has replayed everything it received, else the age of the
+# last replayed transaction.
+REPLICA_LAG_QUERIES = {
+    'postgresql': """
+        SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+               END
+    """
+}
+
+class ReadReplica:
+    """The read-only replica engine and whether it is fresh enough to read.
+
+    Configure with REPLICA_DATABASE_URI. It is deliberately not a
+    Flask-SQLAlchemy bind: no model lives only there, and create_all must
+    never touch it. The replica counts as usable while its lag is at most
+    REPLICA_MAX_LAG seconds, checked at most every REPLICA_LAG_CHECK_INTERVAL
+    seconds; when it is behind or unreachable, replica reads fall back to
+    the primary. lag_probe(engine)
+    overrides the dialect's lag query (None = lag unknown, assumed fresh).
+    """
+
+    def __init__(self, app=None, lag_probe: Optional[Callable] = None):
+        self.engine = None
+        self.lag_probe = lag_probe
+        self._lock = threading.Lock()
+        self._checked_at = float('-inf')
+        self._usable = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', 5.0)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', 1.0)
+        app.extensions['read_replica'] = self
+        app.teardown_request(end_replica_reads)
+        url = app.config.get('REPLICA_DATABASE_URI')
+        if url:
+            self.engine = create_engine(url, **engine_options(url))
+            configure_engine(self.engine)
+
+    def lag(self) -> Optional[float]:
+        engine = self.engine
+        if engine is None:
+            return None
+        if self.lag_probe is not None:
+            return self.lag_probe(engine)
+        query = REPLICA_LAG_QUERIES.get(engine.dialect.name)
+        if query is None:
+            return None
+        with engine.connect() as connection:
+            return float(connection.execute(text(query)).scalar() or 0)
+
+    def usable_engine(self):
+        """The replica engine if reads may use it now, else None."""
+        engine = self.engine
+        if engine is None:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    try:
+                        lag = self.lag()
+                        usable = lag is None or lag <= self.max_lag
+                        if not usable:
+                            logger.warning(f"Read replica is {lag:.1f}s behind; reading from the primary")
+                    except Exception:
+                        logger.exception("Read replica lag check failed; reading from the primary")
+                        usable = False
+                    self._usable, self._checked_at = usable, now
+        return engine if self._usable else None
+
+@contextmanager
+def replica_reads():
+    """Let reads in this block use the read replica (see RoutingSession)."""
+    session = db.session()
+    previous = session.info.get(_REPLICA_READS, False)
+    session.info[_REPLICA_READS] = True
+    try:
+        yield
+    finally:
+        session.info[_REPLICA_READS] = previous
+
+def read_from_replica(f):
+    """Decorator form of replica_reads() for views and read-only services."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return f(*args, **kwargs)
+    return wrapper
+
+def forget_writes() -> None:
+    """Let replica reads resume after writes this request won't read back
+    (e.g. a presence heartbeat); normally a write pins the session to the primary."""
+    db.session().info.pop(_PRIMARY_ONLY, None)
+
+def end_replica_reads(exc=None) -> None:
+    """Reset routing at the end of a request; the next one starts on a clean slate."""
+    session = db.session()
+    session.info.pop(_REPLICA_READS, None)
+    session.info.pop(_PRIMARY_ONLY, None)
@@ -3,8 +3,11 @@ from app import app, db
 from models.user import User
 from models.class_ import Class
 from models.practice_attempt import PracticeAttempt
+from models.user_fact_stat import UserFactStat
 from models.assignment import Assignment, AssignmentProgress, AttemptHistory
 import os
+import tempfile
+import click
 from sqlalchemy import inspect
 
 cli = FlaskGroup(app)
@@ -73,6 +76,38 @@ def safe_setup_db():
     create_admin()
     print("Setup complete!")
 
+@cli.command("rebuild_fact_stats")
+def rebuild_fact_stats():
+    """Recompute the user_fact_stats rollup from practice_attempt, a batch of users at a time"""
+    rows = UserFactStat.rebuild_in_batches(db.session)
+    print(f"Rebuilt user_fact_stats: {rows} rows")
+
+@cli.command("run_job")
+@click.argument('name', type=click.Choice(sorted(app.extensions['scheduler'].jobs)))
+@click.option('--force', is_flag=True, help="Run even if a worker holds the job's lease")
+def run_job(name, force):
+    """Run one scheduled maintenance job now"""
+    with app.app_context():
+        result = app.extensions['scheduler'].run(name, force=force)
+    if result is None:
+        print(f"{name}: skipped, another worker holds its lease (use --force)")
+    else:
+        print(f"{name}: {result.rows} rows in {result.seconds:.2f}s")
+
+@cli.command("benchmark_writers")
+@click.option('--writers', default=16, help='Concurrent simulated students')
+@click.option('--answers', default=50, help='Answers each one submits')
+def benchmark_writers(writers, answers):
+    """Compare concurrent answer writes on a scratch SQLite file with and without the production profile"""
+    from utils.write_benchmark import run_write_benchmark
+    with tempfile.TemporaryDirectory() as scratch:
+        for profile in (False, True):
+            url = f"sqlite:///{os.path.join(scratch, f'bench_{int(profile)}.db')}"
+            result = run_write_benchmark(url, writers, answers, profile=profile)
+            print(f"{'profile' if profile else 'default'}: {result['committed']} committed, "
+                  f"{result['failed']} failed in {result['seconds']:.2f}s "
+                  f"({result['answers_per_second']:.0f} answers/s)")
+
 @cli.command("full_init_db")
 def full_init_db():
     """Fully initialize the database by dropping all tables and recreating them"""
@@ -0,0 +1,53 @@
+"""add user_fact_stats rollup
+
+Revision ID: 3f2c9b7d1e4a
+Revises: a14432bd1bce
+Create Date: 2026-10-18 09:12:41.508113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2c9b7d1e4a'
+down_revision = 'a14432bd1bce'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_fact_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=20), nullable=False),
+    sa.Column('level', sa.Integer(), nullable=False),
+    sa.Column('problem', sa.String(length=50), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('correct', sa.Integer(), nullable=False),
+    sa.Column('time_sum', sa.Float(), nullable=False),
+    sa.Column('min_time', sa.Float(), nullable=True),
+    sa.Column('max_time', sa.Float(), nullable=True),
+    sa.Column('last_seen', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'operation', 'level', 'problem')
+    )
+
+    # Backfill from existing attempts
+    op.execute("""
+        INSERT INTO user_fact_stats
+            (user_id, operation, level, problem, attempts, correct,
+             time_sum, min_time, max_time, last_seen)
+        SELECT user_id, operation, level, problem,
+               COUNT(*),
+               SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+               COALESCE(SUM(time_taken), 0),
+               MIN(CASE WHEN time_taken > 0 THEN time_taken END),
+               MAX(CASE WHEN time_taken > 0 THEN time_taken END),
+               MAX(created_at)
+        FROM practice_attempt
+        GROUP BY user_id, operation, level, problem
+    """)
+
+
+def downgrade():
+    op.drop_table('user_fact_stats')
@@ -0,0 +1,36 @@
+"""add attempt_window ring buffer
+
+Revision ID: 8d41e6a0c2b7
+Revises: 3f2c9b7d1e4a
+Create Date: 2026-10-18 11:03:27.915604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6a0c2b7'
+down_revision = '3f2c9b7d1e4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are seeded lazily from practice_attempt on each key's next attempt
+    op.create_table('attempt_window',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=20), nullable=False),
+    sa.Column('level', sa.Integer(), nullable=False),
+    sa.Column('outcomes', sa.Integer(), nullable=False),
+    sa.Column('times', sa.LargeBinary(), nullable=False),
+    sa.Column('head', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'operation', 'level')
+    )
+
+
+def downgrade():
+    op.drop_table('attempt_window')
@@ -0,0 +1,29 @@
+"""add job_lease for the maintenance scheduler
+
+Revision ID: b7d3e91c5a20
+Revises: f4a1c9d27b3e
+Create Date: 2026-10-18 21:12:44.530918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e91c5a20'
+down_revision = 'f4a1c9d27b3e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_lease',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('job_lease')
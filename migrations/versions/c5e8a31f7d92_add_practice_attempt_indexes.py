@@ -0,0 +1,38 @@
+"""add practice_attempt and active_session indexes
+
+Revision ID: c5e8a31f7d92
+Revises: 8d41e6a0c2b7
+Create Date: 2026-10-18 14:26:05.318447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e8a31f7d92'
+down_revision = '8d41e6a0c2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_practice_attempt_user_op_level_created', 'practice_attempt',
+                    ['user_id', 'operation', 'level', 'created_at'], unique=False)
+    op.create_index('ix_practice_attempt_user_created', 'practice_attempt',
+                    ['user_id', 'created_at'], unique=False)
+    # Partial: only incorrect attempts, matching analyze_missed_problems' filter
+    op.create_index('ix_practice_attempt_user_missed', 'practice_attempt',
+                    ['user_id', 'operation', 'problem'], unique=False,
+                    sqlite_where=sa.text('is_correct IS 0'),
+                    postgresql_where=sa.text('is_correct IS false'))
+    op.create_index('ix_active_session_user_id', 'active_session', ['user_id'], unique=False)
+    op.create_index('ix_active_session_last_active', 'active_session', ['last_active'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_active_session_last_active', table_name='active_session')
+    op.drop_index('ix_active_session_user_id', table_name='active_session')
+    op.drop_index('ix_practice_attempt_user_missed', table_name='practice_attempt')
+    op.drop_index('ix_practice_attempt_user_created', table_name='practice_attempt')
+    op.drop_index('ix_practice_attempt_user_op_level_created', table_name='practice_attempt')
@@ -0,0 +1,124 @@
+"""drop duplicate commutative attempts and key fact stats canonically
+
+Revision ID: e2b7f0c4a913
+Revises: c5e8a31f7d92
+Create Date: 2026-10-18 16:02:44.730115
+
+"""
+from datetime import timedelta
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7f0c4a913'
+down_revision = 'c5e8a31f7d92'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+SAME_COMMIT = timedelta(seconds=1)  # Both rows were added in one commit
+
+logger = logging.getLogger('alembic.env')
+
+
+def swapped(problem):
+    """Operands of "a × b", or None if it isn't a multiplication problem."""
+    try:
+        num1, num2 = (int(n) for n in problem.split('×'))
+    except ValueError:
+        return None
+    return num1, num2
+
+
+def canonical(operation, problem):
+    operands = swapped(problem) if operation == 'multiplication' else None
+    if operands is None:
+        return problem
+    return f"{min(operands)} × {max(operands)}"
+
+
+def ignoring_none(pick, a, b):
+    return b if a is None else a if b is None else pick(a, b)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # check_answer and the quiz handler used to add a second row for "b × a"
+    # straight after the real one, copying it: same user, answer and time, next
+    # id, level max(a, b), in the same commit. A student who really answers
+    # "3 × 4" then "4 × 3" differs in time taken or when it was saved.
+    candidates = bind.execute(sa.text("""
+        SELECT dup.id, dup.problem, dup.level, dup.created_at, orig.problem, orig.created_at
+        FROM practice_attempt dup
+        JOIN practice_attempt orig ON orig.id = dup.id - 1
+        WHERE dup.operation = 'multiplication' AND orig.operation = 'multiplication'
+          AND dup.user_id = orig.user_id
+          AND dup.user_answer = orig.user_answer
+          AND dup.is_correct = orig.is_correct
+          AND (dup.time_taken = orig.time_taken OR (dup.time_taken IS NULL AND orig.time_taken IS NULL))
+          AND dup.problem <> orig.problem
+    """).columns(
+        sa.column('id'), sa.column('problem'), sa.column('level'), sa.column('created_at', sa.DateTime),
+        sa.column('orig_problem'), sa.column('orig_created_at', sa.DateTime)
+    )).all()
+    duplicates = []
+    for dup_id, dup_problem, dup_level, dup_created, orig_problem, orig_created in candidates:
+        dup_operands, orig_operands = swapped(dup_problem), swapped(orig_problem)
+        if (dup_operands and orig_operands and dup_operands == orig_operands[::-1]
+                and dup_level == max(orig_operands)
+                and dup_created is not None and orig_created is not None
+                and abs(dup_created - orig_created) <= SAME_COMMIT):
+            duplicates.append(dup_id)
+    logger.info(f"Dropping {len(duplicates)} duplicate commutative attempts")
+    for start in range(0, len(duplicates), BATCH_SIZE):
+        bind.execute(sa.text("DELETE FROM practice_attempt WHERE id IN :ids").bindparams(
+            sa.bindparam('ids', expanding=True)
+        ), {'ids': duplicates[start:start + BATCH_SIZE]})
+
+    # Rebuild the rollup with both orders of a fact under one key
+    grouped = bind.execute(sa.text("""
+        SELECT user_id, operation, level, problem,
+               COUNT(*),
+               SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+               COALESCE(SUM(time_taken), 0),
+               MIN(CASE WHEN time_taken > 0 THEN time_taken END),
+               MAX(CASE WHEN time_taken > 0 THEN time_taken END),
+               MAX(created_at)
+        FROM practice_attempt
+        GROUP BY user_id, operation, level, problem
+    """)).all()
+    rows = {}
+    for user_id, operation, level, problem, attempts, correct, time_sum, min_time, max_time, last_seen in grouped:
+        key = (user_id, operation, level, canonical(operation, problem))
+        row = rows.get(key)
+        if row is None:
+            rows[key] = {'user_id': user_id, 'operation': operation, 'level': level, 'problem': key[3],
+                         'attempts': attempts, 'correct': correct, 'time_sum': time_sum,
+                         'min_time': min_time, 'max_time': max_time, 'last_seen': last_seen}
+            continue
+        row['attempts'] += attempts
+        row['correct'] += correct
+        row['time_sum'] += time_sum
+        row['min_time'] = ignoring_none(min, row['min_time'], min_time)
+        row['max_time'] = ignoring_none(max, row['max_time'], max_time)
+        row['last_seen'] = max(row['last_seen'], last_seen)
+
+    user_fact_stats = sa.table('user_fact_stats', *(sa.column(name) for name in (
+        'user_id', 'operation', 'level', 'problem', 'attempts', 'correct',
+        'time_sum', 'min_time', 'max_time', 'last_seen'
+    )))
+    op.execute(user_fact_stats.delete())
+    if rows:
+        op.bulk_insert(user_fact_stats, list(rows.values()))
+
+    # Windows counted the duplicates too; they reseed from history on next use
+    op.execute("DELETE FROM attempt_window")
+
+
+def downgrade():
+    # The dropped rows were copies; nothing to restore. The rollup keys stay
+    # canonical, which older code reads as ordinary problem strings.
+    pass
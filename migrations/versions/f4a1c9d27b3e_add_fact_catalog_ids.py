@@ -0,0 +1,227 @@
+"""add fact catalog ids and operand columns
+
+Revision ID: f4a1c9d27b3e
+Revises: e2b7f0c4a913
+Create Date: 2026-10-18 18:40:12.902551
+
+"""
+from datetime import timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a1c9d27b3e'
+down_revision = 'e2b7f0c4a913'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+HISTORY_MATCH_WINDOW = timedelta(seconds=2)  # attempt_history and practice_attempt rows of one answer
+
+# As in utils.fact_catalog at the time of this migration
+OPERAND_BITS = 10
+OPERATION_CODES = {'addition': 1, 'subtraction': 2, 'multiplication': 3, 'division': 4}
+SYMBOLS = {'addition': '+', 'subtraction': '-', 'multiplication': '×', 'division': '÷'}
+COMMUTATIVE_OPERATIONS = {'multiplication'}
+
+TABLES = ('practice_attempt', 'quiz_question', 'attempt_history')
+
+
+def fact_id(operation, num1, num2):
+    code = OPERATION_CODES.get(operation)
+    limit = 1 << OPERAND_BITS
+    if code is None or not (0 <= num1 < limit and 0 <= num2 < limit):
+        return None
+    if operation in COMMUTATIVE_OPERATIONS and num1 > num2:
+        num1, num2 = num2, num1
+    return code << 2 * OPERAND_BITS | num1 << OPERAND_BITS | num2
+
+
+def fact_problem(fact):
+    mask = (1 << OPERAND_BITS) - 1
+    operation = {code: name for name, code in OPERATION_CODES.items()}[fact >> 2 * OPERAND_BITS]
+    return f"{fact >> OPERAND_BITS & mask} {SYMBOLS[operation]} {fact & mask}"
+
+
+def parse_problem(operation, problem):
+    symbol = SYMBOLS.get(operation)
+    if symbol is None or not problem:
+        return None
+    parts = problem.split(symbol)
+    if len(parts) != 2:
+        return None
+    try:
+        return int(parts[0].strip()), int(parts[1].strip())
+    except ValueError:
+        return None
+
+
+def id_batches(bind, table):
+    """Consecutive (low, high) id ranges covering a table, BATCH_SIZE ids each."""
+    low, high = bind.execute(sa.text(f"SELECT MIN(id), MAX(id) FROM {table}")).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        yield start, start + BATCH_SIZE - 1
+
+
+def set_operands(bind, table, values):
+    if values:
+        bind.execute(sa.text(
+            f"UPDATE {table} SET num1 = :num1, num2 = :num2, fact_id = :fact_id WHERE id = :id"
+        ), values)
+
+
+def backfill_practice_attempts(bind):
+    for low, high in id_batches(bind, 'practice_attempt'):
+        rows = bind.execute(sa.text(
+            "SELECT id, operation, problem FROM practice_attempt "
+            "WHERE id BETWEEN :low AND :high AND fact_id IS NULL"
+        ), {'low': low, 'high': high}).all()
+        values = []
+        for row_id, operation, problem in rows:
+            operands = parse_problem(operation, problem)
+            if operands is not None:
+                values.append({'id': row_id, 'num1': operands[0], 'num2': operands[1],
+                               'fact_id': fact_id(operation, *operands)})
+        set_operands(bind, 'practice_attempt', values)
+
+
+def backfill_quiz_questions(bind):
+    for low, high in id_batches(bind, 'quiz_question'):
+        rows = bind.execute(sa.text(
+            "SELECT quiz_question.id, quiz.operation, quiz_question.problem "
+            "FROM quiz_question JOIN quiz ON quiz.id = quiz_question.quiz_id "
+            "WHERE quiz_question.id BETWEEN :low AND :high AND quiz_question.fact_id IS NULL"
+        ), {'low': low, 'high': high}).all()
+        values = []
+        for row_id, operation, problem in rows:
+            operands = parse_problem(operation, problem)
+            if operands is not None:
+                values.append({'id': row_id, 'num1': operands[0], 'num2': operands[1],
+                               'fact_id': fact_id(operation, *operands)})
+        set_operands(bind, 'quiz_question', values)
+
+
+def backfill_attempt_history(bind):
+    """attempt_history never stored the problem; take it from the practice_attempt
+    check_answer wrote for the same answer (same student and answer, moments apart)."""
+    history = sa.table('attempt_history', sa.column('id', sa.Integer), sa.column('progress_id', sa.Integer),
+                       sa.column('student_answer', sa.String), sa.column('created_at', sa.DateTime),
+                       sa.column('fact_id', sa.Integer))
+    progress = sa.table('assignment_progress', sa.column('id', sa.Integer), sa.column('student_id', sa.Integer))
+    attempt = sa.table('practice_attempt', sa.column('user_id', sa.Integer), sa.column('user_answer', sa.Integer),
+                       sa.column('created_at', sa.DateTime), sa.column('num1', sa.Integer),
+                       sa.column('num2', sa.Integer), sa.column('fact_id', sa.Integer))
+    for low, high in id_batches(bind, 'attempt_history'):
+        rows = bind.execute(sa.select(
+            history.c.id, progress.c.student_id, history.c.student_answer, history.c.created_at
+        ).select_from(history.join(progress, progress.c.id == history.c.progress_id)).where(
+            history.c.id.between(low, high), history.c.fact_id.is_(None), history.c.created_at.is_not(None)
+        )).all()
+        if not rows:
+            continue
+        candidates = {}
+        for attempt_row in bind.execute(sa.select(
+            attempt.c.user_id, attempt.c.user_answer, attempt.c.created_at,
+            attempt.c.num1, attempt.c.num2, attempt.c.fact_id
+        ).where(
+            attempt.c.user_id.in_({row.student_id for row in rows}),
+            attempt.c.fact_id.is_not(None),
+            attempt.c.created_at.between(min(row.created_at for row in rows) - HISTORY_MATCH_WINDOW,
+                                         max(row.created_at for row in rows) + HISTORY_MATCH_WINDOW)
+        )):
+            candidates.setdefault((attempt_row.user_id, str(attempt_row.user_answer)), []).append(attempt_row)
+
+        values = []
+        for row in rows:
+            matches = [c for c in candidates.get((row.student_id, row.student_answer), ())
+                       if abs(c.created_at - row.created_at) <= HISTORY_MATCH_WINDOW]
+            if matches:
+                match = min(matches, key=lambda c: abs(c.created_at - row.created_at))
+                values.append({'id': row.id, 'num1': match.num1, 'num2': match.num2, 'fact_id': match.fact_id})
+        set_operands(bind, 'attempt_history', values)
+
+
+def create_user_fact_stats(key_column):
+    op.create_table('user_fact_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=20), nullable=False),
+    sa.Column('level', sa.Integer(), nullable=False),
+    key_column,
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('correct', sa.Integer(), nullable=False),
+    sa.Column('time_sum', sa.Float(), nullable=False),
+    sa.Column('min_time', sa.Float(), nullable=True),
+    sa.Column('max_time', sa.Float(), nullable=True),
+    sa.Column('last_seen', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'operation', 'level', key_column.name)
+    )
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('num1', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('num2', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('fact_id', sa.Integer(), nullable=True))
+
+    bind = op.get_bind()
+    backfill_practice_attempts(bind)
+    backfill_quiz_questions(bind)
+    backfill_attempt_history(bind)
+
+    op.drop_index('ix_practice_attempt_user_missed', table_name='practice_attempt')
+    op.create_index('ix_practice_attempt_user_missed', 'practice_attempt',
+                    ['user_id', 'fact_id'], unique=False,
+                    sqlite_where=sa.text('is_correct IS 0'),
+                    postgresql_where=sa.text('is_correct IS false'))
+
+    # Rekey the rollup by fact id; ids are already canonical, so one GROUP BY does it
+    op.drop_table('user_fact_stats')
+    create_user_fact_stats(sa.Column('fact_id', sa.Integer(), nullable=False))
+    op.execute("""
+        INSERT INTO user_fact_stats
+            (user_id, operation, level, fact_id, attempts, correct,
+             time_sum, min_time, max_time, last_seen)
+        SELECT user_id, operation, level, fact_id,
+               COUNT(*),
+               SUM(CASE WHEN is_correct THEN 1 ELSE 0 END),
+               COALESCE(SUM(time_taken), 0),
+               MIN(CASE WHEN time_taken > 0 THEN time_taken END),
+               MAX(CASE WHEN time_taken > 0 THEN time_taken END),
+               MAX(created_at)
+        FROM practice_attempt
+        WHERE fact_id IS NOT NULL
+        GROUP BY user_id, operation, level, fact_id
+    """)
+
+
+def downgrade():
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("SELECT * FROM user_fact_stats")).mappings().all()
+    op.drop_table('user_fact_stats')
+    create_user_fact_stats(sa.Column('problem', sa.String(length=50), nullable=False))
+    if rows:
+        user_fact_stats = sa.table('user_fact_stats', *(sa.column(name) for name in (
+            'user_id', 'operation', 'level', 'problem', 'attempts', 'correct',
+            'time_sum', 'min_time', 'max_time', 'last_seen'
+        )))
+        op.bulk_insert(user_fact_stats, [
+            {**{k: v for k, v in row.items() if k != 'fact_id'}, 'problem': fact_problem(row['fact_id'])}
+            for row in rows
+        ])
+
+    op.drop_index('ix_practice_attempt_user_missed', table_name='practice_attempt')
+    op.create_index('ix_practice_attempt_user_missed', 'practice_attempt',
+                    ['user_id', 'operation', 'problem'], unique=False,
+                    sqlite_where=sa.text('is_correct IS 0'),
+                    postgresql_where=sa.text('is_correct IS false'))
+
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('fact_id')
+            batch_op.drop_column('num2')
+            batch_op.drop_column('num1')
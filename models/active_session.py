@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from app import db
+from sqlalchemy import delete
 
 class ActiveSession(db.Model):
     __tablename__ = 'active_session'
@@ -9,10 +10,10 @@ class ActiveSession(db.Model):
 
     # Columns
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     activity_type = db.Column(db.String(50))  # 'practice', 'assignment', etc.
     details = db.Column(db.String(255))  # Current problem, level, etc.
-    last_active = db.Column(db.DateTime, default=datetime.utcnow)
+    last_active = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Define relationship to User
     user = db.relationship('User', backref=db.backref('active_session', uselist=False))
@@ -22,10 +23,10 @@ class ActiveSession(db.Model):
         return f'<ActiveSession {self.user.username}: {self.activity_type}>'
 
     @classmethod
-    def cleanup_inactive(cls, db_session):
-        """Remove sessions that have been inactive for too long."""
+    def cleanup_inactive(cls, db_session) -> int:
+        """Remove sessions that have been inactive for too long. Returns rows deleted."""
         cutoff = datetime.utcnow() - timedelta(minutes=cls.INACTIVE_THRESHOLD)
-        inactive = cls.query.filter(cls.last_active < cutoff).all()
-        for session in inactive:
-            db_session.delete(session)
-        db_session.commit()
\ No newline at end of file
+        # One DELETE on the last_active index; nothing is loaded into the session
+        result = db_session.execute(delete(cls).where(cls.last_active < cutoff))
+        db_session.commit()
+        return result.rowcount
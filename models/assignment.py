@@ -177,6 +177,9 @@ class AttemptHistory(db.Model):
                             db.ForeignKey('assignment_progress.id', name='fk_attempt_history_progress_id'),
                             nullable=False)
     problem_number = db.Column(db.Integer, nullable=False)
+    num1 = db.Column(db.Integer)
+    num2 = db.Column(db.Integer)
+    fact_id = db.Column(db.Integer)  # utils.fact_catalog id of the problem answered
     student_answer = db.Column(db.String(50), nullable=False)
     correct_answer = db.Column(db.String(50), nullable=False)
     is_correct = db.Column(db.Boolean, nullable=False)
@@ -0,0 +1,255 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from database import db
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+from sqlalchemy.orm import Mapped, mapped_column, Session, object_session
+from sqlalchemy import ForeignKey, LargeBinary, event, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from models.practice_attempt import PracticeAttempt
+
+WINDOW_SIZE = 10         # Outcomes kept per (user, operation, level)
+CACHE_SIZE = 10000       # Windows mirrored per process
+# Seconds a mirrored window is trusted before it is re-read. Another worker
+# that saves an answer for the same student only updates the row, so this is
+# how stale a level decision here can be. Writes always lock and read the row,
+# so the stored window is never stale. A second covers the burst of requests
+# around one answer without missing the answer before it.
+CACHE_TTL = 1
+
+class RecentWindow:
+    """Ring buffer of a student's last WINDOW_SIZE outcomes at one level.
+
+    Outcomes are a bitmask (bit i set = slot i was correct) and times a
+    parallel array of seconds (0 = untimed). Level decisions only need
+    popcounts and sums over these, never the attempts table.
+    """
+    __slots__ = ('outcomes', 'times', 'head', 'count')
+
+    def __init__(self, outcomes: int = 0, times: Optional[array] = None, head: int = 0, count: int = 0):
+        self.outcomes = outcomes
+        self.times = times if times is not None else array('f', bytes(4 * WINDOW_SIZE))
+        self.head = head
+        self.count = count
+
+    def push(self, is_correct: bool, time_taken: Optional[float]) -> None:
+        bit = 1 << self.head
+        if is_correct:
+            self.outcomes |= bit
+        else:
+            self.outcomes &= ~bit
+        self.times[self.head] = time_taken or 0.0
+        self.head = (self.head + 1) % WINDOW_SIZE
+        self.count = min(self.count + 1, WINDOW_SIZE)
+
+    def copy(self) -> 'RecentWindow':
+        return RecentWindow(self.outcomes, array('f', self.times), self.head, self.count)
+
+    @property
+    def correct_count(self) -> int:
+        return bin(self.outcomes).count('1')
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct_count / self.count if self.count else 0
+
+    @property
+    def avg_correct_time(self) -> float:
+        """Average time of timed, correct outcomes (inf if there are none)."""
+        total, n = 0.0, 0
+        outcomes, times = self.outcomes, self.times
+        for i in range(WINDOW_SIZE):
+            if outcomes >> i & 1 and times[i] > 0:
+                total += times[i]
+                n += 1
+        return total / n if n else float('inf')
+
+class AttemptWindow(db.Model):
+    """Persisted RecentWindow, one row per (user, operation, level)."""
+    __tablename__ = 'attempt_window'
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    operation: Mapped[str] = mapped_column(db.String(20), primary_key=True)
+    level: Mapped[int] = mapped_column(primary_key=True)
+    outcomes: Mapped[int] = mapped_column(nullable=False, default=0)
+    times: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    head: Mapped[int] = mapped_column(nullable=False, default=0)
+    count: Mapped[int] = mapped_column(nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AttemptWindow {self.operation} {self.level} for User {self.user_id}>'
+
+def _row_to_window(row) -> RecentWindow:
+    return RecentWindow(row.outcomes, array('f', row.times), row.head, row.count)
+
+# Per-process mirror: key -> (expires_at, RecentWindow)
+_cache: 'OrderedDict[Tuple[int, str, int], Tuple[float, RecentWindow]]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(key) -> Optional[RecentWindow]:
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+def _cache_put(key, window: RecentWindow) -> None:
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + CACHE_TTL, window)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def _cache_discard(key) -> None:
+    with _cache_lock:
+        _cache.pop(key, None)
+
+def clear_window_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+def get_recent_window(db_session, user_id: int, operation: str, level: int) -> RecentWindow:
+    """Get a student's recent outcomes at a level, from the process mirror when possible."""
+    key = (user_id, operation, level)
+    window = _cache_get(key)
+    if window is not None:
+        return window
+    row = db_session.get(AttemptWindow, key)
+    window = _row_to_window(row) if row is not None else RecentWindow()
+    _cache_put(key, window)
+    return window
+
+def _seed_window(connection, user_id: int, operation: str, level: int,
+                 up_to_id: Optional[int] = None) -> RecentWindow:
+    """Build a window from attempt history, optionally up to and including an id.
+
+    Used once per key, before it has a row. Later rows from the same flush
+    are already in the table, hence the id bound; they get pushed by their
+    own after_insert events.
+    """
+    query = select(PracticeAttempt.is_correct, PracticeAttempt.time_taken).where(
+        PracticeAttempt.user_id == user_id,
+        PracticeAttempt.operation == operation,
+        PracticeAttempt.level == level
+    )
+    if up_to_id is not None:
+        query = query.where(PracticeAttempt.id <= up_to_id)
+    rows = connection.execute(query.order_by(
+        PracticeAttempt.created_at.desc(), PracticeAttempt.id.desc()
+    ).limit(WINDOW_SIZE)).all()
+    window = RecentWindow()
+    for row in reversed(rows):
+        window.push(row.is_correct, row.time_taken)
+    return window
+
+def _key_filter(table, key):
+    user_id, operation, level = key
+    return (table.c.user_id == user_id) & (table.c.operation == operation) & (table.c.level == level)
+
+def _window_values(window: RecentWindow) -> Dict:
+    return {
+        'outcomes': window.outcomes,
+        'times': window.times.tobytes(),
+        'head': window.head,
+        'count': window.count,
+        'updated_at': datetime.utcnow()
+    }
+
+def _store_window(connection, key, window: RecentWindow) -> None:
+    table = AttemptWindow.__table__
+    connection.execute(table.update().where(_key_filter(table, key)).values(**_window_values(window)))
+
+def _select_locked(connection, key):
+    table = AttemptWindow.__table__
+    return connection.execute(select(table).where(_key_filter(table, key)).with_for_update()).first()
+
+def _locked_row(connection, key) -> Tuple[object, bool]:
+    """Lock a key's row, creating an empty one first if needed. Returns (row, created).
+
+    FOR UPDATE can't lock a row that isn't there yet, so two first attempts
+    at a key could both insert. INSERT ... ON CONFLICT DO NOTHING lets one
+    of them create it (the other waits for that transaction, then finds the
+    row); the creator seeds the window from history.
+    """
+    row = _select_locked(connection, key)
+    if row is not None:
+        return row, False
+    table = AttemptWindow.__table__
+    user_id, operation, level = key
+    values = dict(_window_values(RecentWindow()), user_id=user_id, operation=operation, level=level)
+    dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(connection.dialect.name)
+    if dialect_insert is not None:
+        created = connection.execute(dialect_insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=[table.c.user_id, table.c.operation, table.c.level]
+        )).rowcount == 1
+    else:
+        connection.execute(insert(table).values(**values))
+        created = True
+    return _select_locked(connection, key), created
+
+@event.listens_for(PracticeAttempt, 'after_insert')
+def _record_outcome(mapper, connection, target):
+    """Push each new attempt into its window in the same transaction."""
+    key = (target.user_id, target.operation, target.level)
+    row, created = _locked_row(connection, key)
+    if created:
+        # The seed query already sees this attempt, so nothing to push
+        window = _seed_window(connection, *key, up_to_id=target.id)
+    else:
+        window = _row_to_window(row)
+        window.push(target.is_correct, target.time_taken)
+    _store_window(connection, key, window)
+
+    # Readers in this process must not see the old window; install the new
+    # one only once the transaction commits
+    _cache_discard(key)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('pending_windows', {})[key] = window
+
+def record_outcomes(connection, attempts: Iterable[Mapping]) -> Dict[Tuple[int, str, int], RecentWindow]:
+    """Push a batch of attempts, already inserted in order, into their windows.
+
+    The bulk-insert counterpart of the after_insert hook (Core inserts don't
+    fire it). Returns the new windows; pass them to install_windows once the
+    transaction commits.
+    """
+    batches: Dict[Tuple[int, str, int], list] = {}
+    for attempt in attempts:
+        key = (attempt['user_id'], attempt['operation'], attempt['level'])
+        batches.setdefault(key, []).append(attempt)
+
+    windows = {}
+    for key, batch in batches.items():
+        row, created = _locked_row(connection, key)
+        if created:
+            # The whole batch is in the table, so seeding covers it
+            window = _seed_window(connection, *key)
+        else:
+            window = _row_to_window(row)
+            for attempt in batch:
+                window.push(attempt['is_correct'], attempt['time_taken'])
+        _store_window(connection, key, window)
+        windows[key] = window
+    return windows
+
+def install_windows(windows: Mapping[Tuple[int, str, int], RecentWindow]) -> None:
+    """Mirror committed windows in this process."""
+    for key, window in windows.items():
+        _cache_put(key, window)
+
+@event.listens_for(Session, 'after_commit')
+def _install_pending_windows(session):
+    install_windows(session.info.pop('pending_windows', {}))
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending_windows(session):
+    for key in session.info.pop('pending_windows', {}):
+        _cache_discard(key)
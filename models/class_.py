@@ -1,6 +1,6 @@
 from app import db
 from datetime import datetime
-from sqlalchemy import select
+from sqlalchemy import event, select
 from models.user import User
 
 # Association tables for many-to-many relationships
@@ -18,6 +18,10 @@ student_class = db.Table('student_class',
 class Class(db.Model):
     __tablename__ = 'class'
     
+    # Bumped whenever this process changes who is in a class, so in-memory
+    # rosters (services.presence.ClassPresenceIndex) know to reload
+    roster_changes = 0
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -68,6 +72,7 @@ class Class(db.Model):
                 )
             )
             db.session.commit()
+            Class.roster_changes += 1
     
     def remove_teacher(self, teacher):
         """Remove a teacher from the class."""
@@ -79,6 +84,7 @@ class Class(db.Model):
                 )
             )
             db.session.commit()
+            Class.roster_changes += 1
     
     def add_student(self, student):
         """Add a student to the class."""
@@ -90,6 +96,7 @@ class Class(db.Model):
                 )
             )
             db.session.commit()
+            Class.roster_changes += 1
     
     def remove_student(self, student):
         """Remove a student from the class."""
@@ -101,6 +108,7 @@ class Class(db.Model):
                 )
             )
             db.session.commit()
+            Class.roster_changes += 1
     
     def get_primary_teacher(self):
         """Get the primary teacher for this class."""
@@ -113,3 +121,10 @@ class Class(db.Model):
     
     def __repr__(self):
         return f'<Class {self.name}>'
+
+@event.listens_for(Class.teachers, 'append')
+@event.listens_for(Class.teachers, 'remove')
+@event.listens_for(Class.students, 'append')
+@event.listens_for(Class.students, 'remove')
+def _roster_changed(target, value, initiator):
+    Class.roster_changes += 1
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from database import db
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import insert, or_, update
+
+class JobLease(db.Model):
+    """Which process may run a scheduled job, and until when.
+
+    Every worker runs a services.scheduler.Scheduler; a job only runs where
+    acquire() succeeds, so each one runs once per lease across all of them.
+    A lease that isn't renewed (its worker died) expires and is taken over.
+    """
+    __tablename__ = 'job_lease'
+
+    name: Mapped[str] = mapped_column(db.String(50), primary_key=True)
+    holder: Mapped[str] = mapped_column(db.String(100), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(nullable=False)
+
+    @classmethod
+    def acquire(cls, db_session, name: str, holder: str, seconds: float) -> bool:
+        """Take or renew the lease on `name` for `seconds`; False if another holder has it."""
+        table = cls.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=seconds)
+        result = db_session.execute(
+            update(table)
+            .where(table.c.name == name, or_(table.c.expires_at <= now, table.c.holder == holder))
+            .values(holder=holder, expires_at=expires_at)
+        )
+        if result.rowcount:
+            db_session.commit()
+            return True
+        try:
+            # First run ever; racing workers collide on the primary key
+            db_session.execute(insert(table).values(name=name, holder=holder, expires_at=expires_at))
+            db_session.commit()
+            return True
+        except IntegrityError:
+            db_session.rollback()
+            return False
+
+    def __repr__(self):
+        return f'<JobLease {self.name} held by {self.holder} until {self.expires_at}>'
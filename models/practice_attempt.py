@@ -1,11 +1,21 @@
 from datetime import datetime, timedelta
 from database import db
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, select
+from sqlalchemy import ForeignKey, Index, event, text
+from utils.fact_catalog import fact_id, parse_problem
 
 class PracticeAttempt(db.Model):
     __tablename__ = 'practice_attempt'
+    __table_args__ = (
+        # Level decisions, stats and heatmaps: one user's attempts at an operation/level, newest first
+        Index('ix_practice_attempt_user_op_level_created', 'user_id', 'operation', 'level', 'created_at'),
+        # Recent activity across operations (teacher dashboard, progress page)
+        Index('ix_practice_attempt_user_created', 'user_id', 'created_at'),
+        # Missed-problem reports only ever read incorrect attempts; fact ids sort by operation
+        Index('ix_practice_attempt_user_missed', 'user_id', 'fact_id',
+              sqlite_where=text('is_correct IS 0'), postgresql_where=text('is_correct IS false')),
+    )
 
     # Constants for mastery tracking
     MASTERY_THRESHOLD = 0.8  # 80% accuracy for mastery
@@ -16,7 +26,10 @@ class PracticeAttempt(db.Model):
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
     operation: Mapped[str] = mapped_column(db.String(20), nullable=False)
     level: Mapped[int] = mapped_column(nullable=False)
-    problem: Mapped[str] = mapped_column(db.String(50), nullable=False)
+    problem: Mapped[str] = mapped_column(db.String(50), nullable=False)  # As displayed
+    num1: Mapped[Optional[int]] = mapped_column()
+    num2: Mapped[Optional[int]] = mapped_column()
+    fact_id: Mapped[Optional[int]] = mapped_column()  # utils.fact_catalog id; None if uncatalogued
     user_answer: Mapped[int] = mapped_column(nullable=False)
     correct_answer: Mapped[int] = mapped_column(nullable=False)
     is_correct: Mapped[bool] = mapped_column(nullable=False)
@@ -29,23 +42,31 @@ class PracticeAttempt(db.Model):
     @classmethod
     def get_mastery_status(cls, db_session, user_id, operation, level):
         """Get the mastery status for problems at this level."""
+        return cls.get_mastery_statuses(db_session, user_id, [(operation, level)])[(operation, level)]
+
+    @classmethod
+    def get_mastery_statuses(cls, db_session, user_id: int,
+                             keys: Iterable[Tuple[str, int]]) -> Dict[Tuple[str, int], str]:
+        """get_mastery_status for several (operation, level)s in one query."""
+        from models.user_fact_stat import UserFactStat
         week_ago = datetime.utcnow() - timedelta(days=7)
         
-        # Get all attempts for this level in the past week using new select() style
-        stmt = select(cls).where(
-            cls.user_id == user_id,
-            cls.operation == operation,
-            cls.level == level,
-            cls.created_at >= week_ago
-        )
-        attempts = db_session.execute(stmt).scalars().all()
-        
-        if not attempts or len(attempts) < cls.MIN_ATTEMPTS:
+        # Total the per-fact rollup for facts practiced in the past week
+        totals = UserFactStat.level_totals(db_session, user_id, keys, since=week_ago)
+        statuses = {}
+        for key, facts in totals.items():
+            attempts = sum(fact['attempts'] for fact in facts.values())
+            correct = sum(fact['correct'] for fact in facts.values())
+            statuses[key] = cls._mastery_status(attempts, correct)
+        return statuses
+
+    @classmethod
+    def _mastery_status(cls, attempts: int, correct: int) -> str:
+        if attempts < cls.MIN_ATTEMPTS:
             return 'needs_practice'
             
         # Calculate accuracy
-        correct = sum(1 for a in attempts if a.is_correct)
-        accuracy = correct / len(attempts)
+        accuracy = correct / attempts
         
         # Determine mastery level
         if accuracy >= cls.MASTERY_THRESHOLD:
@@ -55,5 +76,21 @@ class PracticeAttempt(db.Model):
         
         return 'needs_practice'
 
+    def set_operands(self, num1: int, num2: int) -> None:
+        """Record the fact this attempt was for; problem keeps the displayed text."""
+        self.num1, self.num2 = num1, num2
+        self.fact_id = fact_id(self.operation, num1, num2)
+
+    def fill_operands(self) -> None:
+        """Catalog an attempt written with only a problem string (older callers, scripts)."""
+        if self.fact_id is None and self.num1 is None:
+            operands = parse_problem(self.operation, self.problem)
+            if operands is not None:
+                self.set_operands(*operands)
+
     def __repr__(self):
-        return f'<PracticeAttempt {self.problem} by User {self.user_id}>'
\ No newline at end of file
+        return f'<PracticeAttempt {self.problem} by User {self.user_id}>'
+
+@event.listens_for(PracticeAttempt, 'before_insert')
+def _fill_operands(mapper, connection, target):
+    target.fill_operands()
\ No newline at end of file
@@ -1,6 +1,7 @@
 # models/quiz.py
 from app import db
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import delete, exists, select
 from models.user import User
 
 class Quiz(db.Model):
@@ -21,6 +22,28 @@ class Quiz(db.Model):
     participants = db.relationship('QuizParticipant', backref='quiz', lazy=True)
     questions = db.relationship('QuizQuestion', backref='quiz')
 
+    @classmethod
+    def prune_finished(cls, db_session, older_than: timedelta = timedelta(hours=1)) -> int:
+        """Delete the live-play state finished quizzes no longer need. Returns rows deleted.
+
+        Every correct answer generates the next question, so each quiz ends
+        with questions nobody answered. Answered ones stay: quiz_answer
+        points at them and they are the quiz's history.
+        """
+        cutoff = datetime.utcnow() - older_than
+        result = db_session.execute(
+            delete(QuizQuestion)
+            .where(
+                QuizQuestion.quiz_id.in_(
+                    select(cls.id).where(cls.status == 'finished', cls.created_at < cutoff)
+                ),
+                ~exists().where(QuizAnswer.question_id == QuizQuestion.id)
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db_session.commit()
+        return result.rowcount
+
 class QuizParticipant(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
@@ -35,7 +58,10 @@ class QuizParticipant(db.Model):
 class QuizQuestion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'))
-    problem = db.Column(db.String(100))
+    problem = db.Column(db.String(100))  # As displayed
+    num1 = db.Column(db.Integer)
+    num2 = db.Column(db.Integer)
+    fact_id = db.Column(db.Integer)  # utils.fact_catalog id
     answer = db.Column(db.Integer)
     level = db.Column(db.Integer)
 
@@ -0,0 +1,292 @@
+import time
+from datetime import datetime
+from database import db
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import ForeignKey, case, event, func, insert, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from models.practice_attempt import PracticeAttempt
+from utils.fact_catalog import COMMUTATIVE_OPERATIONS, fact_problem
+from utils.fact_universe import get_fact_universe
+
+REBUILD_BATCH_USERS = 50  # Users per transaction in rebuild_in_batches
+
+def fold_totals(totals: Optional[Dict], attempts: int, correct: int, time_sum: float,
+                min_time: Optional[float], max_time: Optional[float]) -> Dict:
+    """Add one set of fact totals into another (None starts a new one)."""
+    if totals is None:
+        return {'attempts': attempts, 'correct': correct, 'time_sum': time_sum,
+                'min_time': min_time, 'max_time': max_time}
+    totals['attempts'] += attempts
+    totals['correct'] += correct
+    totals['time_sum'] += time_sum
+    if min_time is not None and (totals['min_time'] is None or min_time < totals['min_time']):
+        totals['min_time'] = min_time
+    if max_time is not None and (totals['max_time'] is None or max_time > totals['max_time']):
+        totals['max_time'] = max_time
+    return totals
+
+class UserFactStat(db.Model):
+    """Running per-fact totals for a user, kept in step with practice_attempt.
+
+    Every PracticeAttempt insert upserts its row here in the same transaction,
+    so mastery and stats readers can read a few dozen rows per level instead of
+    rescanning raw attempts. Rows are keyed by fact_id (utils.fact_catalog),
+    so both orders of a multiplication fact share a row; attempts without a
+    catalogued fact aren't rolled up.
+    """
+    __tablename__ = 'user_fact_stats'
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), primary_key=True)
+    operation: Mapped[str] = mapped_column(db.String(20), primary_key=True)
+    level: Mapped[int] = mapped_column(primary_key=True)
+    fact_id: Mapped[int] = mapped_column(primary_key=True)
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+    correct: Mapped[int] = mapped_column(nullable=False, default=0)
+    time_sum: Mapped[float] = mapped_column(nullable=False, default=0.0)
+    min_time: Mapped[Optional[float]] = mapped_column()
+    max_time: Mapped[Optional[float]] = mapped_column()
+    last_seen: Mapped[datetime] = mapped_column(nullable=False, default=datetime.utcnow)
+
+    @property
+    def problem(self) -> str:
+        return fact_problem(self.fact_id)
+
+    @property
+    def accuracy(self) -> float:
+        return self.correct / self.attempts if self.attempts else 0
+
+    @property
+    def avg_time(self) -> float:
+        return self.time_sum / self.attempts if self.attempts else 0
+
+    @classmethod
+    def upsert_statement(cls, dialect_name: str):
+        """Build an INSERT ... ON CONFLICT that folds a row of totals into its row.
+
+        Execute it with one or many parameter dicts (see record_many).
+        """
+        dialect_insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(dialect_name)
+        if dialect_insert is None:
+            return None
+        table = cls.__table__
+        stmt = dialect_insert(table)
+        new = stmt.excluded
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.operation, table.c.level, table.c.fact_id],
+            set_={
+                'attempts': table.c.attempts + new.attempts,
+                'correct': table.c.correct + new.correct,
+                'time_sum': table.c.time_sum + new.time_sum,
+                'min_time': case(
+                    (new.min_time.is_(None), table.c.min_time),
+                    (or_(table.c.min_time.is_(None), new.min_time < table.c.min_time), new.min_time),
+                    else_=table.c.min_time
+                ),
+                'max_time': case(
+                    (new.max_time.is_(None), table.c.max_time),
+                    (or_(table.c.max_time.is_(None), new.max_time > table.c.max_time), new.max_time),
+                    else_=table.c.max_time
+                ),
+                # Batches and back-dated attempts can arrive out of order; keep the latest
+                'last_seen': case(
+                    (or_(table.c.last_seen.is_(None), new.last_seen > table.c.last_seen), new.last_seen),
+                    else_=table.c.last_seen
+                )
+            }
+        )
+
+    @classmethod
+    def record(cls, connection, attempt: PracticeAttempt) -> None:
+        """Fold a newly inserted attempt into the rollup on the given connection."""
+        if attempt.fact_id is None:
+            return
+        time_taken = attempt.time_taken or None  # Untimed (None/0) attempts don't set min/max
+        values = {
+            'user_id': attempt.user_id,
+            'operation': attempt.operation,
+            'level': attempt.level,
+            'fact_id': attempt.fact_id,
+            'attempts': 1,
+            'correct': 1 if attempt.is_correct else 0,
+            'time_sum': time_taken or 0.0,
+            'min_time': time_taken,
+            'max_time': time_taken,
+            'last_seen': attempt.created_at or datetime.utcnow()
+        }
+        stmt = cls.upsert_statement(connection.dialect.name)
+        if stmt is not None:
+            connection.execute(stmt, values)
+        else:
+            cls._fold_row(connection, values)
+
+    @classmethod
+    def record_many(cls, connection, attempts: Iterable[Dict]) -> int:
+        """Fold a batch of inserted attempts (column dicts) into the rollup.
+
+        The bulk-insert counterpart of the after_insert hook: attempts are
+        totalled per fact first, then written in one executemany. Returns
+        the number of fact rows touched.
+        """
+        rows: Dict[Tuple, Dict] = {}
+        for attempt in attempts:
+            if attempt.get('fact_id') is None:
+                continue
+            key = (attempt['user_id'], attempt['operation'], attempt['level'], attempt['fact_id'])
+            time_taken = attempt.get('time_taken') or None
+            totals = rows[key] = fold_totals(rows.get(key), 1, 1 if attempt['is_correct'] else 0,
+                                             time_taken or 0.0, time_taken, time_taken)
+            totals['last_seen'] = max(totals.get('last_seen') or attempt['created_at'], attempt['created_at'])
+        values = [dict(totals, user_id=user_id, operation=operation, level=level, fact_id=fact)
+                  for (user_id, operation, level, fact), totals in rows.items()]
+        if not values:
+            return 0
+        stmt = cls.upsert_statement(connection.dialect.name)
+        if stmt is not None:
+            connection.execute(stmt, values)
+        else:
+            for row in values:
+                cls._fold_row(connection, row)
+        return len(values)
+
+    @classmethod
+    def _fold_row(cls, connection, values: Dict) -> None:
+        """Other databases: update in place, insert if nothing was there."""
+        table = cls.__table__
+        key = (
+            (table.c.user_id == values['user_id']) & (table.c.operation == values['operation']) &
+            (table.c.level == values['level']) & (table.c.fact_id == values['fact_id'])
+        )
+        existing = connection.execute(
+            select(table.c.min_time, table.c.max_time, table.c.last_seen).where(key)
+        ).first()
+        if existing is None:
+            connection.execute(insert(table).values(**values))
+            return
+        update = {
+            'attempts': table.c.attempts + values['attempts'],
+            'correct': table.c.correct + values['correct'],
+            'time_sum': table.c.time_sum + values['time_sum']
+        }
+        if existing.last_seen is None or values['last_seen'] > existing.last_seen:
+            update['last_seen'] = values['last_seen']
+        if values['min_time'] is not None and (existing.min_time is None or values['min_time'] < existing.min_time):
+            update['min_time'] = values['min_time']
+        if values['max_time'] is not None and (existing.max_time is None or values['max_time'] > existing.max_time):
+            update['max_time'] = values['max_time']
+        connection.execute(table.update().where(key).values(**update))
+
+    @classmethod
+    def rebuild(cls, db_session, user_id: Optional[int] = None) -> int:
+        """Recompute the rollup from practice_attempt (all users, or one). Returns rows written."""
+        return cls._rebuild(db_session, None if user_id is None else [user_id])
+
+    @classmethod
+    def rebuild_in_batches(cls, db_session, batch_size: int = REBUILD_BATCH_USERS) -> int:
+        """rebuild() for every user, `batch_size` users per transaction. Returns rows written.
+
+        One transaction over the whole table would hold the write lock (on
+        SQLite, the write queue every answer goes through) for a full scan of
+        practice_attempt; per batch, answers wait for a few users' rows at most.
+        """
+        user_ids = sorted(
+            set(db_session.execute(select(PracticeAttempt.user_id).distinct()).scalars())
+            | set(db_session.execute(select(cls.user_id).distinct()).scalars())
+        )
+        db_session.commit()
+        written = 0
+        for start in range(0, len(user_ids), batch_size):
+            written += cls._rebuild(db_session, user_ids[start:start + batch_size])
+            time.sleep(0)  # Let other green threads run between batches
+        return written
+
+    @classmethod
+    def _rebuild(cls, db_session, user_ids: Optional[List[int]]) -> int:
+        table = cls.__table__
+        delete = table.delete()
+        source = select(
+            PracticeAttempt.user_id,
+            PracticeAttempt.operation,
+            PracticeAttempt.level,
+            PracticeAttempt.fact_id,
+            func.count(),
+            func.sum(case((PracticeAttempt.is_correct, 1), else_=0)),
+            func.coalesce(func.sum(PracticeAttempt.time_taken), 0.0),
+            func.min(case((PracticeAttempt.time_taken > 0, PracticeAttempt.time_taken))),
+            func.max(case((PracticeAttempt.time_taken > 0, PracticeAttempt.time_taken))),
+            func.max(PracticeAttempt.created_at)
+        ).where(
+            PracticeAttempt.fact_id.is_not(None)
+        ).group_by(
+            PracticeAttempt.user_id,
+            PracticeAttempt.operation,
+            PracticeAttempt.level,
+            PracticeAttempt.fact_id
+        )
+        if user_ids is not None:
+            delete = delete.where(table.c.user_id.in_(user_ids))
+            source = source.where(PracticeAttempt.user_id.in_(user_ids))
+
+        db_session.execute(delete)
+        result = db_session.execute(insert(table).from_select([
+            'user_id', 'operation', 'level', 'fact_id', 'attempts', 'correct',
+            'time_sum', 'min_time', 'max_time', 'last_seen'
+        ], source))
+        db_session.commit()
+        return result.rowcount
+
+    @classmethod
+    def level_totals(cls, db_session, user_id: int, keys: Iterable[Tuple[str, int]],
+                     since: Optional[datetime] = None) -> Dict[Tuple[str, int], Dict[str, Dict]]:
+        """Per-fact totals for several (operation, level)s in one query.
+        
+        Each level's facts are keyed by its own problem strings (e.g. "7 × 3"
+        for table 7), for display. A commutative fact is stored once per level it was
+        practiced at, so for those operations a fact's rows are summed across
+        levels: answering 3 × 7 on table 3 also counts toward table 7.
+        Only rows seen at or after `since` count, when given.
+        """
+        keys = list(dict.fromkeys(keys))
+        result: Dict[Tuple[str, int], Dict[str, Dict]] = {key: {} for key in keys}
+        by_level = set()
+        by_fact: Dict[int, List[Tuple[Tuple[str, int], str]]] = {}
+        for operation, level in keys:
+            universe = get_fact_universe(operation, level) if operation in COMMUTATIVE_OPERATIONS else None
+            if universe is None:
+                by_level.add((operation, level))
+                continue
+            for problem, fact in zip(universe.problems, universe.fact_ids):
+                by_fact.setdefault(fact, []).append(((operation, level), problem))
+
+        conditions = []
+        if by_level:
+            conditions.append(tuple_(cls.operation, cls.level).in_(list(by_level)))
+        if by_fact:
+            conditions.append(cls.fact_id.in_(list(by_fact)))
+        if not conditions:
+            return result
+        query = select(
+            cls.operation, cls.level, cls.fact_id, cls.attempts, cls.correct,
+            cls.time_sum, cls.min_time, cls.max_time
+        ).where(cls.user_id == user_id, or_(*conditions))
+        if since is not None:
+            query = query.where(cls.last_seen >= since)
+
+        for row in db_session.execute(query):
+            if (row.operation, row.level) in by_level:
+                targets = [((row.operation, row.level), fact_problem(row.fact_id))]
+            else:
+                targets = by_fact.get(row.fact_id, ())
+            for key, problem in targets:
+                facts = result[key]
+                facts[problem] = fold_totals(facts.get(problem), row.attempts, row.correct,
+                                             row.time_sum, row.min_time, row.max_time)
+        return result
+
+    def __repr__(self):
+        return f'<UserFactStat {self.problem} by User {self.user_id}: {self.correct}/{self.attempts}>'
+
+@event.listens_for(PracticeAttempt, 'after_insert')
+def _record_fact_stat(mapper, connection, target):
+    """Keep user_fact_stats in the same transaction as every attempt insert."""
+    UserFactStat.record(connection, target)
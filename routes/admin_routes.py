@@ -1,12 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, Response, abort, current_app
 from flask_login import login_required, current_user
 from functools import wraps
+import hmac
 from flask_wtf import FlaskForm
 from app import db, logger
 from models.user import User
 from models.class_ import Class
 from models.assignment import Assignment
 from models.active_session import ActiveSession
+from services.identity import invalidate_user
+from services.metrics import render_metrics
+from services.presence import get_presence_tracker
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -49,6 +53,7 @@ def make_admin(user_id):
     user = User.query.get_or_404(user_id)
     user.is_admin = True
     db.session.commit()
+    invalidate_user(user_id)
     flash(f'Made {user.email} an admin.', 'success')
     return redirect(url_for('admin.admin_dashboard'))
 
@@ -60,6 +65,7 @@ def toggle_teacher(user_id):
     user = User.query.get_or_404(user_id)
     user.is_teacher = not user.is_teacher
     db.session.commit()
+    invalidate_user(user_id)
     status = "teacher" if user.is_teacher else "non-teacher"
     flash(f'Updated {user.email} to {status}.', 'success')
     return redirect(url_for('admin.admin_dashboard'))
@@ -77,6 +83,7 @@ def toggle_admin(user_id):
     user = User.query.get_or_404(user_id)
     user.is_admin = not user.is_admin
     db.session.commit()
+    invalidate_user(user_id)
     status = "admin" if user.is_admin else "non-admin"
     flash(f'Updated {user.email} to {status}.', 'success')
     return redirect(url_for('admin.admin_dashboard'))
@@ -94,6 +101,7 @@ def delete_user(user_id):
     
     try:
         # Delete active session first
+        get_presence_tracker().forget(user_id)
         active_session = ActiveSession.query.filter_by(user_id=user_id).first()
         if active_session:
             db.session.delete(active_session)
@@ -102,9 +110,20 @@ def delete_user(user_id):
         # Delete the user
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
         flash(f'Deleted user {user.email}.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error deleting user: {str(e)}', 'error')
     
     return redirect(url_for('admin.admin_dashboard'))
+
+@admin_bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: admins, or a scraper presenting METRICS_TOKEN."""
+    token = current_app.config.get('METRICS_TOKEN')
+    presented = request.headers.get('Authorization', '')
+    scraper = token and hmac.compare_digest(presented.encode(), f'Bearer {token}'.encode())
+    if not scraper and not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
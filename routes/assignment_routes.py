@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from models.assignment import Assignment, AssignmentProgress, AttemptHistory
 from models.class_ import Class, teacher_class
+from models.user import User
 from datetime import datetime
 from sqlalchemy import func, and_
 
@@ -108,7 +109,7 @@ def create_assignment():
     
     # GET request - show create form
     # Get all classes where the current user is a teacher
-    classes = Class.query.join(Class.teachers).filter(Class.teachers.contains(current_user)).all()
+    classes = Class.query.join(Class.teachers).filter(User.id == current_user.id).all()
     return render_template('assignments/create.html', classes=classes)
 
 @assignment_bp.route('/assignments/<int:id>/edit', methods=['GET', 'POST'])
@@ -139,7 +140,7 @@ def edit_assignment(id):
         return redirect(url_for('assignment.list_assignments'))
     
     # GET request - display edit form
-    classes = Class.query.join(Class.teachers).filter(Class.teachers.contains(current_user)).all()
+    classes = Class.query.join(Class.teachers).filter(User.id == current_user.id).all()
     return render_template('assignments/edit.html', assignment=assignment, classes=classes)
 
 @assignment_bp.route('/assignments/<int:id>/delete', methods=['POST'])
@@ -254,11 +255,6 @@ def student_assignments():
         .filter(Assignment.classes.any(Class.students.any(id=current_user.id)))\
         .all()
     
-    print("====================================")
-    print(assignments)
-    print(current_user.id)
-    print("====================================")
-    
     return render_template('assignments/student_list.html', assignments=assignments)
 
 
@@ -1,7 +1,10 @@
 from flask import Blueprint, render_template, redirect, url_for
 from flask_login import login_required, logout_user, current_user
-from models.class_ import Class
+from sqlalchemy import func
+from models.class_ import Class, student_class, teacher_class
+from models.user import User
 from app import db
+from services.query_budget import query_budget
 
 main_bp = Blueprint('main', __name__)
 
@@ -13,25 +16,37 @@ def home():
 
 @main_bp.route('/welcome')
 @login_required
+@query_budget(6)
 def welcome():
     if current_user.is_teacher:
         # Get all classes where this teacher is teaching
-        classes = Class.query.join(Class.teachers).filter(Class.teachers.contains(current_user)).all()
+        classes = Class.query.join(Class.teachers).filter(User.id == current_user.id).all()
         
-        # Force load and count students for each class
+        # Count every class's students in one query
+        counts = dict(db.session.query(student_class.c.class_id, func.count()).filter(
+            student_class.c.class_id.in_([class_.id for class_ in classes])
+        ).group_by(student_class.c.class_id).all())
         for class_ in classes:
-            class_.students_count = class_.students.count()
+            class_.students_count = counts.get(class_.id, 0)
         
         return render_template('welcome.html', 
                             is_teacher=True,
                             teacher_classes=classes)
     else:
         # Get all classes where this student is enrolled
-        enrolled_classes = Class.query.join(Class.students).filter(Class.students.contains(current_user)).all()
+        enrolled_classes = Class.query.join(Class.students).filter(User.id == current_user.id).all()
         
-        # Force load of teachers for each class
+        # One teacher per class to show, primary first, in one query
+        teachers = db.session.query(teacher_class.c.class_id, User.username).join(
+            User, User.id == teacher_class.c.teacher_id
+        ).filter(
+            teacher_class.c.class_id.in_([class_.id for class_ in enrolled_classes])
+        ).order_by(teacher_class.c.is_primary.desc(), teacher_class.c.teacher_id).all()
+        teacher_names = {}
+        for class_id, username in teachers:
+            teacher_names.setdefault(class_id, username)
         for class_ in enrolled_classes:
-            class_.teachers.all()
+            class_.teacher_name = teacher_names.get(class_.id)
             
         return render_template('welcome.html',
                             is_teacher=False,
@@ -5,6 +5,7 @@ import requests
 from models.user import User
 from models.oauth import OAuth
 from app import db, logger
+from services.identity import invalidate_user
 import os
 import json
 
@@ -119,6 +120,8 @@ def google_callback():
                     user.last_name = last_name
 
             db.session.commit()
+            # Names and avatar may have changed; drop the cached snapshot
+            invalidate_user(user.id)
             login_user(user)
             flash("Successfully signed in with Google.", category="success")
             return redirect(url_for("main.home"))
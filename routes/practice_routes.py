@@ -1,36 +1,36 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for
 from flask_login import login_required, current_user
-from database import db
+from database import db, read_from_replica
 from models.practice_attempt import PracticeAttempt
 from models.assignment import Assignment, AssignmentProgress, AttemptHistory
-from models.active_session import ActiveSession
 from utils.math_problems import get_problem
 from services.progress_service import ProgressService
+from services.mastery_engine import get_mastery_engine
+from services.attempt_buffer import save_attempt
+from services.presence import get_presence_tracker
+from services.query_budget import query_budget
 from datetime import datetime
 from utils.practice_tracker import PracticeTracker
+from utils.fact_catalog import OPERATION_CODES, format_problem, parse_problem, solve
+import logging
+
+logger = logging.getLogger(__name__)
 
 practice_bp = Blueprint('practice', __name__)
 
+MAX_PROBLEM_BATCH = 20  # Most problems a client can prefetch in one request
+
 @practice_bp.before_app_request
 def update_session():
     if current_user.is_authenticated:
-        session = ActiveSession.query.filter_by(user_id=current_user.id).first()
-        if not session:
-            session = ActiveSession(user_id=current_user.id)
-            db.session.add(session)
-        session.last_active = datetime.utcnow()
-        db.session.commit()
+        get_presence_tracker().heartbeat(current_user)
 
 @practice_bp.route('/practice')
 @login_required
 def practice():
     # Update session activity
     if current_user.is_authenticated:
-        session = current_user.active_session
-        if session:
-            session.activity_type = 'practice'
-            session.details = "Practice Mode"
-            db.session.commit()
+        get_presence_tracker().heartbeat(current_user, 'practice', "Practice Mode")
 
     # Get assignment_id from query params if it exists
     assignment_id = request.args.get('assignment_id')
@@ -54,12 +54,12 @@ def practice():
 @practice_bp.route('/get_problem', methods=['POST'])
 @login_required
 def get_problem_route():
-    print("Get problem route")
-    print(f"Received data: {request.get_json()}")
     data = request.get_json()
+    logger.debug(f"get_problem: {data}")
     operation = data.get('operation')
     level = data.get('level', 1)
     assignment_id = data.get('assignment_id')
+    count = data.get('count')  # Batch mode: return the next `count` problems
 
     # Validate operation and level
     if not operation or not isinstance(level, (int, str)):
@@ -68,6 +68,11 @@ def get_problem_route():
         level = int(level)
     except ValueError:
         return jsonify({'error': 'Invalid level format'})
+    if count is not None:
+        try:
+            count = min(max(int(count), 1), MAX_PROBLEM_BATCH)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid count format'})
 
     # If in assignment mode, validate and get settings
     if assignment_id:
@@ -96,12 +101,21 @@ def get_problem_route():
 
     # Get problem using PracticeTracker
     try:
-        problem = PracticeTracker.get_problem(
-            db=db,
-            operation=operation,
-            level=level,
-            user_id=current_user.id
-        )
+        if count is not None:
+            problem = PracticeTracker.get_problems(
+                db=db,
+                operation=operation,
+                level=level,
+                count=count,
+                user_id=current_user.id
+            )
+        else:
+            problem = PracticeTracker.get_problem(
+                db=db,
+                operation=operation,
+                level=level,
+                user_id=current_user.id
+            )
         
         if not problem:
             return jsonify({
@@ -110,7 +124,7 @@ def get_problem_route():
             }), 404
 
     except Exception as e:
-        print(f"Error getting problem: {str(e)}")
+        logger.exception(f"Error getting problem: {str(e)}")
         return jsonify({
             'error': 'Problem generation failed',
             'message': str(e)
@@ -133,7 +147,7 @@ def get_problem_route():
 def check_answer():
     try:
         data = request.get_json()
-        print(f"Received data: {data}")  # Debug print
+        logger.debug(f"check_answer: {data}")
         
         # Extract and validate data
         operation = data.get('operation')
@@ -150,34 +164,41 @@ def check_answer():
             
         time_taken = data.get('time_taken')
         assignment_id = data.get('assignment_id')
+        next_count = data.get('next_count')  # Also return the next problems
+        if next_count is not None:
+            try:
+                next_count = min(max(int(next_count), 1), MAX_PROBLEM_BATCH)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid next_count format'}), 400
         
         # Validate required fields
         if not all([operation, problem]):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        # Get correct answer from problem
+        if operation not in OPERATION_CODES:
+            return jsonify({'error': 'Invalid operation'}), 400
+
+        # Grade from the operands; the problem string is only parsed for
+        # clients that don't send them
+        parsed = parse_problem(operation, problem)
         try:
-            if operation == 'multiplication':
-                problem_parts = problem.split('×')
+            if data.get('num1') is not None and data.get('num2') is not None:
+                operands = int(data['num1']), int(data['num2'])
             else:
-                problem_parts = problem.split(OPERATIONS[operation]['symbol'])
-                
-            num1 = int(problem_parts[0].strip())
-            num2 = int(problem_parts[1].strip())
-            
-            if operation == 'addition':
-                correct_answer = num1 + num2
-            elif operation == 'subtraction':
-                correct_answer = num1 - num2
-            elif operation == 'multiplication':
-                correct_answer = num1 * num2
-            elif operation == 'division':
-                correct_answer = num1 / num2
-            else:
-                return jsonify({'error': 'Invalid operation'}), 400
-                
-        except (IndexError, ValueError) as e:
-            print(f"Error parsing problem: {e}")  # Debug print
+                operands = parsed
+        except (TypeError, ValueError):
+            operands = None
+        if operands is None:
+            return jsonify({'error': 'Invalid problem format'}), 400
+        if parsed is None:
+            # Stored next to fact_id, so it must say the same thing
+            problem = format_problem(operation, *operands)
+        elif parsed != operands:
+            return jsonify({'error': 'Problem does not match its operands'}), 400
+        num1, num2 = operands
+        try:
+            correct_answer = solve(operation, num1, num2)
+        except ZeroDivisionError:
             return jsonify({'error': 'Invalid problem format'}), 400
         
         is_correct = (user_answer == correct_answer)
@@ -193,26 +214,8 @@ def check_answer():
             is_correct=is_correct,
             time_taken=time_taken
         )
-        db.session.add(attempt)
-        
-        # For multiplication, add a second attempt record for the commutative case
-        if operation == 'multiplication':
-            num1, num2 = map(int, problem.split('×'))
-            if num1 != num2:  # Only if numbers are different
-                # Create commutative attempt with swapped numbers
-                commutative_problem = f"{num2} × {num1}"
-                commutative_attempt = PracticeAttempt(
-                    user_id=current_user.id,
-                    operation=operation,
-                    level=max(num1, num2),  # Use larger number as level
-                    problem=commutative_problem,
-                    user_answer=user_answer,
-                    correct_answer=correct_answer,
-                    is_correct=is_correct,
-                    time_taken=time_taken
-                )
-                db.session.add(commutative_attempt)
-                print(f"Added commutative attempt: {commutative_problem} at level {max(num1, num2)}")  # Debug log
+        attempt.set_operands(num1, num2)
+        save_attempt(attempt)
         
         # Update assignment progress if in assignment mode
         progress = None
@@ -232,6 +235,9 @@ def check_answer():
                 history = AttemptHistory(
                     progress_id=progress.id,
                     problem_number=progress.problems_completed,
+                    num1=num1,
+                    num2=num2,
+                    fact_id=attempt.fact_id,
                     student_answer=str(attempt.user_answer),
                     correct_answer=str(attempt.correct_answer),
                     is_correct=attempt.is_correct,
@@ -248,6 +254,15 @@ def check_answer():
         
         db.session.commit()
         
+        # Fetch everything the level decision and next problems need in one go
+        next_operation, next_level = operation, level
+        if assignment_id and progress:
+            next_operation = progress.assignment.operation
+            next_level = progress.assignment.level
+        engine = get_mastery_engine()
+        engine.invalidate(current_user.id, operation, level)
+        engine.load(current_user.id, [(operation, level), (next_operation, next_level)])
+        
         # Check if level should change
         should_change, new_level = ProgressService.should_change_level(
             current_user.id, operation, level
@@ -270,130 +285,57 @@ def check_answer():
                 'status': progress.status
             }
         
+        # Piggyback the next problems so the client skips a /get_problem round trip
+        if next_count is not None:
+            if progress and progress.status == 'complete':
+                response_data['next'] = {
+                    'complete': True,
+                    'message': 'Assignment complete!'
+                }
+            else:
+                response_data['next'] = PracticeTracker.get_problems(
+                    db=db,
+                    operation=next_operation,
+                    level=next_level,
+                    count=next_count,
+                    user_id=current_user.id
+                ) or {
+                    'error': 'No problems available',
+                    'message': 'No problems found for this operation and level'
+                }
+        
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"Error in check_answer: {str(e)}")  # Debug print
+        logger.exception(f"Error in check_answer: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# Operation symbols for parsing problems
-OPERATIONS = {
-    'addition': {'symbol': '+'},
-    'subtraction': {'symbol': '-'},
-    'multiplication': {'symbol': '×'},
-    'division': {'symbol': '÷'}
-}
-
 @practice_bp.route('/progress')
 @login_required
+@read_from_replica
+@query_budget(6)  # Includes the occasional presence flush and user reload
 def progress():
     """Show student's practice progress"""
-    # Get all practice attempts for the current user
-    attempts = PracticeAttempt.query.filter_by(user_id=current_user.id).order_by(PracticeAttempt.created_at.desc()).all()
-    
-    # Calculate statistics by operation
-    stats = {}
+    # Per-operation and per-level totals and streaks, aggregated in SQL
     operations = ['addition', 'multiplication']  # Support for these operations initially
-    
-    for op in operations:
-        op_attempts = [a for a in attempts if a.operation == op]
-        if op_attempts:
-            total_attempts = len(op_attempts)
-            correct_attempts = sum(1 for a in op_attempts if a.is_correct)
-            
-            # Calculate current streak
-            current_streak = 0
-            for attempt in op_attempts:
-                if attempt.is_correct:
-                    current_streak += 1
-                else:
-                    break
-            
-            stats[op] = {
-                'total_attempts': total_attempts,
-                'correct_attempts': correct_attempts,
-                'accuracy': (correct_attempts / total_attempts * 100) if total_attempts > 0 else 0,
-                'average_time': sum(a.time_taken for a in op_attempts if a.time_taken is not None) / sum(1 for a in op_attempts if a.time_taken is not None) if total_attempts > 0 else 0,
-                'current_streak': current_streak,
-                'levels': {}  # For tracking progress at different levels
-            }
-            
-            # Calculate stats by level
-            for attempt in op_attempts:
-                level = attempt.level
-                if level not in stats[op]['levels']:
-                    level_attempts = [a for a in op_attempts if a.level == level]
-                    level_correct = sum(1 for a in level_attempts if a.is_correct)
-                    
-                    stats[op]['levels'][level] = {
-                        'attempts': len(level_attempts),
-                        'correct': level_correct,
-                        'accuracy': (level_correct / len(level_attempts) * 100) if level_attempts else 0,
-                        'total_time': sum(a.time_taken for a in level_attempts if a.time_taken is not None),
-                        'description': get_level_description(op, level),
-                        'mastery_status': PracticeAttempt.get_mastery_status(db.session, current_user.id, op, level)
-                    }
+    stats = ProgressService.get_all_student_stats(current_user.id, operations)
+
+    # Mastery reflects the past week's answers; every level's in one query
+    keys = [(op, int(level)) for op, op_stats in stats.items() for level in op_stats['levels']]
+    statuses = PracticeAttempt.get_mastery_statuses(db.session, current_user.id, keys)
+    for op, op_stats in stats.items():
+        op_stats['levels'] = {
+            int(level): dict(level_stats, mastery_status=statuses[(op, int(level))])
+            for level, level_stats in op_stats['levels'].items()
+        }
     
     # Calculate multiplication table stats if available
     multiplication_stats = None
     if 'multiplication' in stats:
-        mult_attempts = [a for a in attempts if a.operation == 'multiplication']
-        multiplication_stats = {}
-        for i in range(13):
-            multiplication_stats[i] = {}
-            for j in range(13):
-                multiplication_stats[i][j] = {
-                    'attempts': 0,
-                    'correct': 0,
-                    'accuracy': 0,
-                    'average_time': 0
-                }
-        
-        for i in range(1, 13):  # 1-12 multiplication tables
-            for j in range(1, 13):
-                problem = f"{i} × {j}"
-                relevant_attempts = [a for a in mult_attempts if a.problem == problem]
-                if relevant_attempts:
-                    correct_count = sum(1 for a in relevant_attempts if a.is_correct)
-                    multiplication_stats[i][j] = {
-                        'attempts': len(relevant_attempts),
-                        'correct': correct_count,
-                        'accuracy': (correct_count / len(relevant_attempts)) * 100,
-                        'average_time': sum(a.time_taken for a in relevant_attempts if a.time_taken is not None) / sum(1 for a in relevant_attempts if a.time_taken is not None)
-                    }
+        multiplication_stats = ProgressService.get_multiplication_table_stats(current_user.id)
     
     return render_template('progress.html',
                          stats=stats,
                          multiplication_stats=multiplication_stats,
                          viewing_as_teacher=False,
                          student=current_user)
-
-def get_level_description(operation, level):
-    """Get a description for each level of an operation"""
-    if operation == 'addition':
-        descriptions = {
-            1: "Single Digit",
-            2: "Double Digit",
-            3: "Make 10",
-            4: "Add to 100",
-            5: "Add to 1000"
-        }
-    elif operation == 'multiplication':
-        descriptions = {
-            1: "×1 Table",
-            2: "×2 Table",
-            3: "×3 Table",
-            4: "×4 Table",
-            5: "×5 Table",
-            6: "×6 Table",
-            7: "×7 Table",
-            8: "×8 Table",
-            9: "×9 Table",
-            10: "×10 Table",
-            11: "×11 Table",
-            12: "×12 Table"
-        }
-    else:
-        return f"Level {level}"
-    
-    return descriptions.get(level, f"Level {level}")
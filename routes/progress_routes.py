@@ -4,26 +4,25 @@ from models.practice_attempt import PracticeAttempt
 from models.user import User
 from models.class_ import Class, teacher_class
 from app import db
+from database import read_from_replica
 from datetime import datetime, timedelta
 from sqlalchemy import func
-from utils.math_problems import get_problem
 from services.progress_service import ProgressService
+import logging
+
+logger = logging.getLogger(__name__)
 
 progress_bp = Blueprint('progress', __name__)
 
 @progress_bp.route('/progress')
 @login_required
+@read_from_replica
 def progress():
     """Show user's progress across all operations"""
     try:
-        # Get stats for each operation
+        # Get stats for each operation the student has practiced
         operations = ['addition', 'subtraction', 'multiplication', 'division']
-        stats = {}
-        
-        for operation in operations:
-            operation_stats = ProgressService.get_student_stats(current_user.id, operation)
-            if operation_stats['total_attempts'] > 0:
-                stats[operation] = operation_stats
+        stats = ProgressService.get_all_student_stats(current_user.id, operations)
 
         # Get multiplication table stats if available
         multiplication_stats = None
@@ -34,12 +33,13 @@ def progress():
                             stats=stats,
                             multiplication_stats=multiplication_stats)
     except Exception as e:
-        print(f"Error in progress route: {str(e)}")
+        logger.exception(f"Error in progress route: {str(e)}")
         flash('An error occurred while loading progress data.', 'error')
         return redirect(url_for('main.home'))
 
 @progress_bp.route('/student_progress/<int:student_id>')
 @login_required
+@read_from_replica
 def student_progress(student_id):
     """View progress for a specific student (teacher only)"""
     try:
@@ -57,14 +57,9 @@ def student_progress(student_id):
             flash('Access denied. Student not in your classes.', 'error')
             return redirect(url_for('main.home'))
 
-        # Get stats for each operation
+        # Get stats for each operation the student has practiced
         operations = ['addition', 'subtraction', 'multiplication', 'division']
-        stats = {}
-        
-        for operation in operations:
-            operation_stats = ProgressService.get_student_stats(student_id, operation)
-            if operation_stats['total_attempts'] > 0:
-                stats[operation] = operation_stats
+        stats = ProgressService.get_all_student_stats(student_id, operations)
 
         # Get multiplication table stats if available
         multiplication_stats = None
@@ -76,13 +71,14 @@ def student_progress(student_id):
                             stats=stats,
                             multiplication_stats=multiplication_stats)
     except Exception as e:
-        print(f"Error in student_progress route: {str(e)}")
+        logger.exception(f"Error in student_progress route: {str(e)}")
         flash('An error occurred while loading student progress data.', 'error')
         return redirect(url_for('main.home'))
 
 @progress_bp.route('/analyze_level/<operation>/<int:level>')
 @progress_bp.route('/analyze_level/<operation>/<int:level>/<int:student_id>')
 @login_required
+@read_from_replica
 def analyze_level(operation, level, student_id=None):
     """Analyze performance at a specific level"""
     try:
@@ -92,24 +88,14 @@ def analyze_level(operation, level, student_id=None):
 
         target_id = student_id if student_id else current_user.id
         
-        # Get attempts for this level
-        attempts = PracticeAttempt.query.filter_by(
-            user_id=target_id,
-            operation=operation,
-            level=level
-        ).all()
+        # Aggregate this level's attempts
+        stats = ProgressService.get_level_stats(target_id, operation, level)
         
-        if not attempts:
+        if stats is None:
             flash('No attempts found for this level.', 'warning')
             return redirect(url_for('progress.progress'))
 
-        # Get problem description
-        problem = get_problem(operation, level)
-        description = problem['description'] if problem else f"Level {level}"
-
-        # Calculate stats using ProgressService
-        stats = ProgressService.calculate_level_stats(attempts, description)
-        problems = ProgressService.analyze_level_problems(attempts)
+        problems = ProgressService.get_level_problem_stats(target_id, operation, level)
 
         # Get student info if viewing as teacher
         student = User.query.get(target_id) if student_id else None
@@ -121,18 +107,19 @@ def analyze_level(operation, level, student_id=None):
                             problems=problems,
                             student=student)
     except Exception as e:
-        print(f"Error in analyze_level route: {str(e)}")
+        logger.exception(f"Error in analyze_level route: {str(e)}")
         flash('An error occurred while analyzing level data.', 'error')
         return redirect(url_for('progress.progress'))
 
 @progress_bp.route('/incorrect_problems')
 @login_required
+@read_from_replica
 def incorrect_problems():
     """Display problems the user has answered incorrectly"""
     try:
         missed_problems = ProgressService.analyze_missed_problems(current_user.id)
         return render_template('incorrect_problems.html', problems=missed_problems)
     except Exception as e:
-        print(f"Error in incorrect_problems route: {str(e)}")
+        logger.exception(f"Error in incorrect_problems route: {str(e)}")
         flash('An error occurred while loading incorrect problems.', 'error')
         return redirect(url_for('progress.progress'))
\ No newline at end of file
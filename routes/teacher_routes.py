@@ -1,12 +1,14 @@
-from flask import Blueprint, render_template, abort, Response, stream_with_context, request, flash, redirect, url_for
+from flask import Blueprint, render_template, abort, Response, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
-from models.active_session import ActiveSession
-from models.practice_attempt import PracticeAttempt
 from models.user import User
 from models.class_ import Class
-import json
-import time
+from database import db, read_from_replica
+from services.query_budget import query_budget
+from services.identity import invalidate_user
+from services.presence import get_class_presence, get_presence_tracker
+from services.live_updates import get_student_updates
+from services.progress_service import ProgressService
 
 
 
@@ -14,40 +16,29 @@ teacher_bp = Blueprint('teacher', __name__)
 
 @teacher_bp.route('/active-students')
 @login_required
+@read_from_replica
+@query_budget(6)  # Includes the occasional presence flush and class roster reload
 def active_students():
     """View currently active students and their activities"""
     if not current_user.is_teacher:
         abort(403)  # Forbidden
         
-    # Get sessions active in the last 15 minutes
-    cutoff = datetime.utcnow() - timedelta(minutes=ActiveSession.INACTIVE_THRESHOLD)
-    active_sessions = ActiveSession.query.filter(
-        ActiveSession.last_active >= cutoff
-    ).order_by(ActiveSession.last_active.desc()).all()
+    # The teacher's students active in the last 15 minutes (admins see everyone)
+    if current_user.is_admin:
+        active_sessions = get_presence_tracker().active()
+    else:
+        active_sessions = get_class_presence().active_for(current_user.id)
     
-    # Get performance data for each student
+    # Accuracy over each student's last 20 attempts, all students in one query
+    recent = ProgressService.get_recent_activity([session.user_id for session in active_sessions])
     student_stats = {}
     for session in active_sessions:
-        # Get recent attempts (last 20) to calculate accuracy
-        recent_attempts = PracticeAttempt.query.filter_by(
-            user_id=session.user_id
-        ).order_by(
-            PracticeAttempt.created_at.desc()
-        ).limit(20).all()
-        
-        if recent_attempts:
-            correct = sum(1 for attempt in recent_attempts if attempt.is_correct)
-            accuracy = (correct / len(recent_attempts)) * 100
-            recent_operation = recent_attempts[0].operation if recent_attempts else None
-        else:
-            accuracy = 0 
-            recent_operation = None
-        
+        activity = recent.get(session.user_id)
+        accuracy = activity.accuracy if activity else 0
         student_stats[session.user_id] = {
             'accuracy': accuracy,
-            'recent_attempts': recent_attempts,
             'accuracy_color': get_accuracy_color(accuracy),
-            'recent_operation': recent_operation
+            'recent_operation': activity.recent_operation if activity else None
         }
     
     return render_template('active_students.html', 
@@ -63,43 +54,10 @@ def get_accuracy_color(accuracy):
     else:
         return 'danger'
 
-def generate_student_updates():
-    """Generate updates about active students"""
-    while True:
-        # Get active sessions
-        cutoff = datetime.utcnow() - timedelta(minutes=ActiveSession.INACTIVE_THRESHOLD)
-        active_sessions = ActiveSession.query.filter(
-            ActiveSession.last_active >= cutoff
-        ).order_by(ActiveSession.last_active.desc()).all()
-        
-        # Format data for SSE
-        updates = []
-        for session in active_sessions:
-            updates.append({
-                'user_id': session.user_id,
-                'username': session.user.username,
-                'last_active': session.last_active.isoformat(),
-                'activity_type': session.activity_type,
-                'details': session.details,
-                'accuracy': get_student_accuracy(session.user_id)
-            })
-        
-        # Send updates as SSE
-        yield f"data: {json.dumps(updates)}\n\n"
-        time.sleep(5)  # Wait 5 seconds before next update
-
 def get_student_accuracy(user_id):
     """Get accuracy for a specific student"""
-    recent_attempts = PracticeAttempt.query.filter_by(
-        user_id=user_id
-    ).order_by(
-        PracticeAttempt.created_at.desc()
-    ).limit(20).all()
-    
-    if recent_attempts:
-        correct = sum(1 for attempt in recent_attempts if attempt.is_correct)
-        return (correct / len(recent_attempts)) * 100
-    return 0
+    activity = ProgressService.get_recent_activity([user_id]).get(user_id)
+    return activity.accuracy if activity else 0
 
 @teacher_bp.route('/edit-student/<int:student_id>', methods=['GET', 'POST'])
 @login_required
@@ -119,6 +77,7 @@ def edit_student(student_id):
         student.last_name = request.form.get('last_name', student.last_name)
         student.email = request.form.get('email', student.email)
         db.session.commit()
+        invalidate_user(student.id)
         flash('Student information updated successfully', 'success')
         return redirect(url_for('teacher.active_students'))
     
@@ -192,7 +151,10 @@ def active_students_updates():
     """SSE endpoint for active student updates"""
     if not current_user.is_teacher:
         abort(403)
+    # One shared producer; this request only relays its changes for the teacher's classes
+    hub = get_student_updates()
+    hub.start()
     return Response(
-        stream_with_context(generate_student_updates()),
+        hub.stream(hub.subscribe(None if current_user.is_admin else current_user.id)),
         mimetype='text/event-stream'
     )
@@ -0,0 +1,255 @@
+import atexit
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from database import db
+from models.attempt_window import install_windows, record_outcomes
+from models.practice_attempt import PracticeAttempt
+from models.user_fact_stat import UserFactStat
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_MS = 250    # Longest a buffered row waits before it is written
+DEFAULT_MAX_ROWS = 200    # Rows that trigger a flush before the interval is up
+DEFAULT_MAX_RETRIES = 5   # Failed flushes (database unreachable) before a batch is dropped
+DEFAULT_MAX_QUEUE = 10000 # Rows held while flushes fail; the oldest go beyond this
+
+def _quiz_answers():
+    # models.quiz imports db from app, so it can't load while app is importing us
+    from models.quiz import QuizAnswer
+    return QuizAnswer.__table__
+
+def _column_values(row, table) -> Dict:
+    values = {column.key: getattr(row, column.key) for column in table.columns if column.key != 'id'}
+    # The session would reject these at commit; once queued, the request has already succeeded
+    missing = [column.key for column in table.columns
+               if not column.nullable and not column.primary_key and column.default is None
+               and values[column.key] is None]
+    if missing:
+        raise ValueError(f"{table.name} row is missing {', '.join(missing)}")
+    return values
+
+class AttemptBuffer:
+    """Write-behind queue for PracticeAttempt and QuizAnswer rows.
+
+    Answers are queued in-process and written by a background flusher every
+    ATTEMPT_BUFFER_FLUSH_MS, or as soon as ATTEMPT_BUFFER_MAX_ROWS are waiting,
+    each batch as one transaction of executemany inserts. Bulk inserts skip
+    the ORM events, so the flush also folds the batch into user_fact_stats
+    and attempt_window itself.
+
+    Until a row is committed, pending_attempts() hands it to this process's
+    readers (the mastery engine overlays it), so a student's own next level
+    check sees their last answer. Another worker won't see it until the
+    flush.
+
+    A batch the database rejects (a constraint or bad value) is retried a
+    row at a time and the offending rows are logged and dropped. A batch
+    that fails for any other reason is retried up to
+    ATTEMPT_BUFFER_MAX_RETRIES flushes, and at most ATTEMPT_BUFFER_MAX_QUEUE
+    rows wait meanwhile, so one bad row or an outage can't wedge the buffer
+    or grow it without bound.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.Lock()        # Guards the queues
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._wake = threading.Event()
+        self._attempts: List[Dict] = []
+        self._answers: List[Dict] = []
+        self._inflight: List[Dict] = []      # Attempts being written; still pending to readers
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+        self._failures = 0                   # Flushes in a row that failed and were requeued
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.enabled = app.config.get('ATTEMPT_BUFFER_ENABLED', False)
+        self.flush_interval = app.config.get('ATTEMPT_BUFFER_FLUSH_MS', DEFAULT_FLUSH_MS) / 1000
+        self.max_rows = app.config.get('ATTEMPT_BUFFER_MAX_ROWS', DEFAULT_MAX_ROWS)
+        self.max_retries = app.config.get('ATTEMPT_BUFFER_MAX_RETRIES', DEFAULT_MAX_RETRIES)
+        self.max_queue = app.config.get('ATTEMPT_BUFFER_MAX_QUEUE', DEFAULT_MAX_QUEUE)
+        app.extensions['attempt_buffer'] = self
+        if self.enabled:
+            # Worker shutdown (gunicorn SIGTERM, Ctrl-C) exits the interpreter
+            atexit.register(self.close)
+
+    def add_attempt(self, attempt: PracticeAttempt) -> None:
+        """Queue a transient attempt instead of adding it to the session."""
+        attempt.fill_operands()
+        if attempt.created_at is None:
+            attempt.created_at = datetime.utcnow()
+        self._enqueue(self._attempts, _column_values(attempt, PracticeAttempt.__table__))
+
+    def add_quiz_answer(self, answer) -> None:
+        if answer.created_at is None:
+            answer.created_at = datetime.utcnow()
+        self._enqueue(self._answers, _column_values(answer, _quiz_answers()))
+
+    def _enqueue(self, queue: List[Dict], values: Dict) -> None:
+        with self._lock:
+            queue.append(values)
+            full = len(self._attempts) + len(self._answers) >= self.max_rows
+        if self._closed:
+            # Shutting down: nothing will come back for it
+            self.flush()
+            return
+        self._start_flusher()
+        if full:
+            self._wake.set()
+
+    def pending_attempts(self, user_id: int) -> List[Dict]:
+        """A user's attempts that are queued or mid-flush, oldest first."""
+        with self._lock:
+            return [row for row in self._inflight + self._attempts if row['user_id'] == user_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._attempts) + len(self._answers)
+
+    def flush(self) -> int:
+        """Write everything queued in one transaction. Returns rows written.
+
+        The transaction is all-or-nothing, so a failed batch is never half
+        written: rejected rows are found by writing the batch row by row,
+        anything else puts the batch back on the front of the queue.
+        """
+        with self._flush_lock:
+            with self._lock:
+                attempts, answers = self._attempts, self._answers
+                if not attempts and not answers:
+                    return 0
+                self._attempts, self._answers = [], []
+                self._inflight = attempts
+
+            windows = {}
+            try:
+                with self.app.app_context():
+                    windows = self._write(attempts, answers)
+                written = len(attempts) + len(answers)
+            except (IntegrityError, DataError):
+                logger.warning(f"Attempt buffer batch of {len(attempts) + len(answers)} rows was rejected; "
+                               "writing it row by row")
+                with self.app.app_context():
+                    written, windows = self._write_each(attempts, answers)
+            except Exception:
+                self._requeue(attempts, answers)
+                return 0
+
+            with self._lock:
+                install_windows(windows)
+                self._inflight = []
+                self._failures = 0
+            logger.debug(f"Attempt buffer flushed {len(attempts)} attempts, {len(answers)} quiz answers")
+            return written
+
+    @staticmethod
+    def _write(attempts: List[Dict], answers: List[Dict]) -> Dict:
+        """Insert a batch in one transaction. Returns the attempt windows it moved."""
+        windows = {}
+        with db.engine.begin() as connection:
+            if attempts:
+                connection.execute(insert(PracticeAttempt.__table__), attempts)
+                UserFactStat.record_many(connection, attempts)
+                windows = record_outcomes(connection, attempts)
+            if answers:
+                connection.execute(insert(_quiz_answers()), answers)
+        return windows
+
+    def _write_each(self, attempts: List[Dict], answers: List[Dict]) -> Tuple[int, Dict]:
+        """Write a rejected batch one row per transaction, dropping the rows that fail."""
+        written, windows = 0, {}
+        for row in attempts:
+            try:
+                windows.update(self._write([row], []))
+                written += 1
+            except Exception:
+                logger.exception(f"Dropping practice attempt the database rejected: {row}")
+        for row in answers:
+            try:
+                self._write([], [row])
+                written += 1
+            except Exception:
+                logger.exception(f"Dropping quiz answer the database rejected: {row}")
+        return written, windows
+
+    def _requeue(self, attempts: List[Dict], answers: List[Dict]) -> None:
+        """Put a failed batch back for the next flush, within the retry and queue limits."""
+        with self._lock:
+            self._inflight = []
+            self._failures += 1
+            if self._failures > self.max_retries:
+                logger.exception(f"Attempt buffer flush failed {self._failures} times; "
+                                 f"dropping {len(attempts) + len(answers)} rows")
+                self._failures = 0
+                return
+            logger.exception(f"Attempt buffer flush of {len(attempts) + len(answers)} rows failed; will retry")
+            self._attempts[:0] = attempts
+            self._answers[:0] = answers
+            excess = len(self._attempts) + len(self._answers) - self.max_queue
+            if excess > 0:
+                # Oldest first; answers are ordered within each queue only
+                dropped_attempts = min(excess, len(self._attempts))
+                del self._attempts[:dropped_attempts]
+                del self._answers[:excess - dropped_attempts]
+                logger.error(f"Attempt buffer is over {self.max_queue} rows; dropped the oldest {excess}")
+
+    def _start_flusher(self) -> None:
+        if self._flusher is not None or self._closed:
+            return
+        with self._lock:
+            if self._flusher is None:
+                # A green thread once eventlet has monkey patched threading
+                self._flusher = threading.Thread(target=self._run, name='attempt-buffer', daemon=True)
+                self._flusher.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the flusher and write whatever is left."""
+        self._closed = True
+        self._wake.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        self.flush()
+
+def get_attempt_buffer() -> Optional[AttemptBuffer]:
+    """The app's buffer when write-behind is on, else None."""
+    buffer = current_app.extensions.get('attempt_buffer')
+    return buffer if buffer is not None and buffer.enabled else None
+
+def save_attempt(attempt: PracticeAttempt) -> None:
+    """Add an attempt to the session, or queue it when write-behind is on."""
+    buffer = get_attempt_buffer()
+    if buffer is None:
+        db.session.add(attempt)
+    else:
+        buffer.add_attempt(attempt)
+    # Teachers watching live see the answer on the next update
+    hub = current_app.extensions.get('student_updates')
+    if hub is not None:
+        hub.notify()
+
+def save_quiz_answer(answer) -> None:
+    buffer = get_attempt_buffer()
+    if buffer is None:
+        db.session.add(answer)
+    else:
+        buffer.add_quiz_answer(answer)
+
+def pending_attempts(user_id: int) -> List[Dict]:
+    """A user's buffered, not yet committed attempts (empty without write-behind)."""
+    buffer = get_attempt_buffer() if has_app_context() else None
+    return buffer.pending_attempts(user_id) if buffer is not None else []
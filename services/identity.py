@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from flask import current_app
+from flask_login import UserMixin
+from database import db
+from models.user import User
+
+DEFAULT_CACHE_SIZE = 1024  # Users remembered per process
+DEFAULT_CACHE_TTL = 60     # Seconds a snapshot is trusted; bounds staleness across workers
+
+class UserSnapshot(UserMixin):
+    """The logged-in user as Flask-Login's current_user, without a query.
+
+    Carries what nearly every request and socket event reads: id, username,
+    email, names and role flags. Anything else (relationships, methods,
+    other columns) is read from the real User, loaded into the request's
+    session on first use. Compares equal to the User with the same id, so
+    `current_user in class_.teachers` keeps working.
+    """
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+        self.is_teacher = user.is_teacher
+        self.is_admin = user.is_admin
+
+    @property
+    def user(self) -> Optional[User]:
+        """The full User, from the session's identity map when already loaded."""
+        return db.session.get(User, self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    # The same derived properties as User, so they don't need a load
+    is_student = User.is_student
+    full_name = User.full_name
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, (User, UserSnapshot)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((User, self.id))
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+class IdentityCache:
+    """Per-process LRU of UserSnapshots for the Flask-Login user loader.
+
+    Entries expire after USER_CACHE_TTL seconds and the least recently used
+    go once USER_CACHE_SIZE are held. Views that change a user's name,
+    email or roles call invalidate_user() so this process sees the change
+    at once; other workers see it when their entry expires.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # user_id -> (snapshot, expires_at)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.max_size = app.config.get('USER_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+        self.ttl = app.config.get('USER_CACHE_TTL', DEFAULT_CACHE_TTL)
+        app.extensions['identity_cache'] = self
+
+    def load(self, user_id: int) -> Optional[UserSnapshot]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        snapshot = UserSnapshot(user)
+        with self._lock:
+            self._entries[user_id] = (snapshot, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+def invalidate_user(user_id: int) -> None:
+    """Forget a user's cached identity after changing them."""
+    cache = current_app.extensions.get('identity_cache')
+    if cache is not None:
+        cache.invalidate(user_id)
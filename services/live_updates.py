@@ -0,0 +1,176 @@
+import json
+import queue
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional
+from flask import current_app
+from database import db, replica_reads
+from services.presence import get_class_presence, get_presence_tracker
+from services.progress_service import ProgressService
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5.0     # Seconds between snapshots when nothing is answered
+DEFAULT_MIN_GAP = 1.0      # Seconds between snapshots however often students answer
+DEFAULT_QUEUE_SIZE = 10    # Messages held for a subscriber before it is resynced
+KEEPALIVE_SECONDS = 15     # SSE comment sent to idle streams, to notice disconnects
+
+class Subscriber:
+    """One open dashboard stream: a bounded queue of messages and whose students it wants."""
+
+    def __init__(self, teacher_id: Optional[int], size: int):
+        self.teacher_id = teacher_id  # None = every student
+        self.student_ids: Optional[FrozenSet[int]] = None
+        self.queue: queue.Queue = queue.Queue(maxsize=size)
+        self.needs_snapshot = True
+        self.resyncs = 0
+
+    def wants(self, user_id: int) -> bool:
+        return self.student_ids is None or user_id in self.student_ids
+
+class StudentUpdateHub:
+    """Computes the active-students view once and fans out the changes.
+
+    One producer thread builds the snapshot (presence tracker plus one
+    get_recent_activity query) every LIVE_UPDATE_INTERVAL seconds, or
+    sooner, at most every LIVE_UPDATE_MIN_GAP, when notify() reports a new
+    answer. Each subscriber gets only the students in its teacher's
+    classes (from the ClassPresenceIndex rosters), and only what changed
+    since the last message: {"changed": [...], "removed": [ids],
+    "snapshot": false}. A new subscriber's first message is a full snapshot
+    ("snapshot": true), sent once the producer has built one. A subscriber whose queue fills up (a stalled tab) loses its backlog and gets a full snapshot
+    ("snapshot": true) instead, so a slow consumer never holds up the
+    others or grows memory.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()  # Guards subscribers and the last snapshot
+        self._subscribers: List[Subscriber] = []
+        self._snapshot: Optional[Dict[int, Dict]] = None  # None until the first publish
+        self._wake = threading.Event()
+        self._producer: Optional[threading.Thread] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.interval = app.config.get('LIVE_UPDATE_INTERVAL', DEFAULT_INTERVAL)
+        self.min_gap = app.config.get('LIVE_UPDATE_MIN_GAP', DEFAULT_MIN_GAP)
+        self.queue_size = app.config.get('LIVE_UPDATE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        app.extensions['student_updates'] = self
+
+    def subscribe(self, teacher_id: Optional[int]) -> Subscriber:
+        """Stream the students of teacher_id's classes (None: everyone)."""
+        subscriber = Subscriber(teacher_id, self.queue_size)
+        if teacher_id is not None:
+            subscriber.student_ids = get_class_presence().students_of(teacher_id)
+        with self._lock:
+            self._subscribers.append(subscriber)
+            # Before the first publish there is nothing to show; that publish sends the snapshot
+            if self._snapshot is not None:
+                self._send(subscriber, self._snapshot, [], [])
+        self._wake.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def notify(self) -> None:
+        """A student did something; refresh sooner than the interval."""
+        if self._subscribers:
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._producer is not None:
+            return
+        with self._lock:
+            if self._producer is None:
+                # A green thread once eventlet has monkey patched threading
+                self._producer = threading.Thread(target=self._run, name='student-updates', daemon=True)
+                self._producer.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._subscribers:
+                try:
+                    with self.app.app_context(), replica_reads():
+                        self.publish()
+                        db.session.remove()
+                except Exception:
+                    logger.exception("Active students update failed")
+            time.sleep(self.min_gap)
+
+    def build_snapshot(self) -> Dict[int, Dict]:
+        sessions = get_presence_tracker().active()
+        recent = ProgressService.get_recent_activity([session.user_id for session in sessions])
+        snapshot = {}
+        for session in sessions:
+            activity = recent.get(session.user_id)
+            snapshot[session.user_id] = {
+                'user_id': session.user_id,
+                'username': session.username,
+                'last_active': session.last_active.isoformat(),
+                'activity_type': session.activity_type,
+                'details': session.details,
+                'accuracy': activity.accuracy if activity else 0
+            }
+        return snapshot
+
+    def publish(self) -> None:
+        """Build a snapshot and send each subscriber its share of the changes."""
+        snapshot = self.build_snapshot()
+        index = get_class_presence()
+        with self._lock:
+            previous, self._snapshot = self._snapshot or {}, snapshot
+            changed = [entry for user_id, entry in snapshot.items() if previous.get(user_id) != entry]
+            removed = [user_id for user_id in previous if user_id not in snapshot]
+            for subscriber in self._subscribers:
+                if subscriber.teacher_id is not None:
+                    # Cached per roster load, so this is a lookup unless a class changed
+                    subscriber.student_ids = index.students_of(subscriber.teacher_id)
+                self._send(subscriber, snapshot, changed, removed)
+
+    @staticmethod
+    def _send(subscriber: Subscriber, snapshot: Dict[int, Dict], changed: List[Dict], removed: List[int]) -> None:
+        if subscriber.needs_snapshot:
+            message = {'snapshot': True, 'removed': [],
+                       'changed': [entry for user_id, entry in snapshot.items() if subscriber.wants(user_id)]}
+        else:
+            message = {'snapshot': False,
+                       'changed': [entry for entry in changed if subscriber.wants(entry['user_id'])],
+                       'removed': [user_id for user_id in removed if subscriber.wants(user_id)]}
+            if not message['changed'] and not message['removed']:
+                return
+        try:
+            subscriber.queue.put_nowait(message)
+        except queue.Full:
+            # Too far behind for diffs to be worth keeping; start it over from a snapshot
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.resyncs += 1
+            subscriber.needs_snapshot = True
+            StudentUpdateHub._send(subscriber, snapshot, changed, removed)
+            return
+        subscriber.needs_snapshot = False
+
+    def stream(self, subscriber: Subscriber):
+        """SSE lines for a subscriber until the client goes away."""
+        try:
+            while True:
+                try:
+                    message = subscriber.queue.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(message)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+def get_student_updates() -> StudentUpdateHub:
+    return current_app.extensions['student_updates']
@@ -0,0 +1,233 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from flask import g, has_request_context
+from database import db
+from models.attempt_window import WINDOW_SIZE, RecentWindow, get_recent_window
+from models.user_fact_stat import UserFactStat
+from services.attempt_buffer import pending_attempts
+from utils.fact_catalog import COMMUTATIVE_OPERATIONS, fact_problem
+from utils.fact_universe import get_fact_universe
+from utils.math_problems import LEVEL_REGISTRY
+import logging
+
+logger = logging.getLogger(__name__)
+
+LevelKey = Tuple[str, int]  # (operation, level)
+
+# Highest level each operation serves; operations without levels (e.g. division) cap at 12
+MAX_LEVELS = {}
+for _operation, _level in LEVEL_REGISTRY:
+    MAX_LEVELS[_operation] = max(MAX_LEVELS.get(_operation, _level), _level)
+DEFAULT_MAX_LEVEL = 12
+
+class LevelState(NamedTuple):
+    """Everything level decisions read for one (user, operation, level)."""
+    window: RecentWindow
+    problem_stats: Dict[str, Dict]  # problem -> attempts/correct/total_time/accuracy/avg_time
+
+class LevelDecision(NamedTuple):
+    """Outcome of evaluating a student at one level.
+
+    should_change/new_level is the step the recent window calls for (up on
+    fast, accurate work, down on poor accuracy). mastered is the stricter
+    test for moving on from practice: a full window that meets the level-up
+    bar plus every required fact mastered.
+    """
+    should_change: bool
+    new_level: int
+    mastered: bool
+    accuracy: float
+    avg_time: float
+
+class MasteryEngine:
+    """The one place level and fact mastery are decided.
+
+    An engine memoizes what it fetches and decides, so it should live no
+    longer than one request (see get_mastery_engine). Call invalidate()
+    after writing attempts that an already-evaluated level should see.
+    """
+    # Fact mastery
+    MIN_ATTEMPTS = 3          # Minimum attempts before considering a fact mastered
+    MASTERY_THRESHOLD = 0.8   # 80% accuracy on a fact
+    DAYS_TO_LOOK_BACK = 7     # Only facts practiced in the last week count
+    MIN_MASTERED_FACTS = 10   # Facts a non-multiplication level needs mastered
+
+    # Level changes
+    LEVEL_UP_ACCURACY = 0.9   # 90% of recent answers correct
+    LEVEL_UP_TIME = 5.0       # Average correct answer under 5 seconds
+    LEVEL_DOWN_ACCURACY = 0.7  # Below 70% drops a level
+    RECENT_ATTEMPTS_TO_CHECK = WINDOW_SIZE  # A level can only be mastered on a full window
+
+    def __init__(self, db_session=None):
+        self.db_session = db_session if db_session is not None else db.session
+        self._states: Dict[Tuple[int, str, int], LevelState] = {}
+        self._decisions: Dict[Tuple[int, str, int], LevelDecision] = {}
+        self.fetches = 0  # Fact-stat queries issued, for callers measuring query budgets
+
+    @classmethod
+    def is_fact_mastered(cls, stats: Dict) -> bool:
+        """Check if a single fact has been mastered."""
+        return stats['attempts'] >= cls.MIN_ATTEMPTS and stats['accuracy'] >= cls.MASTERY_THRESHOLD
+
+    @staticmethod
+    def max_level(operation: str) -> int:
+        return MAX_LEVELS.get(operation, DEFAULT_MAX_LEVEL)
+
+    def load(self, user_id: int, keys: Iterable[LevelKey]) -> None:
+        """Fetch the state of several levels at once.
+
+        Fact stats for every level not already memoized come back in one
+        query (UserFactStat.level_totals); windows come from the process
+        mirror in models.attempt_window. The user's attempts still waiting
+        in the write-behind buffer are folded in on top.
+        """
+        missing = list(dict.fromkeys(
+            (operation, level) for operation, level in keys
+            if (user_id, operation, level) not in self._states
+        ))
+        if not missing:
+            return
+
+        week_ago = datetime.utcnow() - timedelta(days=self.DAYS_TO_LOOK_BACK)
+        totals = UserFactStat.level_totals(self.db_session, user_id, missing, since=week_ago)
+        self.fetches += 1
+
+        stats: Dict[LevelKey, Dict[str, Dict]] = {
+            key: {
+                problem: {
+                    'attempts': fact['attempts'],
+                    'correct': fact['correct'],
+                    'total_time': fact['time_sum'],
+                    'accuracy': fact['correct'] / fact['attempts'],
+                    'avg_time': fact['time_sum'] / fact['attempts']
+                }
+                for problem, fact in facts.items()
+            }
+            for key, facts in totals.items()
+        }
+        pending = pending_attempts(user_id)
+        for operation, level in missing:
+            window = get_recent_window(self.db_session, user_id, operation, level)
+            if pending:
+                window = self._apply_pending(operation, level, window, stats[(operation, level)], pending)
+            self._states[(user_id, operation, level)] = LevelState(window, stats[(operation, level)])
+
+    @staticmethod
+    def _apply_pending(operation: str, level: int, window: RecentWindow,
+                       problem_stats: Dict[str, Dict], pending: List[Dict]) -> RecentWindow:
+        """Fold buffered, not yet written attempts into a level's state (read-your-writes).
+
+        Mirrors what the flush will do: same-level attempts push the window;
+        fact stats count them the way UserFactStat.level_totals would.
+        """
+        universe = get_fact_universe(operation, level) if operation in COMMUTATIVE_OPERATIONS else None
+        problems = dict(zip(universe.fact_ids, universe.problems)) if universe is not None else None
+        pushed = None
+        for attempt in pending:
+            if attempt['operation'] != operation:
+                continue
+            if attempt['level'] == level:
+                pushed = pushed or window.copy()
+                pushed.push(attempt['is_correct'], attempt['time_taken'])
+            fact = attempt['fact_id']
+            if fact is None:
+                continue
+            if problems is not None:
+                problem = problems.get(fact)
+            elif attempt['level'] == level:
+                problem = fact_problem(fact)
+            else:
+                continue
+            if problem is None:
+                continue
+            time_taken = attempt['time_taken'] or 0.0
+            stats = problem_stats.get(problem) or {'attempts': 0, 'correct': 0, 'total_time': 0.0}
+            stats['attempts'] += 1
+            stats['correct'] += 1 if attempt['is_correct'] else 0
+            stats['total_time'] += time_taken
+            stats['accuracy'] = stats['correct'] / stats['attempts']
+            stats['avg_time'] = stats['total_time'] / stats['attempts']
+            problem_stats[problem] = stats
+        return pushed or window
+
+    def state(self, user_id: int, operation: str, level: int) -> LevelState:
+        key = (user_id, operation, level)
+        if key not in self._states:
+            self.load(user_id, [(operation, level)])
+        return self._states[key]
+
+    def decide(self, user_id: int, operation: str, level: int) -> LevelDecision:
+        """Evaluate a student at a level, at most once per engine."""
+        key = (user_id, operation, level)
+        decision = self._decisions.get(key)
+        if decision is None:
+            decision = self._decisions[key] = self._evaluate(operation, level, self.state(*key))
+        return decision
+
+    def invalidate(self, user_id: int, operation: Optional[str] = None, level: Optional[int] = None) -> None:
+        """Forget memoized state for a user (optionally just one operation/level)."""
+        for memo in (self._states, self._decisions):
+            for key in [k for k in memo if k[0] == user_id
+                        and (operation is None or k[1] == operation)
+                        and (level is None or k[2] == level)]:
+                del memo[key]
+
+    def mastered_fact_count(self, operation: str, level: int, problem_stats: Dict[str, Dict]) -> int:
+        """Count mastered facts, restricted to the level's facts when it has a fixed set."""
+        universe = get_fact_universe(operation, level)
+        return sum(1 for problem, stats in problem_stats.items()
+                   if (universe is None or problem in universe.index) and self.is_fact_mastered(stats))
+
+    def _facts_mastered(self, operation: str, level: int, problem_stats: Dict[str, Dict]) -> bool:
+        universe = get_fact_universe(operation, level)
+        if operation == 'multiplication' and universe is not None:
+            # Every fact in the table, e.g. 7 × 0 through 7 × 12
+            for problem in universe.problems:
+                stats = problem_stats.get(problem)
+                if stats is None or not self.is_fact_mastered(stats):
+                    logger.debug(f"{problem} is not yet mastered")
+                    return False
+            return True
+        required = self.MIN_MASTERED_FACTS
+        if universe is not None:
+            required = min(required, len(universe.problems))
+        return self.mastered_fact_count(operation, level, problem_stats) >= required
+
+    def _evaluate(self, operation: str, level: int, state: LevelState) -> LevelDecision:
+        window = state.window
+        if not window.count:
+            return LevelDecision(False, level, False, 0, float('inf'))
+
+        accuracy = window.accuracy
+        avg_time = window.avg_correct_time
+        fast_and_accurate = accuracy >= self.LEVEL_UP_ACCURACY and avg_time < self.LEVEL_UP_TIME
+
+        if fast_and_accurate:
+            new_level = min(level + 1, self.max_level(operation))
+        elif accuracy < self.LEVEL_DOWN_ACCURACY and level > 1:
+            new_level = level - 1
+        else:
+            new_level = level
+
+        mastered = (fast_and_accurate and window.count >= self.RECENT_ATTEMPTS_TO_CHECK
+                    and self._facts_mastered(operation, level, state.problem_stats))
+        logger.debug(f"{operation} level {level}: accuracy={accuracy:.1%}, "
+                     f"avg_time={avg_time:.1f}s, new_level={new_level}, mastered={mastered}")
+        return LevelDecision(new_level != level, new_level, mastered, accuracy, avg_time)
+
+def get_mastery_engine() -> MasteryEngine:
+    """Get the current request's engine.
+
+    create_app drops it on request teardown. Outside a request (CLI, tests
+    holding an app context) every call gets a fresh engine, so nothing is
+    memoized across callers.
+    """
+    if not has_request_context():
+        return MasteryEngine()
+    engine = g.get('mastery_engine')
+    if engine is None:
+        engine = g.mastery_engine = MasteryEngine()
+    return engine
+
+def drop_mastery_engine(exc=None) -> None:
+    g.pop('mastery_engine', None)
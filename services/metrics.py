@@ -0,0 +1,287 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Each worker process keeps its own counters; scrape every worker (or
+aggregate on the Prometheus side) for the whole picture. Nothing here
+talks to an external service.
+"""
+import math
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from database import db
+from services.query_budget import event_budget
+import logging
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """A named family of series, one per combination of label values."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(suffix, formatted labels, value) triples for the exposition."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{self.name}{suffix}{labels} {_format_value(value)}'
+                     for suffix, labels, value in self.samples())
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', _format_labels(self.label_names, key), value) for key, value in items]
+
+class Gauge(Metric):
+    """A gauge read when scraped: collect() returns {label values: value}."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect() if self.collect is not None else {}
+        return [('', _format_labels(self.label_names, key), value) for key, value in sorted(values.items())]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelValues, List] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0
+
+    def sum(self, **labels) -> float:
+        series = self._series.get(self._key(labels))
+        return series[-2] if series else 0.0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        samples = []
+        for key, series in items:
+            for bound, cumulative in zip(self.buckets, series):
+                labels = _format_labels(self.label_names + ('le',), key + (_format_value(bound),))
+                samples.append(('_bucket', labels, cumulative))
+            labels = _format_labels(self.label_names, key)
+            samples.append(('_sum', labels, series[-2]))
+            samples.append(('_count', labels, series[-1]))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception(f"Collecting metric {metric.name} failed")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Time to handle a request, by endpoint.',
+    ['endpoint', 'method', 'status']))
+REQUEST_STATEMENTS = REGISTRY.register(Histogram(
+    'http_request_db_statements', 'SQL statements executed per request, by endpoint.',
+    ['endpoint'], buckets=STATEMENT_BUCKETS))
+REQUEST_DB_TIME = REGISTRY.register(Histogram(
+    'http_request_db_seconds', 'Time spent in SQL per request, by endpoint.', ['endpoint']))
+DB_STATEMENTS = REGISTRY.register(Counter(
+    'db_statements_total', 'SQL statements executed.', ['engine']))
+DB_TIME = REGISTRY.register(Counter(
+    'db_statement_seconds_total', 'Time spent executing SQL statements.', ['engine']))
+SOCKET_EVENTS = REGISTRY.register(Counter(
+    'socketio_events_total', 'Socket.IO events handled, by event and outcome.', ['event', 'outcome']))
+SOCKET_LATENCY = REGISTRY.register(Histogram(
+    'socketio_handler_duration_seconds', 'Time spent in Socket.IO event handlers.', ['event']))
+JOB_RUNS = REGISTRY.register(Counter(
+    'scheduler_job_runs_total', 'Scheduled job runs, by job and outcome (ok, error, skipped).', ['job', 'outcome']))
+JOB_DURATION = REGISTRY.register(Histogram(
+    'scheduler_job_duration_seconds', 'Time a scheduled job took to run.', ['job'], buckets=JOB_BUCKETS))
+JOB_ROWS = REGISTRY.register(Counter(
+    'scheduler_job_rows_total', 'Rows deleted or written by scheduled jobs.', ['job']))
+
+_engines: Dict[str, Engine] = {}  # Pools reported by the pool gauges, by name
+
+def _engine_name(engine: Engine) -> str:
+    for name, known in _engines.items():
+        if known is engine:
+            return name
+    return 'other'
+
+def _pool_stats() -> Dict[str, Dict[LabelValues, float]]:
+    stats = {'size': {}, 'checked_out': {}, 'overflow': {}, 'saturation': {}}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        key = (name,)
+        stats['checked_out'][key] = pool.checkedout()
+        if hasattr(pool, 'size') and hasattr(pool, 'overflow'):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            stats['size'][key] = pool.size()
+            stats['overflow'][key] = max(pool.overflow(), 0)
+            stats['saturation'][key] = pool.checkedout() / capacity if capacity else 0.0
+    return stats
+
+for _stat, _doc in [('size', 'Connections the pool keeps open.'),
+                    ('checked_out', 'Connections currently checked out of the pool.'),
+                    ('overflow', 'Connections open beyond the pool size.'),
+                    ('saturation', 'Checked-out connections as a fraction of size plus max overflow.')]:
+    REGISTRY.register(Gauge(f'db_pool_{_stat}', _doc, ['engine'],
+                            collect=lambda stat=_stat: _pool_stats()[stat]))
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_started'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    engine = _engine_name(conn.engine)
+    DB_STATEMENTS.inc(engine=engine)
+    DB_TIME.inc(elapsed, engine=engine)
+    if has_request_context() and 'metrics_started' in g:
+        g.metrics_statements += 1
+        g.metrics_db_time += elapsed
+
+def observe_socket_event(name: str):
+    """Count, time and budget a Socket.IO handler; put it under @socketio.on(name)."""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                with event_budget(name):
+                    result = handler(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                SOCKET_LATENCY.observe(time.perf_counter() - started, event=name)
+                SOCKET_EVENTS.inc(event=name, outcome=outcome)
+        return wrapper
+    return decorator
+
+def _start_request() -> None:
+    g.metrics_started = time.perf_counter()
+    g.metrics_statements = 0
+    g.metrics_db_time = 0.0
+
+def _record_request(status: int) -> None:
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    endpoint = request.endpoint or 'unmatched'  # Unrouted URLs share one series
+    REQUEST_LATENCY.observe(time.perf_counter() - started,
+                            endpoint=endpoint, method=request.method, status=status)
+    REQUEST_STATEMENTS.observe(g.metrics_statements, endpoint=endpoint)
+    REQUEST_DB_TIME.observe(g.metrics_db_time, endpoint=endpoint)
+
+def _after_request(response):
+    _record_request(response.status_code)
+    return response
+
+def _teardown_request(exc=None) -> None:
+    # Only still pending when an exception skipped after_request
+    _record_request(500)
+
+class Metrics:
+    """Wires request timing and pool gauges into an app; see REGISTRY.render()."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        app.extensions['metrics'] = self
+        # Runs before the other before_request hooks so they are timed too
+        app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
+        with app.app_context():
+            _engines['primary'] = db.engine
+            replica = app.extensions.get('read_replica')
+            if replica is not None and replica.engine is not None:
+                _engines['replica'] = replica.engine
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,285 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+from flask import current_app
+from sqlalchemy import bindparam, case, func, insert, select, update
+from database import db
+from models.active_session import ActiveSession
+from models.class_ import Class, student_class, teacher_class
+from models.user import User
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 30     # Longest a heartbeat waits before it is written
+DEFAULT_SNAPSHOT_SECONDS = 1   # How long views share one presence snapshot
+DEFAULT_ROSTER_SECONDS = 60    # How long class rosters are trusted without a local change
+
+class Presence(NamedTuple):
+    """What the active-students views show for one user."""
+    user_id: int
+    username: str
+    last_active: datetime
+    activity_type: Optional[str]
+    details: Optional[str]
+
+class PresenceSnapshot(NamedTuple):
+    """Everyone active at one moment, shared by all views until it expires."""
+    sessions: List[Presence]  # Most recent first
+    active_ids: FrozenSet[int]
+    taken_at: float
+
+class PresenceTracker:
+    """In-memory "who is online and doing what", backed by active_session.
+
+    Heartbeats only touch memory. Every PRESENCE_FLUSH_SECONDS the next
+    heartbeat writes everything that changed since the last flush: one bulk
+    UPDATE of the users' active_session rows (and one INSERT for users who
+    don't have one yet), so a user is written at most once per interval
+    however many requests they make.
+
+    The same flush reloads the recently active rows, which is how this
+    process sees students whose requests land on another worker; those are
+    at most one interval stale, while heartbeats seen here are current.
+
+    Readers share one PresenceSnapshot for PRESENCE_SNAPSHOT_SECONDS. A
+    heartbeat that only moves last_active rides on the current snapshot;
+    one that brings a user online or changes their activity ends it.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()        # Guards the dicts below
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._local: Dict[int, Presence] = {}    # Heartbeats seen by this process
+        self._stored: Dict[int, Presence] = {}   # active_session as of the last reload
+        self._dirty = set()
+        self._snapshot: Optional[PresenceSnapshot] = None
+        self._flushed_at = time.monotonic()
+        self._loaded = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.flush_interval = app.config.get('PRESENCE_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+        self.snapshot_ttl = app.config.get('PRESENCE_SNAPSHOT_SECONDS', DEFAULT_SNAPSHOT_SECONDS)
+        app.extensions['presence'] = self
+        if not app.testing:
+            # Don't lose the last interval of heartbeats on worker shutdown
+            atexit.register(self.close)
+
+    def heartbeat(self, user, activity_type: Optional[str] = None, details: Optional[str] = None) -> None:
+        """Mark a user active now; activity_type/details replace the current ones when given."""
+        with self._lock:
+            previous = self._local.get(user.id) or self._stored.get(user.id)
+            if activity_type is None and previous is not None:
+                activity_type, details = previous.activity_type, previous.details
+            self._local[user.id] = Presence(user.id, user.username, datetime.utcnow(), activity_type, details)
+            self._dirty.add(user.id)
+            snapshot = self._snapshot
+            if snapshot is not None and (user.id not in snapshot.active_ids or previous is None
+                                         or (previous.activity_type, previous.details) != (activity_type, details)):
+                self._snapshot = None
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush(blocking=False)
+
+    def forget(self, user_id: int) -> None:
+        """Drop a user (e.g. deleted) so the next flush doesn't recreate their row."""
+        with self._lock:
+            self._local.pop(user_id, None)
+            self._stored.pop(user_id, None)
+            self._dirty.discard(user_id)
+            self._snapshot = None
+
+    def snapshot(self) -> PresenceSnapshot:
+        """Users active within ActiveSession.INACTIVE_THRESHOLD minutes."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.taken_at < self.snapshot_ttl:
+            return snapshot
+        if not self._loaded:
+            self.flush()
+        cutoff = datetime.utcnow() - timedelta(minutes=ActiveSession.INACTIVE_THRESHOLD)
+        with self._lock:
+            latest = dict(self._stored)
+            for user_id, presence in self._local.items():
+                if user_id not in latest or presence.last_active >= latest[user_id].last_active:
+                    latest[user_id] = presence
+            sessions = sorted((p for p in latest.values() if p.last_active >= cutoff),
+                              key=lambda p: p.last_active, reverse=True)
+            snapshot = PresenceSnapshot(sessions, frozenset(p.user_id for p in sessions), time.monotonic())
+            self._snapshot = snapshot
+        return snapshot
+
+    def active(self) -> List[Presence]:
+        """Active users, most recent first."""
+        return self.snapshot().sessions
+
+    def flush(self, blocking: bool = True) -> int:
+        """Write changed heartbeats and reload active_session. Returns users written.
+
+        With blocking=False, returns 0 straight away if another flush is running.
+        """
+        if not self._flush_lock.acquire(blocking):
+            return 0
+        try:
+            self._flushed_at = time.monotonic()
+            with self._lock:
+                changed = [self._local[user_id] for user_id in self._dirty]
+                self._dirty = set()
+            try:
+                with self.app.app_context(), db.engine.begin() as connection:
+                    deleted = self._write(connection, changed)
+                    stored = self._read(connection)
+            except Exception:
+                logger.exception(f"Presence flush of {len(changed)} users failed; will retry")
+                with self._lock:
+                    self._dirty.update(p.user_id for p in changed if p.user_id in self._local)
+                return 0
+
+            with self._lock:
+                self._stored, self._loaded = stored, True
+                self._snapshot = None
+                # Deleted by a request on another worker, which forgot them only there
+                for user_id in deleted:
+                    self._local.pop(user_id, None)
+                # Anything older than what's stored has nothing left to add
+                for user_id, presence in list(self._local.items()):
+                    if user_id not in self._dirty and user_id in stored \
+                            and stored[user_id].last_active >= presence.last_active:
+                        del self._local[user_id]
+            return len(changed) - len(deleted)
+        finally:
+            self._flush_lock.release()
+
+    def close(self) -> None:
+        """Write whatever heartbeats haven't been flushed yet."""
+        if self._dirty:
+            self.flush()
+
+    @staticmethod
+    def _write(connection, changed: List[Presence]) -> Set[int]:
+        """Upsert the changed users' rows. Returns the ids of users that no longer exist."""
+        if not changed:
+            return set()
+        table, users = ActiveSession.__table__, User.__table__
+        found = connection.execute(
+            select(users.c.id, table.c.user_id)
+            .outerjoin(table, table.c.user_id == users.c.id)
+            .where(users.c.id.in_([p.user_id for p in changed]))
+        ).all()
+        existing = {session_user for _, session_user in found if session_user is not None}
+        deleted = {p.user_id for p in changed} - {user_id for user_id, _ in found}
+        rows = [{'b_user_id': p.user_id, 'b_last_active': p.last_active,
+                 'b_activity_type': p.activity_type, 'b_details': p.details}
+                for p in changed if p.user_id not in deleted]
+        updates = [row for row in rows if row['b_user_id'] in existing]
+        if updates:
+            connection.execute(
+                # A bare heartbeat (None) keeps whatever activity another worker recorded
+                update(table).where(table.c.user_id == bindparam('b_user_id')).values(
+                    last_active=bindparam('b_last_active'),
+                    activity_type=func.coalesce(bindparam('b_activity_type'), table.c.activity_type),
+                    details=case((bindparam('b_activity_type').is_(None), table.c.details),
+                                 else_=bindparam('b_details'))
+                ),
+                updates
+            )
+        inserts = [{'user_id': row['b_user_id'], 'last_active': row['b_last_active'],
+                    'activity_type': row['b_activity_type'], 'details': row['b_details']}
+                   for row in rows if row['b_user_id'] not in existing]
+        if inserts:
+            connection.execute(insert(table), inserts)
+        return deleted
+
+    @staticmethod
+    def _read(connection) -> Dict[int, Presence]:
+        table = ActiveSession.__table__
+        cutoff = datetime.utcnow() - timedelta(minutes=ActiveSession.INACTIVE_THRESHOLD)
+        rows = connection.execute(
+            select(table.c.user_id, User.__table__.c.username, table.c.last_active,
+                   table.c.activity_type, table.c.details)
+            .join(User.__table__, User.__table__.c.id == table.c.user_id)
+            .where(table.c.last_active >= cutoff)
+        )
+        return {row.user_id: Presence(*row) for row in rows}
+
+class Rosters(NamedTuple):
+    students: Dict[int, FrozenSet[int]]      # class id -> student ids
+    classes: Dict[int, Tuple[int, ...]]      # teacher id -> class ids
+    visible: Dict[int, FrozenSet[int]]       # teacher id -> all their students, filled on demand
+    loaded_at: float
+    changes: int                             # Class.roster_changes when loaded
+
+class ClassPresenceIndex:
+    """Which of a teacher's students are online, class by class.
+
+    Class rosters (student_class and teacher_class) are held in memory and
+    reloaded, two queries in all, when this process changes a class or
+    after CLASS_ROSTER_SECONDS (for changes made by other workers). A
+    teacher's view is then one set intersection per class against the
+    shared presence snapshot; no query per student or per session.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._rosters: Optional[Rosters] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.tracker = app.extensions['presence']
+        self.ttl = app.config.get('CLASS_ROSTER_SECONDS', DEFAULT_ROSTER_SECONDS)
+        app.extensions['class_presence'] = self
+
+    def rosters(self) -> Rosters:
+        rosters = self._rosters
+        if rosters is not None and rosters.changes == Class.roster_changes \
+                and time.monotonic() - rosters.loaded_at < self.ttl:
+            return rosters
+        with self._lock:
+            changes = Class.roster_changes
+            students, classes = {}, {}
+            for class_id, student_id in db.session.execute(
+                    select(student_class.c.class_id, student_class.c.student_id)):
+                students.setdefault(class_id, set()).add(student_id)
+            for teacher_id, class_id in db.session.execute(
+                    select(teacher_class.c.teacher_id, teacher_class.c.class_id)):
+                classes.setdefault(teacher_id, []).append(class_id)
+            rosters = Rosters({class_id: frozenset(ids) for class_id, ids in students.items()},
+                              {teacher_id: tuple(ids) for teacher_id, ids in classes.items()},
+                              {}, time.monotonic(), changes)
+            self._rosters = rosters
+        return rosters
+
+    def active_by_class(self, teacher_id: int,
+                        snapshot: Optional[PresenceSnapshot] = None) -> Dict[int, FrozenSet[int]]:
+        """Active students of each of the teacher's classes."""
+        rosters = self.rosters()
+        active = (snapshot or self.tracker.snapshot()).active_ids
+        return {class_id: rosters.students.get(class_id, frozenset()) & active
+                for class_id in rosters.classes.get(teacher_id, ())}
+
+    def students_of(self, teacher_id: int) -> FrozenSet[int]:
+        """Everyone in any of the teacher's classes."""
+        rosters = self.rosters()
+        visible = rosters.visible.get(teacher_id)
+        if visible is None:
+            visible = frozenset().union(*(rosters.students.get(class_id, frozenset())
+                                          for class_id in rosters.classes.get(teacher_id, ())))
+            rosters.visible[teacher_id] = visible
+        return visible
+
+    def active_for(self, teacher_id: int) -> List[Presence]:
+        """The teacher's active students, most recent first."""
+        snapshot = self.tracker.snapshot()
+        active = frozenset().union(*self.active_by_class(teacher_id, snapshot).values())
+        return [session for session in snapshot.sessions if session.user_id in active]
+
+def get_presence_tracker() -> PresenceTracker:
+    return current_app.extensions['presence']
+
+def get_class_presence() -> ClassPresenceIndex:
+    return current_app.extensions['class_presence']
@@ -1,79 +1,227 @@
 from models.practice_attempt import PracticeAttempt
-from typing import Dict, List, Optional, Tuple
+from models.user_fact_stat import UserFactStat
+from services.mastery_engine import MasteryEngine, get_mastery_engine
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from utils.math_problems import get_problem
+from sqlalchemy import case, func, literal
+from database import db, read_from_replica
+from utils.math_problems import get_level_description
+from utils.fact_catalog import OPERAND_BITS, OPERAND_MASK, fact_problem, operation_fact_range
+
+TABLE_SIZE = 13  # Multiplication table covers 0-12
+
+class MultiplicationTableStats(NamedTuple):
+    """Per-fact totals for the multiplication table, each a TABLE_SIZE×TABLE_SIZE array."""
+    attempts: np.ndarray
+    correct: np.ndarray
+    time_sum: np.ndarray
+    accuracy: np.ndarray      # Percent, 0 where unattempted
+    average_time: np.ndarray  # Seconds over timed attempts, 0 where none were timed
+
+class RecentActivity(NamedTuple):
+    """A student's last few attempts, summarized for the teacher dashboard."""
+    attempts: int
+    correct: int
+    accuracy: float                  # Percent, 0 with no attempts
+    recent_operation: Optional[str]  # Operation of the newest attempt
 
 class ProgressService:
     # Constants for mastery levels
     MIN_ATTEMPTS = 3
     MASTERY_THRESHOLD = 0.8  # 80%
     LEARNING_THRESHOLD = 0.6  # 60%
-    LEVEL_UP_ACCURACY = 0.9   # 90%
-    LEVEL_UP_TIME = 5.0       # 5 seconds
-    LEVEL_DOWN_ACCURACY = 0.7  # 70%
+    LEVEL_UP_ACCURACY = MasteryEngine.LEVEL_UP_ACCURACY
+    LEVEL_UP_TIME = MasteryEngine.LEVEL_UP_TIME
+    LEVEL_DOWN_ACCURACY = MasteryEngine.LEVEL_DOWN_ACCURACY
 
     @staticmethod
+    @read_from_replica
     def get_student_stats(student_id: int, operation: Optional[str] = None) -> Dict:
-        """Calculate comprehensive statistics for a student's practice attempts"""
-        # Get attempts for the specified operation
-        query = PracticeAttempt.query.filter_by(user_id=student_id)
-        if operation:
-            query = query.filter_by(operation=operation)
-        attempts = query.all()
-        
-        if not attempts:
-            return {
-                'total_attempts': 0,
-                'accuracy': 0,
-                'current_streak': 0,
-                'average_time': 0,
-                'fastest_time': 0,
-                'levels': {}
-            }
-        
-        # Calculate basic stats
-        total_attempts = len(attempts)
-        correct_attempts = len([a for a in attempts if a.is_correct])
-        accuracy = (correct_attempts / total_attempts * 100)
-        
-        # Calculate streak
-        current_streak = 0
-        for attempt in reversed(attempts):
-            if attempt.is_correct:
-                current_streak += 1
-            else:
-                break
+        """Calculate comprehensive statistics for a student's practice attempts
         
-        # Calculate timing stats
-        correct_times = [a.time_taken for a in attempts if a.is_correct and a.time_taken is not None]
-        avg_time = sum(correct_times) / len(correct_times) if correct_times else 0
-        fastest_time = min(correct_times) if correct_times else 0
+        With no operation, levels of every operation are combined.
+        """
+        if operation:
+            return ProgressService.get_all_student_stats(student_id, [operation]).get(
+                operation, ProgressService._empty_stats()
+            )
+        rows = ProgressService._level_totals(student_id).all()
+        streak = ProgressService.get_current_streaks(student_id, per_operation=False).get(None, 0)
+        return ProgressService._summarize(rows, streak, None)
+
+    @staticmethod
+    @read_from_replica
+    def get_all_student_stats(student_id: int, operations: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """get_student_stats for several operations at once.
         
-        # Calculate level stats
-        level_stats = {}
-        for level in set(a.level for a in attempts):
-            level_attempts = [a for a in attempts if a.level == level]
-            problem = get_problem(operation, level) if operation else None
-            description = problem['description'] if problem else f"Level {level}"
-            level_stats[str(level)] = ProgressService.calculate_level_stats(level_attempts, description)
+        Two aggregate queries regardless of how much the student has practiced:
+        per-(operation, level) totals and per-operation streaks. Operations the
+        student hasn't practiced are left out.
+        """
+        rows_by_operation: Dict[str, List] = {}
+        for row in ProgressService._level_totals(student_id, operations):
+            rows_by_operation.setdefault(row.operation, []).append(row)
+        if not rows_by_operation:
+            return {}
+        streaks = ProgressService.get_current_streaks(student_id, list(rows_by_operation))
+        return {
+            operation: ProgressService._summarize(rows, streaks.get(operation, 0), operation)
+            for operation, rows in rows_by_operation.items()
+        }
+
+    @staticmethod
+    @read_from_replica
+    def get_level_stats(student_id: int, operation: str, level: int) -> Optional[Dict]:
+        """Aggregate stats for one level in the shape of calculate_level_stats, or None if unpracticed"""
+        row = ProgressService._level_totals(student_id, [operation]).filter(
+            PracticeAttempt.level == level
+        ).first()
+        if row is None:
+            return None
+        return ProgressService.level_stats_from_totals(
+            row.attempts, row.correct, row.time_sum, row.timed,
+            get_level_description(operation, level)
+        )
+
+    @staticmethod
+    @read_from_replica
+    def get_current_streaks(student_id: int, operations: Optional[List[str]] = None,
+                            per_operation: bool = True) -> Dict[Optional[str], int]:
+        """Count correct answers since each operation's most recent miss.
         
+        A running count of misses, newest attempt first, is zero exactly for
+        the current streak. Keyed by operation, or None when per_operation is False.
+        """
+        misses_so_far = func.sum(case((PracticeAttempt.is_correct, 0), else_=1)).over(
+            partition_by=PracticeAttempt.operation if per_operation else None,
+            order_by=(PracticeAttempt.created_at.desc(), PracticeAttempt.id.desc()),
+            rows=(None, 0)
+        )
+        recent = db.session.query(
+            PracticeAttempt.operation.label('operation'),
+            misses_so_far.label('misses')
+        ).filter(PracticeAttempt.user_id == student_id)
+        if operations:
+            recent = recent.filter(PracticeAttempt.operation.in_(operations))
+        recent = recent.subquery()
+
+        key = recent.c.operation if per_operation else literal(None)
+        rows = db.session.query(key.label('operation'), func.count()).filter(
+            recent.c.misses == 0
+        ).group_by(key).all()
+        return {operation: streak for operation, streak in rows}
+
+    @staticmethod
+    @read_from_replica
+    def get_recent_activity(student_ids: List[int], limit: int = 20) -> Dict[int, RecentActivity]:
+        """Summarize each student's last `limit` attempts, all students in one query.
+
+        ROW_NUMBER() OVER (PARTITION BY user_id) numbers each student's
+        attempts newest first; only rows numbered up to `limit` are
+        aggregated. Students without attempts get no entry.
+        """
+        if not student_ids:
+            return {}
+        position = func.row_number().over(
+            partition_by=PracticeAttempt.user_id,
+            order_by=(PracticeAttempt.created_at.desc(), PracticeAttempt.id.desc())
+        )
+        numbered = db.session.query(
+            PracticeAttempt.user_id.label('user_id'),
+            PracticeAttempt.operation.label('operation'),
+            PracticeAttempt.is_correct.label('is_correct'),
+            position.label('position')
+        ).filter(PracticeAttempt.user_id.in_(student_ids)).subquery()
+
+        rows = db.session.query(
+            numbered.c.user_id,
+            func.count(),
+            func.sum(case((numbered.c.is_correct, 1), else_=0)),
+            func.max(case((numbered.c.position == 1, numbered.c.operation)))
+        ).filter(numbered.c.position <= limit).group_by(numbered.c.user_id).all()
+        return {
+            user_id: RecentActivity(attempts, correct, correct / attempts * 100, operation)
+            for user_id, attempts, correct, operation in rows
+        }
+
+    @staticmethod
+    def _level_totals(student_id: int, operations: Optional[List[str]] = None):
+        """Query of per-(operation, level) totals for a student's attempts."""
+        correct_time = case((PracticeAttempt.is_correct, PracticeAttempt.time_taken))
+        query = db.session.query(
+            PracticeAttempt.operation,
+            PracticeAttempt.level,
+            func.count().label('attempts'),
+            func.sum(case((PracticeAttempt.is_correct, 1), else_=0)).label('correct'),
+            func.coalesce(func.sum(PracticeAttempt.time_taken), 0.0).label('time_sum'),
+            func.count(PracticeAttempt.time_taken).label('timed'),
+            func.coalesce(func.sum(correct_time), 0.0).label('correct_time_sum'),
+            func.count(correct_time).label('correct_timed'),
+            func.min(correct_time).label('fastest_time')
+        ).filter(PracticeAttempt.user_id == student_id)
+        if operations:
+            query = query.filter(PracticeAttempt.operation.in_(operations))
+        return query.group_by(PracticeAttempt.operation, PracticeAttempt.level)
+
+    @staticmethod
+    def _empty_stats() -> Dict:
+        return {
+            'total_attempts': 0,
+            'accuracy': 0,
+            'current_streak': 0,
+            'average_time': 0,
+            'fastest_time': 0,
+            'levels': {}
+        }
+
+    @staticmethod
+    def _summarize(rows: List, current_streak: int, operation: Optional[str]) -> Dict:
+        """Fold _level_totals rows into the get_student_stats shape."""
+        if not rows:
+            return ProgressService._empty_stats()
+
+        # Combine rows sharing a level (only happens across operations)
+        levels: Dict[int, List[float]] = {}
+        for row in rows:
+            totals = levels.setdefault(row.level, [0, 0, 0.0, 0])
+            totals[0] += row.attempts
+            totals[1] += row.correct
+            totals[2] += row.time_sum
+            totals[3] += row.timed
+
+        total_attempts = sum(row.attempts for row in rows)
+        correct_attempts = sum(row.correct for row in rows)
+        correct_timed = sum(row.correct_timed for row in rows)
+        fastest_times = [row.fastest_time for row in rows if row.fastest_time is not None]
+
         return {
             'total_attempts': total_attempts,
-            'accuracy': accuracy,
+            'accuracy': correct_attempts / total_attempts * 100,
             'current_streak': current_streak,
-            'average_time': avg_time,
-            'fastest_time': fastest_time,
-            'levels': level_stats
+            'average_time': sum(row.correct_time_sum for row in rows) / correct_timed if correct_timed else 0,
+            'fastest_time': min(fastest_times) if fastest_times else 0,
+            'levels': {
+                str(level): ProgressService.level_stats_from_totals(
+                    *totals, get_level_description(operation, level)
+                )
+                for level, totals in levels.items()
+            }
         }
 
     @staticmethod
     def calculate_level_stats(attempts: List[PracticeAttempt], description: str) -> Dict:
         """Calculate detailed statistics for a specific level"""
-        total = len(attempts)
-        correct = len([a for a in attempts if a.is_correct])
         times = [a.time_taken for a in attempts if a.time_taken is not None]
-        avg_time = sum(times) / len(times) if times else 0
+        return ProgressService.level_stats_from_totals(
+            len(attempts), len([a for a in attempts if a.is_correct]), sum(times), len(times), description
+        )
+
+    @staticmethod
+    def level_stats_from_totals(total: int, correct: int, time_sum: float, timed: int,
+                                description: str) -> Dict:
+        """Level stats from counts: attempts, correct answers, and the sum/count of timed attempts"""
+        avg_time = time_sum / timed if timed else 0
         accuracy = (correct / total * 100) if total > 0 else 0
         
         mastery_status = 'needs_practice'
@@ -127,84 +275,102 @@ class ProgressService:
         return problem_stats
 
     @staticmethod
-    def get_multiplication_table_stats(student_id: int) -> Dict:
-        """Get detailed statistics for multiplication table progress"""
-        attempts = PracticeAttempt.query.filter_by(
-            user_id=student_id,
-            operation='multiplication'
-        ).all()
-
-        # Initialize the multiplication table stats
-        table_stats = {}
-        for i in range(13):
-            table_stats[i] = {}
-            for j in range(13):
-                table_stats[i][j] = {
-                    'attempts': 0,
-                    'correct': 0,
-                    'accuracy': 0,
-                    'average_time': 0
-                }
-
-        # Fill in the stats
-        for i in range(1, 13):
-            for j in range(1, 13):
-                problem = f"{i} × {j}"
-                relevant_attempts = [a for a in attempts if a.problem == problem]
-                if relevant_attempts:
-                    correct_count = sum(1 for a in relevant_attempts if a.is_correct)
-                    table_stats[i][j] = {
-                        'attempts': len(relevant_attempts),
-                        'correct': correct_count,
-                        'accuracy': (correct_count / len(relevant_attempts)) * 100,
-                        'average_time': sum(a.time_taken for a in relevant_attempts if a.time_taken is not None) / sum(1 for a in relevant_attempts if a.time_taken is not None) if relevant_attempts else 0
-                    }
-
-        return table_stats
+    @read_from_replica
+    def get_level_problem_stats(student_id: int, operation: str, level: int) -> Dict:
+        """Per-problem statistics for a level, read from the user_fact_stats rollup.
+        
+        Returns the same shape as analyze_level_problems.
+        """
+        facts = UserFactStat.level_totals(db.session, student_id, [(operation, level)])
+        
+        return {
+            problem: {
+                'attempts': fact['attempts'],
+                'correct': fact['correct'],
+                'total_time': fact['time_sum'],
+                'fastest_time': fact['min_time'] or 0,
+                'slowest_time': fact['max_time'] or 0,
+                'accuracy': fact['correct'] / fact['attempts'] * 100,
+                'avg_time': fact['time_sum'] / fact['attempts']
+            }
+            for problem, fact in facts[(operation, level)].items()
+        }
 
     @staticmethod
-    def should_change_level(student_id: int, operation: str, current_level: int) -> Tuple[bool, int]:
-        """Determine if a student should change levels based on recent performance"""
-        recent_attempts = PracticeAttempt.query.filter_by(
-            user_id=student_id,
-            operation=operation,
-            level=current_level
-        ).order_by(PracticeAttempt.created_at.desc()).limit(10).all()
+    @read_from_replica
+    def get_multiplication_table_stats(student_id: int) -> 'MultiplicationTableStats':
+        """Get detailed statistics for multiplication table progress
+        
+        One GROUP BY fact_id over the student's multiplication attempts fills
+        13×13 arrays indexed [i, j] for "i × j", made symmetric since either
+        order is the same fact; accuracy and average time are then derived for the
+        whole table at once.
+        """
+        rows = db.session.query(
+            PracticeAttempt.fact_id,
+            func.count(),
+            func.sum(case((PracticeAttempt.is_correct, 1), else_=0)),
+            func.coalesce(func.sum(PracticeAttempt.time_taken), 0.0),
+            func.count(PracticeAttempt.time_taken)
+        ).filter(
+            PracticeAttempt.user_id == student_id,
+            PracticeAttempt.operation == 'multiplication',
+            PracticeAttempt.fact_id.is_not(None)
+        ).group_by(PracticeAttempt.fact_id).all()
 
-        if not recent_attempts:
-            return False, current_level
+        shape = (TABLE_SIZE, TABLE_SIZE)
+        attempts = np.zeros(shape, dtype=np.int64)
+        correct = np.zeros(shape, dtype=np.int64)
+        time_sum = np.zeros(shape, dtype=np.float64)
+        timed = np.zeros(shape, dtype=np.int64)
+        if rows:
+            facts, counts, correct_counts, total_times, timed_counts = (np.array(col) for col in zip(*rows))
+            # Fact ids pack the operands, smaller first; unpack the whole column at once
+            i = facts >> OPERAND_BITS & OPERAND_MASK
+            j = facts & OPERAND_MASK
+            on_table = (i < TABLE_SIZE) & (j < TABLE_SIZE)
+            cells = (i[on_table], j[on_table])
+            attempts[cells] = counts[on_table]
+            correct[cells] = correct_counts[on_table]
+            time_sum[cells] = total_times[on_table]
+            timed[cells] = timed_counts[on_table]
 
-        correct_count = sum(1 for a in recent_attempts if a.is_correct)
-        success_rate = correct_count / len(recent_attempts)
-        
-        correct_times = [a.time_taken for a in recent_attempts if a.is_correct and a.time_taken]
-        avg_time = sum(correct_times) / len(correct_times) if correct_times else float('inf')
+        # Each fact sits in its i <= j cell; show its totals in both
+        attempts, correct, time_sum, timed = (
+            cell + cell.T - np.diag(np.diag(cell)) for cell in (attempts, correct, time_sum, timed)
+        )
 
-        # Level up conditions
-        if success_rate >= ProgressService.LEVEL_UP_ACCURACY and avg_time < ProgressService.LEVEL_UP_TIME:
-            max_level = 5 if operation == 'addition' else 12
-            return True, min(current_level + 1, max_level)
-        
-        # Level down conditions
-        elif success_rate < ProgressService.LEVEL_DOWN_ACCURACY:
-            return True, max(current_level - 1, 1)
+        accuracy = np.divide(correct * 100.0, attempts, out=np.zeros(shape), where=attempts > 0)
+        average_time = np.divide(time_sum, timed, out=np.zeros(shape), where=timed > 0)
+        return MultiplicationTableStats(attempts, correct, time_sum, accuracy, average_time)
 
-        return False, current_level
+    @staticmethod
+    def should_change_level(student_id: int, operation: str, current_level: int) -> Tuple[bool, int]:
+        """Determine if a student should change levels based on recent performance"""
+        decision = get_mastery_engine().decide(student_id, operation, current_level)
+        return decision.should_change, decision.new_level
 
     @staticmethod
+    @read_from_replica
     def analyze_missed_problems(student_id: int, operation: Optional[str] = None) -> List[Dict]:
         """Analyze commonly missed problems for a student"""
-        query = PracticeAttempt.query.filter_by(user_id=student_id)
+        # IS false and the fact id range match the partial index on missed
+        # attempts; both orders of a multiplication fact share an id
+        query = db.session.query(
+            PracticeAttempt.operation,
+            PracticeAttempt.fact_id,
+            func.count().label('count')
+        ).filter(
+            PracticeAttempt.user_id == student_id,
+            PracticeAttempt.is_correct.is_(False),
+            PracticeAttempt.fact_id.is_not(None)
+        )
         if operation:
-            query = query.filter_by(operation=operation)
-        
-        attempts = query.filter_by(is_correct=False).all()
-        problem_counts = {}
-        
-        for attempt in attempts:
-            key = (attempt.operation, attempt.problem)
-            if key not in problem_counts:
-                problem_counts[key] = {'count': 0, 'operation': attempt.operation, 'problem': attempt.problem}
-            problem_counts[key]['count'] += 1
-        
-        return sorted(problem_counts.values(), key=lambda x: x['count'], reverse=True)
+            query = query.filter(PracticeAttempt.fact_id.between(*operation_fact_range(operation)))
+        rows = query.group_by(PracticeAttempt.fact_id, PracticeAttempt.operation).all()
+
+        problem_counts = [
+            {'count': row.count, 'operation': row.operation, 'problem': fact_problem(row.fact_id)}
+            for row in rows
+        ]
+        return sorted(problem_counts, key=lambda x: x['count'], reverse=True)
@@ -0,0 +1,123 @@
+"""Statement budgets for requests, socket events and any other block of code.
+
+    with query_budget(5):
+        client.get('/welcome')
+
+    @query_budget(10)
+    def view(): ...
+
+A block that runs more statements than its budget raises
+QueryBudgetExceeded when QUERY_BUDGET_STRICT is on (the default under
+TESTING, so N+1 regressions fail the suite) and logs a warning otherwise.
+Budgets count every statement from any engine in the current thread (or
+green thread), so keep the limit independent of the data: an N+1 shows up
+as soon as a test seeds more rows than the budget allows for.
+"""
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUEST_BUDGET = 50  # Statements any one request may run
+DEFAULT_EVENT_BUDGET = 20    # Statements any one Socket.IO event may run
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryCounter:
+    """The statements run while it is active."""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+_active: ContextVar[Tuple[QueryCounter, ...]] = ContextVar('query_counters', default=())
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active.get():
+        counter.statements.append(statement)
+
+def _strict() -> bool:
+    return has_app_context() and current_app.config.get('QUERY_BUDGET_STRICT', False)
+
+class query_budget(ContextDecorator):
+    """Allow at most `limit` statements in a block or call (see module docstring).
+
+    strict=None follows QUERY_BUDGET_STRICT. As a context manager it yields
+    the QueryCounter, so tests can also look at the statements themselves.
+    """
+
+    def __init__(self, limit: int, name: Optional[str] = None, strict: Optional[bool] = None):
+        self.limit = limit
+        self.name = name
+        self.strict = strict
+        self.counter: Optional[QueryCounter] = None
+        self._token = None
+
+    def __call__(self, func):
+        if self.name is None:
+            self.name = func.__qualname__
+        return super().__call__(func)
+
+    def _recreate_cm(self):
+        # Each call of a decorated function gets its own counter
+        return query_budget(self.limit, self.name, self.strict)
+
+    def __enter__(self) -> QueryCounter:
+        self.counter = QueryCounter()
+        self._token = _active.set(_active.get() + (self.counter,))
+        return self.counter
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _active.reset(self._token)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def check(self) -> None:
+        if len(self.counter) <= self.limit:
+            return
+        message = (f"{self.name or 'Block'} ran {len(self.counter)} SQL statements; its budget is {self.limit}")
+        if self.strict if self.strict is not None else _strict():
+            raise QueryBudgetExceeded(message + ':\n' + '\n'.join(self.counter.statements))
+        logger.warning(message)
+
+def _start_request_budget() -> None:
+    budget = query_budget(current_app.config.get('QUERY_BUDGET_PER_REQUEST', DEFAULT_REQUEST_BUDGET))
+    budget.__enter__()
+    g.query_budget = budget
+
+def _check_request_budget(response):
+    budget = g.pop('query_budget', None)
+    if budget is not None:
+        budget.name = f'{request.method} {request.endpoint or request.path}'
+        budget.__exit__(None, None, None)
+    return response
+
+def _end_request_budget(exc=None) -> None:
+    # Only still open when an exception skipped after_request
+    budget = g.pop('query_budget', None)
+    if budget is not None:
+        _active.reset(budget._token)
+
+def init_query_budgets(app) -> None:
+    """Give every request of `app` the QUERY_BUDGET_PER_REQUEST budget."""
+    app.config.setdefault('QUERY_BUDGET_STRICT', app.testing)
+    # First, so blueprints' before_app_request hooks count too
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request_budget)
+    app.after_request(_check_request_budget)
+    app.teardown_request(_end_request_budget)
+
+def event_budget(name: str) -> query_budget:
+    """The QUERY_BUDGET_PER_EVENT budget for one Socket.IO event."""
+    limit = current_app.config.get('QUERY_BUDGET_PER_EVENT', DEFAULT_EVENT_BUDGET) \
+        if has_app_context() else DEFAULT_EVENT_BUDGET
+    return query_budget(limit, name=f'Socket.IO {name}')
@@ -0,0 +1,149 @@
+"""In-process scheduler for periodic maintenance jobs.
+
+Every worker runs one scheduler thread (a green thread once eventlet has
+monkey patched threading, so waiting between jobs never blocks requests).
+When a job is due the worker first takes its JobLease for the job's
+interval; only the worker that gets it runs the job, so a job runs about
+once per interval however many workers there are. Jobs are set-based
+statements in short transactions (the rollup refresh goes a batch of
+users at a time), so they can run inline on the worker.
+
+Each run is counted, timed and its rows-affected recorded in
+services.metrics. `python manage.py run_job <name>` runs one by hand.
+"""
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional
+from flask import current_app
+from database import db
+from models.active_session import ActiveSession
+from models.job_lease import JobLease
+from models.quiz import Quiz
+from models.user_fact_stat import UserFactStat
+from services.metrics import JOB_DURATION, JOB_ROWS, JOB_RUNS
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TICK_SECONDS = 30                 # How often the scheduler looks for due jobs
+DEFAULT_SESSION_CLEANUP_SECONDS = 300
+DEFAULT_QUIZ_PRUNE_SECONDS = 3600
+DEFAULT_FACT_STATS_REFRESH_SECONDS = 86400
+
+class Job(NamedTuple):
+    name: str
+    func: Callable[[], int]  # Runs in an app context; returns rows affected
+    interval: float          # Seconds between runs, and the length of its lease
+
+class JobRun(NamedTuple):
+    name: str
+    rows: int
+    seconds: float
+
+def delete_stale_sessions() -> int:
+    return ActiveSession.cleanup_inactive(db.session)
+
+def prune_finished_quizzes() -> int:
+    return Quiz.prune_finished(db.session)
+
+def refresh_fact_stats() -> int:
+    # Catches the rollup up with anything written around the insert hooks
+    return UserFactStat.rebuild_in_batches(db.session)
+
+class Scheduler:
+    """Runs registered jobs on their intervals, one worker per job at a time."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.jobs: Dict[str, Job] = {}
+        self.holder = f'{socket.gethostname()}:{os.getpid()}'
+        self._due: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        # Off unless configured (create_app turns it on); start() is only called by the servers
+        self.enabled = app.config.get('SCHEDULER_ENABLED', False)
+        self.tick = app.config.get('SCHEDULER_TICK_SECONDS', DEFAULT_TICK_SECONDS)
+        self.add_job('delete_stale_sessions', delete_stale_sessions,
+                     app.config.get('SESSION_CLEANUP_SECONDS', DEFAULT_SESSION_CLEANUP_SECONDS))
+        self.add_job('prune_finished_quizzes', prune_finished_quizzes,
+                     app.config.get('QUIZ_PRUNE_SECONDS', DEFAULT_QUIZ_PRUNE_SECONDS))
+        self.add_job('refresh_fact_stats', refresh_fact_stats,
+                     app.config.get('FACT_STATS_REFRESH_SECONDS', DEFAULT_FACT_STATS_REFRESH_SECONDS))
+        app.extensions['scheduler'] = self
+
+    def add_job(self, name: str, func: Callable[[], int], interval: float) -> None:
+        self.jobs[name] = Job(name, func, interval)
+        # Due on the first tick after start()
+        self._due[name] = 0.0
+
+    def start(self) -> None:
+        """Start the scheduler thread (no-op unless SCHEDULER_ENABLED)."""
+        if not self.enabled or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=self.tick)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.tick):
+            with self.app.app_context():
+                self.run_pending()
+                db.session.remove()
+
+    def run_pending(self) -> Dict[str, Optional[JobRun]]:
+        """Run every due job whose lease this process gets. Returns what ran (None: skipped)."""
+        now = time.monotonic()
+        ran = {}
+        for job in list(self.jobs.values()):
+            if self._due[job.name] > now:
+                continue
+            self._due[job.name] = now + job.interval
+            try:
+                ran[job.name] = self.run(job.name)
+            except Exception:
+                logger.exception(f"Scheduled job {job.name} failed")
+        return ran
+
+    def run(self, name: str, force: bool = False) -> Optional[JobRun]:
+        """Run a job now if this process gets its lease (force: regardless of it).
+
+        Needs an app context. Returns None when another worker holds the lease.
+        """
+        job = self.jobs[name]
+        if not force and not JobLease.acquire(db.session, name, self.holder, job.interval):
+            JOB_RUNS.inc(job=name, outcome='skipped')
+            return None
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            rows = job.func() or 0
+            outcome = 'ok'
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            JOB_RUNS.inc(job=name, outcome=outcome)
+            JOB_DURATION.observe(seconds, job=name)
+        JOB_ROWS.inc(rows, job=name)
+        logger.info(f"Scheduled job {name}: {rows} rows in {seconds:.3f}s")
+        return JobRun(name, rows, seconds)
+
+def get_scheduler() -> Scheduler:
+    return current_app.extensions['scheduler']
@@ -9,8 +9,22 @@ document.addEventListener('DOMContentLoaded', function() {
         const data = JSON.parse(event.data);
         console.log('Parsed data:', data);
         
-        // Update page content
-        data.forEach(student => {
+        // A snapshot lists every active student; anyone not in it has gone idle
+        if (data.snapshot) {
+            const active = new Set(data.changed.map(student => String(student.user_id)));
+            document.querySelectorAll('[data-user-id]').forEach(card => {
+                card.classList.toggle('opacity-50', !active.has(card.dataset.userId));
+            });
+        }
+        data.removed.forEach(userId => {
+            const card = document.querySelector(`[data-user-id="${userId}"]`);
+            if (card) {
+                card.classList.add('opacity-50');
+            }
+        });
+        
+        // Update page content for students whose activity changed
+        data.changed.forEach(student => {
             console.log(`Processing update for student ${student.user_id} (${student.username})`);
             const studentElement = document.querySelector(`[data-user-id="${student.user_id}"]`);
             
@@ -20,6 +34,7 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             console.log('Found student element:', studentElement);
+            studentElement.classList.remove('opacity-50');
             
             // Update last active time
             const lastActiveElement = studentElement.querySelector('.last-active');
@@ -10,36 +10,36 @@ function getCsrfToken() {
     return document.querySelector('meta[name="csrf-token"]').getAttribute('content');
 }
 
-async function getNewProblem() {
-    let level;
-    
-    console.log("Starting getNewProblem");
-    console.log("Assignment ID:", typeof assignmentId !== 'undefined' ? assignmentId : 'undefined');
-    console.log("Assignment Level:", typeof assignmentLevel !== 'undefined' ? assignmentLevel : 'undefined');
-    
+// Prefetch queue: problems are fetched in batches and refilled in the background
+const PREFETCH_SIZE = 5;       // Problems requested per batch
+const REFILL_THRESHOLD = 2;    // Refill when this many problems are left
+let problemQueue = [];
+let queueKey = null;           // operation:level the queue was filled for
+let refillPromise = null;
+let pendingLevelUp = null;     // Level up reported by a background refill
+let assignmentOperation = null;
+
+function getCurrentLevel() {
     // If in assignment mode, use assignment level
     if (typeof assignmentId !== 'undefined' && typeof assignmentLevel !== 'undefined') {
-        level = assignmentLevel;  // This is already set from practice.html
-        console.log("Using assignment level:", level);
-    } else {
-        // Free practice mode - get level from select or use default
-        const select = document.querySelector('.level-select:not([style*="display: none"])');
-        level = select ? select.value : 1;  // Default to level 1 if select not found
-        console.log("Using practice level:", level);
+        return assignmentLevel;  // This is already set from practice.html
     }
-    
-    try {
-        let requestData = {
-            operation: currentOperation,
-            level: parseInt(level)
-        };
-        console.log("Initial request data:", requestData);
-
-        // Add assignment_id if in assignment mode
-        if (typeof assignmentId !== 'undefined') {
-            requestData.assignment_id = assignmentId;
-            console.log("Getting assignment info for ID:", assignmentId);
-            // In assignment mode, use the operation from the server response
+    // Free practice mode - get level from select or use default
+    const select = document.querySelector('.level-select:not([style*="display: none"])');
+    return select ? select.value : 1;  // Default to level 1 if select not found
+}
+
+async function buildProblemRequest() {
+    let requestData = {
+        operation: currentOperation,
+        level: parseInt(getCurrentLevel())
+    };
+
+    // Add assignment_id if in assignment mode
+    if (typeof assignmentId !== 'undefined') {
+        requestData.assignment_id = assignmentId;
+        // In assignment mode, use the operation from the server (fetched once)
+        if (assignmentOperation === null) {
             const response = await fetch(`/assignment/${assignmentId}/info`, {
                 headers: {
                     'X-CSRFToken': getCsrfToken()
@@ -49,64 +49,130 @@ async function getNewProblem() {
                 throw new Error(`Assignment info request failed! Status: ${response.status}`);
             }
             const assignmentData = await response.json();
-            console.log("Got assignment data:", assignmentData);
-            requestData.operation = assignmentData.operation;
+            assignmentOperation = assignmentData.operation;
         }
+        requestData.operation = assignmentOperation;
+    }
+    return requestData;
+}
+
+function resetProblemQueue(key) {
+    problemQueue = [];
+    queueKey = key;
+    refillPromise = null;
+    pendingLevelUp = null;
+}
 
-        console.log("Sending problem request with data:", requestData);
+function applyProblemBatch(batchData, key) {
+    // Ignore batches for an operation or level the student has left
+    if (key !== queueKey) {
+        return;
+    }
+    if (batchData.level_up || batchData.complete) {
+        problemQueue = [];
+        pendingLevelUp = batchData;
+    } else {
+        problemQueue.push(...batchData.problems);
+    }
+}
+
+function refillQueue(requestData, key) {
+    if (refillPromise) {
+        return refillPromise;
+    }
+    const promise = (async () => {
         const response = await fetch('/get_problem', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'X-CSRFToken': getCsrfToken()
             },
-            body: JSON.stringify(requestData)
+            body: JSON.stringify({...requestData, count: PREFETCH_SIZE})
         });
-        
+
         if (!response.ok) {
             throw new Error(`Problem request failed! Status: ${response.status}`);
         }
-        
-        const problemData = await response.json();
-        console.log("Got problem data:", problemData);
-        
-        if (problemData.error) {
-            throw new Error(problemData.error);
+
+        const batchData = await response.json();
+        if (batchData.error) {
+            throw new Error(batchData.error);
+        }
+        applyProblemBatch(batchData, key);
+    })();
+    refillPromise = promise;
+    promise.finally(() => {
+        if (refillPromise === promise) {
+            refillPromise = null;
+        }
+    }).catch(() => {});
+    return promise;
+}
+
+function showLevelUp(problemData) {
+    // Show mastery message
+    const masteryMessage = `
+        <div class="alert alert-success">
+            <h4 class="alert-heading">Level Mastered! 🎉</h4>
+            <p>${problemData.message}</p>
+            <hr>
+            <p class="mb-0">Moving to level ${problemData.new_level}...</p>
+        </div>`;
+    document.getElementById('feedback').innerHTML = masteryMessage;
+
+    // Update level selector if in free practice mode
+    if (typeof assignmentId === 'undefined') {
+        const select = document.querySelector('.level-select:not([style*="display: none"])');
+        if (select) {
+            select.value = problemData.new_level;
         }
+    }
 
-        // Check for level up
-        if (problemData.level_up) {
-            // Show mastery message
-            const masteryMessage = `
-                <div class="alert alert-success">
-                    <h4 class="alert-heading">Level Mastered! 🎉</h4>
-                    <p>${problemData.message}</p>
-                    <hr>
-                    <p class="mb-0">Moving to level ${problemData.new_level}...</p>
-                </div>`;
-            document.getElementById('feedback').innerHTML = masteryMessage;
+    // Get a new problem after a short delay to show the message
+    setTimeout(() => {
+        getNewProblem();
+    }, 3000);
+}
 
-            // Update level selector if in free practice mode
-            if (typeof assignmentId === 'undefined') {
-                const select = document.querySelector('.level-select:not([style*="display: none"])');
-                if (select) {
-                    select.value = problemData.new_level;
-                }
-            }
+async function getNewProblem() {
+    try {
+        const requestData = await buildProblemRequest();
+        const key = `${requestData.operation}:${requestData.level}`;
+        if (key !== queueKey) {
+            resetProblemQueue(key);
+        }
 
-            // Get a new problem after a short delay to show the message
-            setTimeout(() => {
-                getNewProblem();
-            }, 3000);
+        // Only wait on the network when nothing is queued
+        if (problemQueue.length === 0 && !pendingLevelUp) {
+            await refillQueue(requestData, key);
+        }
+
+        if (pendingLevelUp) {
+            const problemData = pendingLevelUp;
+            resetProblemQueue(null);
+            if (problemData.complete) {
+                document.getElementById('feedback').innerHTML =
+                    `<div class="alert alert-success">${problemData.message}</div>`;
+            } else {
+                showLevelUp(problemData);
+            }
             return;
         }
 
-        console.log("We got a new problem");
-        console.log("problemData:", problemData);
-        
+        const problemData = problemQueue.shift();
+        if (!problemData) {
+            throw new Error('No problems available');
+        }
         displayProblem(problemData);
         document.getElementById('answer-input').focus();
         wrongAttempts = 0;
+
+        // Top the queue up in the background
+        if (problemQueue.length <= REFILL_THRESHOLD) {
+            refillQueue(requestData, key).catch(error => {
+                console.error("Error prefetching problems:", error);
+            });
+        }
         
     } catch (error) {
         console.error("Error in getNewProblem:", error);
@@ -273,6 +339,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 operation: currentOperation,
                 level: parseInt(document.querySelector('.level-select:not([style*="display: none"])')?.value || 1),
                 problem: document.getElementById('current-problem').textContent,
+                num1: currentProblem ? currentProblem.num1 : undefined,
+                num2: currentProblem ? currentProblem.num2 : undefined,
                 answer: parseInt(userAnswer),
                 correct_answer: parseInt(correctAnswer),
                 is_correct: isCorrect,
@@ -284,6 +352,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 requestData.assignment_id = assignmentId;
             }
 
+            // Ask for the next problems in the same round trip when the queue runs low
+            const batchKey = queueKey;
+            const wantsNext = problemQueue.length <= REFILL_THRESHOLD && !refillPromise && !pendingLevelUp;
+            if (wantsNext) {
+                requestData.next_count = PREFETCH_SIZE;
+            }
+
             const response = await fetch('/check_answer', {
                 method: 'POST',
                 headers: {
@@ -298,6 +373,9 @@ document.addEventListener('DOMContentLoaded', function() {
             }
 
             const result = await response.json();
+            if (result.next) {
+                applyProblemBatch(result.next, batchKey);
+            }
             
             if (result.is_correct) {
                 feedback.innerHTML = '<div class="alert alert-success">Correct! Well done!</div>';
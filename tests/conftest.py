@@ -0,0 +1,46 @@
+import os
+import pytest
+from database import db
+from models.user import User
+from models.attempt_window import clear_window_cache
+from app import create_app
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        # Set TEST_DATABASE_URL to run the suite against e.g. PostgreSQL
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:'),
+        'WTF_CSRF_ENABLED': False,
+        'SESSION_COOKIE_SECURE': False
+    })
+    # Keep a context open so fixtures' objects stay bound to a live session
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+    clear_window_cache()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def runner(app):
+    return app.test_cli_runner()
+
+@pytest.fixture
+def student(app):
+    user = User(username='student', email='student@example.com', is_teacher=False)
+    db.session.add(user)
+    db.session.commit()
+    db.session.refresh(user)
+    return user
+
+@pytest.fixture
+def student_client(app, student):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(student.id)
+        session['_fresh'] = True
+    return client
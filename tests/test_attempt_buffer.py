@@ -0,0 +1,129 @@
+import pytest
+from database import db
+from models.attempt_window import AttemptWindow, get_recent_window
+from models.practice_attempt import PracticeAttempt
+from models.quiz import QuizAnswer
+from models.user import User
+from models.user_fact_stat import UserFactStat
+from services.attempt_buffer import get_attempt_buffer, save_attempt, save_quiz_answer
+from services.mastery_engine import MasteryEngine
+
+@pytest.fixture
+def buffer(app):
+    buffer = app.extensions['attempt_buffer']
+    buffer.enabled = True
+    buffer.flush_interval = 60  # Tests flush explicitly
+    yield buffer
+    buffer.close()
+
+def make_attempt(user_id, problem, is_correct, time_taken=2.0, level=3):
+    num1, num2 = map(int, problem.split(' × '))
+    return PracticeAttempt(
+        user_id=user_id, operation='multiplication', level=level, problem=problem,
+        user_answer=num1 * num2 if is_correct else 0, correct_answer=num1 * num2,
+        is_correct=is_correct, time_taken=time_taken
+    )
+
+def snapshot(user_id):
+    facts = [(r.operation, r.level, r.fact_id, r.attempts, r.correct, r.time_sum, r.min_time, r.max_time)
+             for r in UserFactStat.query.filter_by(user_id=user_id).order_by(UserFactStat.level, UserFactStat.fact_id)]
+    windows = [(w.operation, w.level, w.outcomes, w.times, w.head, w.count)
+               for w in AttemptWindow.query.filter_by(user_id=user_id).order_by(AttemptWindow.level)]
+    return facts, windows
+
+def test_check_answer_reads_its_own_writes(buffer, student_client, student):
+    student_client.post('/check_answer', json={
+        'operation': 'multiplication', 'level': 7, 'problem': '7 × 3',
+        'num1': 7, 'num2': 3, 'answer': 21, 'time_taken': 2.0
+    })
+    assert PracticeAttempt.query.count() == 0
+    state = MasteryEngine().state(student.id, 'multiplication', 7)
+    assert state.window.count == 1
+    assert state.problem_stats['7 × 3']['attempts'] == 1
+
+    assert buffer.flush() == 1
+    assert PracticeAttempt.query.one().fact_id is not None
+    state = MasteryEngine().state(student.id, 'multiplication', 7)
+    assert state.window.count == 1
+    assert state.problem_stats['7 × 3']['attempts'] == 1
+
+def test_flush_matches_orm_writes(buffer, app, student):
+    other = User(username='other', email='other@example.com', is_teacher=False)
+    db.session.add(other)
+    db.session.commit()
+    history = [('3 × 4', True, 2.0, 3), ('4 × 3', False, 5.0, 4), ('3 × 4', True, None, 3)]
+    batches = [history, [('3 × 5', True, 1.5, 3), ('5 × 3', True, 0, 5), ('3 × 4', False, 3.0, 3)]]
+
+    # Both users start with windows in place, then add a batch that extends them
+    for user_id in (student.id, other.id):
+        for problem, correct, time_taken, level in batches[0]:
+            db.session.add(make_attempt(user_id, problem, correct, time_taken, level))
+        db.session.commit()
+    for problem, correct, time_taken, level in batches[1]:
+        db.session.add(make_attempt(other.id, problem, correct, time_taken, level))
+        save_attempt(make_attempt(student.id, problem, correct, time_taken, level))
+    db.session.commit()
+    assert buffer.flush() == 3
+
+    db.session.expire_all()
+    assert snapshot(student.id) == snapshot(other.id)
+    assert get_recent_window(db.session, student.id, 'multiplication', 3).count == 4
+
+def test_failed_flush_is_retried(buffer, app, student, monkeypatch):
+    save_attempt(make_attempt(student.id, '3 × 4', True))
+    monkeypatch.setattr(UserFactStat, 'record_many', classmethod(lambda cls, connection, attempts: 1 / 0))
+    assert buffer.flush() == 0
+    assert len(buffer) == 1
+    assert PracticeAttempt.query.count() == 0
+    assert len(buffer.pending_attempts(student.id)) == 1
+
+    monkeypatch.undo()
+    assert buffer.flush() == 1
+    assert UserFactStat.query.one().attempts == 1
+
+def test_rows_missing_required_values_are_refused(buffer, app, student):
+    attempt = make_attempt(student.id, '3 × 4', True)
+    attempt.user_answer = None
+    with pytest.raises(ValueError, match='user_answer'):
+        save_attempt(attempt)
+    assert len(buffer) == 0
+
+def test_rejected_rows_are_dropped_and_the_rest_written(buffer, app, student):
+    save_attempt(make_attempt(student.id, '3 × 4', True))
+    bad = make_attempt(student.id, '3 × 5', True)
+    save_attempt(bad)
+    buffer._attempts[1]['user_answer'] = None  # As if it got past the check
+    save_attempt(make_attempt(student.id, '3 × 6', True))
+    assert buffer.flush() == 2
+    assert len(buffer) == 0
+    assert sorted(a.problem for a in PracticeAttempt.query) == ['3 × 4', '3 × 6']
+    assert get_recent_window(db.session, student.id, 'multiplication', 3).count == 2
+
+def test_failing_flushes_are_bounded(buffer, app, student, monkeypatch):
+    buffer.max_retries, buffer.max_queue = 2, 2
+    monkeypatch.setattr(UserFactStat, 'record_many', classmethod(lambda cls, connection, attempts: 1 / 0))
+    for problem in ('3 × 4', '3 × 5', '3 × 6'):
+        save_attempt(make_attempt(student.id, problem, True))
+    assert buffer.flush() == 0
+    assert [row['problem'] for row in buffer._attempts] == ['3 × 5', '3 × 6']  # Oldest dropped
+    assert buffer.flush() == 0
+    assert len(buffer) == 2
+    assert buffer.flush() == 0  # Third failure in a row: given up
+    assert len(buffer) == 0
+
+def test_close_flushes_everything(buffer, app, student):
+    save_attempt(make_attempt(student.id, '3 × 4', True))
+    save_quiz_answer(QuizAnswer(participant_id=1, question_id=1, answer=12, correct=True, time_taken=1.0))
+    buffer.close()
+    assert PracticeAttempt.query.count() == 1
+    assert QuizAnswer.query.count() == 1
+
+    # Late arrivals during shutdown are written straight away
+    save_attempt(make_attempt(student.id, '3 × 5', True))
+    assert PracticeAttempt.query.count() == 2
+
+def test_disabled_buffer_uses_the_session(app, student):
+    assert get_attempt_buffer() is None
+    save_attempt(make_attempt(student.id, '3 × 4', True))
+    db.session.commit()
+    assert PracticeAttempt.query.count() == 1
@@ -0,0 +1,109 @@
+from database import db
+from models.attempt_window import (
+    WINDOW_SIZE,
+    AttemptWindow,
+    RecentWindow,
+    clear_window_cache,
+    get_recent_window
+)
+from models.practice_attempt import PracticeAttempt
+import models.attempt_window
+from services.progress_service import ProgressService
+
+def add_attempt(user_id, is_correct, time_taken, level=2):
+    db.session.add(PracticeAttempt(
+        user_id=user_id, operation='addition', level=level, problem='5 + 2',
+        user_answer=7 if is_correct else 0, correct_answer=7,
+        is_correct=is_correct, time_taken=time_taken
+    ))
+
+def test_ring_buffer_keeps_last_outcomes():
+    window = RecentWindow()
+    for _ in range(WINDOW_SIZE):
+        window.push(False, 9.0)
+    assert window.count == WINDOW_SIZE
+    assert window.accuracy == 0
+    assert window.avg_correct_time == float('inf')
+    for i in range(WINDOW_SIZE - 1):
+        window.push(True, 2.0 if i % 2 else None)
+    assert window.count == WINDOW_SIZE
+    assert window.correct_count == WINDOW_SIZE - 1
+    assert window.accuracy == 0.9
+    assert window.avg_correct_time == 2.0
+
+def test_window_persisted_with_attempts(app, student):
+    for i in range(12):
+        add_attempt(student.id, i >= 4, 3.0)
+        db.session.commit()
+    row = db.session.get(AttemptWindow, (student.id, 'addition', 2))
+    assert row.count == WINDOW_SIZE
+
+    clear_window_cache()
+    window = get_recent_window(db.session, student.id, 'addition', 2)
+    assert window.correct_count == 8
+    assert window.avg_correct_time == 3.0
+
+def test_window_seeds_from_history(app, student):
+    for i in range(5):
+        add_attempt(student.id, True, 2.0)
+    db.session.commit()
+    db.session.query(AttemptWindow).delete()
+    db.session.commit()
+    clear_window_cache()
+
+    add_attempt(student.id, False, 2.0)
+    db.session.commit()
+    window = get_recent_window(db.session, student.id, 'addition', 2)
+    assert window.count == 6
+    assert window.correct_count == 5
+
+def test_racing_first_attempts_share_one_row(app, student, monkeypatch):
+    for _ in range(3):
+        add_attempt(student.id, True, 3.0)
+        db.session.commit()
+
+    # Another transaction created the row after this one looked for it
+    select_locked = models.attempt_window._select_locked
+    misses = [None]
+    monkeypatch.setattr(models.attempt_window, '_select_locked',
+                        lambda connection, key: misses.pop() if misses else select_locked(connection, key))
+    add_attempt(student.id, False, 3.0)
+    db.session.commit()
+    row = db.session.get(AttemptWindow, (student.id, 'addition', 2))
+    assert (row.count, bin(row.outcomes).count('1')) == (4, 3)
+
+def test_rolled_back_attempt_not_mirrored(app, student):
+    add_attempt(student.id, True, 2.0)
+    db.session.commit()
+    assert get_recent_window(db.session, student.id, 'addition', 2).count == 1
+    add_attempt(student.id, False, 2.0)
+    db.session.flush()
+    db.session.rollback()
+    assert get_recent_window(db.session, student.id, 'addition', 2).count == 1
+
+def test_level_decisions_use_window(app, student):
+    for _ in range(10):
+        add_attempt(student.id, True, 2.0)
+    db.session.commit()
+    assert ProgressService.should_change_level(student.id, 'addition', 2) == (True, 3)
+    for _ in range(4):
+        add_attempt(student.id, False, 2.0)
+    db.session.commit()
+    assert ProgressService.should_change_level(student.id, 'addition', 2) == (True, 1)
+    assert ProgressService.should_change_level(student.id, 'addition', 3) == (False, 3)
+
+def test_other_workers_answers_seen_within_ttl(app, student, monkeypatch):
+    add_attempt(student.id, True, 2.0)
+    db.session.commit()
+    assert get_recent_window(db.session, student.id, 'addition', 2).count == 1
+
+    # Another worker pushed an answer into the row; this process's mirror still has the old window
+    window = RecentWindow()
+    window.push(True, 2.0)
+    window.push(False, 2.0)
+    db.session.query(AttemptWindow).update({'outcomes': window.outcomes, 'head': window.head,
+                                            'count': window.count, 'times': window.times.tobytes()})
+    db.session.commit()
+    now = models.attempt_window.time.monotonic()
+    monkeypatch.setattr(models.attempt_window.time, 'monotonic', lambda: now + 1.1)
+    assert get_recent_window(db.session, student.id, 'addition', 2).count == 2
@@ -0,0 +1,33 @@
+from utils.fact_catalog import (
+    OPERATION_CODES,
+    fact_id,
+    fact_problem,
+    operation_fact_range,
+    parse_problem,
+    solve,
+    unpack_fact
+)
+
+def test_round_trip():
+    for operation in OPERATION_CODES:
+        fact = fact_id(operation, 4, 9)
+        assert unpack_fact(fact) == (operation, 4, 9)
+        low, high = operation_fact_range(operation)
+        assert low <= fact <= high
+
+def test_commutative_orders_share_an_id():
+    assert fact_id('multiplication', 7, 3) == fact_id('multiplication', 3, 7)
+    assert fact_problem(fact_id('multiplication', 7, 3)) == '3 × 7'
+    assert fact_id('subtraction', 7, 3) != fact_id('subtraction', 3, 7)
+
+def test_uncatalogued_facts():
+    assert fact_id('multiplication', -1, 3) is None
+    assert fact_id('multiplication', 3, 5000) is None
+    assert fact_id('exponents', 2, 3) is None
+
+def test_parse_problem():
+    assert parse_problem('multiplication', '12 × 4') == (12, 4)
+    assert parse_problem('division', '12 ÷ 4') == (12, 4)
+    assert parse_problem('addition', '12 × 4') is None
+    assert parse_problem('addition', '') is None
+    assert solve('division', 12, 4) == 3
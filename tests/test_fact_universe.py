@@ -0,0 +1,79 @@
+import random
+import pytest
+from utils.fact_universe import (
+    AliasTable,
+    get_fact_selector,
+    get_fact_universe,
+    select_fact
+)
+from utils.practice_tracker import PracticeTracker
+
+def make_stats(attempts, correct):
+    return {
+        'attempts': attempts,
+        'correct': correct,
+        'total_time': 0,
+        'accuracy': correct / attempts,
+        'avg_time': 0
+    }
+
+def test_universe_sizes():
+    assert len(get_fact_universe('multiplication', 7).problems) == 13
+    assert len(get_fact_universe('addition', 1).problems) == 9
+    assert len(get_fact_universe('addition', 3).problems) == 9
+    assert len(get_fact_universe('subtraction', 3).problems) == 9
+    assert get_fact_universe('multiplication', 'custom') is None
+
+def test_universe_answers():
+    universe = get_fact_universe('subtraction', 5)
+    for (num1, num2), problem, answer in zip(universe.operands, universe.problems, universe.answers):
+        assert 1 <= num2 < num1
+        assert problem == f"{num1} - {num2}"
+        assert answer == num1 - num2
+    assert get_fact_universe('subtraction', 5) is universe
+
+def test_alias_table_distribution():
+    table = AliasTable([1.0, 3.0, 0.0, 6.0])
+    rng = random.Random(42)
+    counts = [0] * 4
+    for _ in range(20000):
+        counts[table.sample(rng)] += 1
+    assert counts[2] == 0
+    assert counts[0] / 20000 == pytest.approx(0.1, abs=0.02)
+    assert counts[1] / 20000 == pytest.approx(0.3, abs=0.02)
+    assert counts[3] / 20000 == pytest.approx(0.6, abs=0.02)
+
+def test_selector_skips_mastered_facts():
+    universe = get_fact_universe('multiplication', 7)
+    mastered = {problem: make_stats(5, 5) for problem in universe.problems[:12]}
+    for _ in range(200):
+        fact = select_fact(1, 'multiplication', 7, mastered, PracticeTracker.is_problem_mastered)
+        assert fact['problem'] == '7 × 12'
+        assert fact['answer'] == 84
+
+def test_selector_favours_missed_facts():
+    universe = get_fact_universe('multiplication', 7)
+    stats = {problem: make_stats(5, 5) for problem in universe.problems}
+    stats['7 × 8'] = make_stats(4, 0)
+    stats['7 × 6'] = make_stats(4, 3)
+    stats['7 × 6']['accuracy'] = 0.75
+    rng = random.Random(1)
+    selector = get_fact_selector(2, 'multiplication', 7, stats, PracticeTracker.is_problem_mastered)
+    picks = [universe.problems[selector.sample(rng)] for _ in range(5000)]
+    assert set(picks) == {'7 × 8', '7 × 6'}
+    assert picks.count('7 × 8') > 2 * picks.count('7 × 6')
+
+def test_selector_reviews_when_everything_mastered():
+    universe = get_fact_universe('addition', 1)
+    stats = {problem: make_stats(3, 3) for problem in universe.problems}
+    fact = select_fact(3, 'addition', 1, stats, PracticeTracker.is_problem_mastered)
+    assert fact['problem'] in universe.index
+
+def test_selector_cache_rebuilds_only_on_change():
+    stats = {'2 × 3': make_stats(1, 0)}
+    first = get_fact_selector(4, 'multiplication', 2, stats, PracticeTracker.is_problem_mastered)
+    same = get_fact_selector(4, 'multiplication', 2, dict(stats), PracticeTracker.is_problem_mastered)
+    assert same is first
+    stats['2 × 3'] = make_stats(2, 1)
+    changed = get_fact_selector(4, 'multiplication', 2, stats, PracticeTracker.is_problem_mastered)
+    assert changed is not first
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import event
+from database import db
+from models.class_ import Class
+from models.user import User
+
+@pytest.fixture
+def cache(app):
+    return app.extensions['identity_cache']
+
+def count_user_queries():
+    statements = []
+    def record(conn, cursor, statement, *args):
+        if 'FROM user' in statement:
+            statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    return statements
+
+def test_load_is_cached(cache, student):
+    db.session.remove()
+    queries = count_user_queries()
+    first = cache.load(student.id)
+    db.session.remove()
+    assert cache.load(student.id) is first
+    assert len(queries) == 1
+    assert (first.username, first.is_teacher, first.is_student) == ('student', False, True)
+
+def test_entries_expire_and_are_bounded(cache, student):
+    other = User(username='other', email='other@example.com', is_teacher=False)
+    db.session.add(other)
+    db.session.commit()
+    cache.max_size = 1
+    first = cache.load(student.id)
+    cache.load(other.id)
+    assert cache.load(student.id) is not first  # Evicted by other
+
+    cache.ttl = 0
+    cache.clear()
+    first = cache.load(student.id)
+    assert cache.load(student.id) is not first
+
+def test_snapshot_stands_in_for_the_user(cache, student):
+    snapshot = cache.load(student.id)
+    class_ = Class(name='Room 4', class_code='ROOM04')
+    db.session.add(class_)
+    db.session.commit()
+    class_.add_student(snapshot)
+    assert snapshot in class_.students
+    assert snapshot == student and hash(snapshot) == hash(cache.load(student.id))
+    assert [c.name for c in snapshot.enrolled_classes] == ['Room 4']  # Loaded from the User
+
+def test_admin_changes_invalidate(app, cache, student):
+    admin = User(username='admin', email='admin@example.com', is_teacher=True, is_admin=True)
+    db.session.add(admin)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+
+    assert not cache.load(student.id).is_teacher
+    client.post(f'/admin/toggle_teacher/{student.id}')
+    assert cache.load(student.id).is_teacher
+
+    client.post(f'/admin/delete_user/{student.id}')
+    assert cache.load(student.id) is None
@@ -0,0 +1,93 @@
+import pytest
+from database import db
+from models.class_ import Class
+from models.practice_attempt import PracticeAttempt
+from models.user import User
+
+@pytest.fixture
+def hub(app):
+    hub = app.extensions['student_updates']
+    hub.queue_size = 3
+    return hub
+
+@pytest.fixture
+def classroom(app):
+    """A teacher with two students in class, and one student elsewhere."""
+    teacher = User(username='teacher', email='teacher@example.com', is_teacher=True)
+    students = [User(username=f'student{i}', email=f'student{i}@example.com', is_teacher=False) for i in range(3)]
+    class_ = Class('Room 7', class_code='ROOM07')
+    db.session.add_all([teacher, class_] + students)
+    db.session.commit()
+    class_.add_teacher(teacher)
+    class_.add_student(students[0])
+    class_.add_student(students[1])
+    db.session.commit()
+    return teacher, students
+
+def drain(subscriber):
+    messages = []
+    while not subscriber.queue.empty():
+        messages.append(subscriber.queue.get_nowait())
+    return messages
+
+def test_subscribers_get_their_classes_diffs(app, hub, classroom):
+    teacher, students = classroom
+    tracker = app.extensions['presence']
+    for student in students:
+        tracker.heartbeat(student, 'practice', 'Practice Mode')
+    mine = hub.subscribe(teacher.id)
+    everyone = hub.subscribe(None)
+    # No empty snapshot before the producer has built one
+    assert drain(mine) == []
+    hub.publish()
+
+    [first] = drain(mine)
+    assert first['snapshot'] is True
+    assert sorted(e['username'] for e in first['changed']) == ['student0', 'student1']
+    assert len(drain(everyone)[0]['changed']) == 3
+
+    # Later subscribers get the current snapshot straight away
+    [late] = drain(hub.subscribe(teacher.id))
+    assert late == first
+
+    # Nothing changed, nothing sent
+    hub.publish()
+    assert drain(mine) == []
+
+    # Only the student who answered is sent
+    db.session.add(PracticeAttempt(
+        user_id=students[1].id, operation='addition', level=1, problem='2 + 3',
+        user_answer=5, correct_answer=5, is_correct=True, time_taken=2.0
+    ))
+    db.session.commit()
+    hub.publish()
+    [message] = drain(mine)
+    assert message['snapshot'] is False
+    assert [(e['username'], e['accuracy']) for e in message['changed']] == [('student1', 100.0)]
+
+    # Other classes' students don't reach this teacher
+    tracker.forget(students[0].id)
+    tracker.forget(students[2].id)
+    hub.publish()
+    assert drain(mine) == [{'snapshot': False, 'changed': [], 'removed': [students[0].id]}]
+
+def test_slow_subscriber_is_resynced(app, hub, classroom):
+    _, students = classroom
+    tracker = app.extensions['presence']
+    slow = hub.subscribe(None)
+    for i, student in enumerate(students * 3):
+        tracker.heartbeat(student, 'practice', f'{student.username} round {i // 3}')
+        hub.publish()
+    messages = drain(slow)
+    assert slow.resyncs >= 1
+    assert len(messages) <= hub.queue_size
+    assert messages[0]['snapshot'] is True
+    assert len(messages[0]['changed']) == 3
+
+def test_stream_unsubscribes_on_close(app, hub):
+    subscriber = hub.subscribe(None)
+    hub.publish()
+    stream = hub.stream(subscriber)
+    assert next(stream).startswith('data: {"snapshot": true')
+    stream.close()
+    assert subscriber not in hub._subscribers
@@ -0,0 +1,117 @@
+import pytest
+from sqlalchemy import event
+from database import db
+from models.practice_attempt import PracticeAttempt
+from services import mastery_engine
+from services.mastery_engine import MasteryEngine
+
+def add_attempts(user_id, operation, level, problems, is_correct=True, time_taken=2.0):
+    for problem in problems:
+        num1, num2 = (int(n) for n in problem.split(' ')[::2])
+        answer = {'addition': num1 + num2, 'subtraction': num1 - num2}.get(operation, num1 * num2)
+        db.session.add(PracticeAttempt(
+            user_id=user_id, operation=operation, level=level, problem=problem,
+            user_answer=answer if is_correct else answer + 1, correct_answer=answer,
+            is_correct=is_correct, time_taken=time_taken
+        ))
+    db.session.commit()
+
+class QueryCounter:
+    """Counts statements on the engine, grouped by the table they read."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self)
+
+    def selects(self, table):
+        return [s for s in self.statements if s.startswith('SELECT') and f'FROM {table}' in s]
+
+def test_level_steps(app, student):
+    engine = MasteryEngine()
+    assert engine.decide(student.id, 'addition', 2) == (False, 2, False, 0, float('inf'))
+
+    add_attempts(student.id, 'addition', 2, ['5 + 2'] * 5)
+    decision = MasteryEngine().decide(student.id, 'addition', 2)
+    assert (decision.should_change, decision.new_level) == (True, 3)
+    assert not decision.mastered  # Window isn't full yet
+
+    add_attempts(student.id, 'addition', 4, ['5 + 2'] * 5, is_correct=False)
+    assert MasteryEngine().decide(student.id, 'addition', 4)[:2] == (True, 3)
+
+def test_max_level_comes_from_registry(app, student):
+    assert MasteryEngine.max_level('addition') == 5
+    assert MasteryEngine.max_level('subtraction') == 5
+    assert MasteryEngine.max_level('multiplication') == 12
+    add_attempts(student.id, 'subtraction', 5, ['9 - 3'] * 5)
+    assert MasteryEngine().decide(student.id, 'subtraction', 5)[:2] == (False, 5)
+
+def test_multiplication_mastery_needs_every_fact(app, student):
+    add_attempts(student.id, 'multiplication', 3, [f"3 × {i}" for i in range(12)] * 3)
+    assert not MasteryEngine().decide(student.id, 'multiplication', 3).mastered
+    add_attempts(student.id, 'multiplication', 3, ['3 × 12'] * 3)
+    assert MasteryEngine().decide(student.id, 'multiplication', 3).mastered
+
+def test_decisions_are_memoized(app, student):
+    add_attempts(student.id, 'multiplication', 3, ['3 × 4'] * 3)
+    engine = MasteryEngine()
+    with QueryCounter() as counter:
+        first = engine.decide(student.id, 'multiplication', 3)
+        assert engine.decide(student.id, 'multiplication', 3) is first
+        engine.state(student.id, 'multiplication', 3)
+    assert len(counter.selects('user_fact_stats')) == 1
+
+    add_attempts(student.id, 'multiplication', 3, ['3 × 4'], is_correct=False)
+    assert engine.decide(student.id, 'multiplication', 3) is first
+    engine.invalidate(student.id, 'multiplication', 3)
+    assert engine.decide(student.id, 'multiplication', 3).accuracy == 0.75
+
+def test_load_batches_levels(app, student):
+    add_attempts(student.id, 'multiplication', 3, ['3 × 4'])
+    add_attempts(student.id, 'addition', 1, ['4 + 1'])
+    engine = MasteryEngine()
+    with QueryCounter() as counter:
+        engine.load(student.id, [('multiplication', 3), ('addition', 1), ('multiplication', 3)])
+        engine.load(student.id, [('addition', 1)])
+    assert len(counter.selects('user_fact_stats')) == 1
+    assert list(engine.state(student.id, 'multiplication', 3).problem_stats) == ['3 × 4']
+    assert list(engine.state(student.id, 'addition', 1).problem_stats) == ['4 + 1']
+
+def check_answer_queries(student_client):
+    answer = {
+        'operation': 'multiplication', 'level': 3, 'problem': '3 × 4',
+        'answer': 12, 'time_taken': 2.5, 'next_count': 4
+    }
+    student_client.post('/check_answer', json=answer)
+    with QueryCounter() as counter:
+        response = student_client.post('/check_answer', json=answer)
+    assert response.status_code == 200
+    assert len(response.get_json()['next']['problems']) == 4
+    return counter
+
+def test_benchmark_check_answer_query_count(app, student_client, monkeypatch):
+    """Per-request memo vs. a fresh engine per call (the old per-caller fetches)."""
+    memoized = check_answer_queries(student_client)
+    with monkeypatch.context() as m:
+        m.setattr(mastery_engine, 'has_request_context', lambda: False)
+        unmemoized = check_answer_queries(student_client)
+
+    assert len(memoized.selects('user_fact_stats')) == 1
+    assert len(unmemoized.selects('user_fact_stats')) == 3
+    assert len(memoized.statements) < len(unmemoized.statements)
+
+def test_get_problem_query_count(app, student_client):
+    student_client.post('/get_problem', json={'operation': 'multiplication', 'level': 7, 'count': 5})
+    with QueryCounter() as counter:
+        student_client.post('/get_problem', json={'operation': 'multiplication', 'level': 7, 'count': 5})
+        student_client.post('/get_problem', json={'operation': 'multiplication', 'level': 7})
+    # One fact-stat fetch per request, not one per mastery check and selection
+    assert len(counter.selects('user_fact_stats')) == 2
@@ -0,0 +1,91 @@
+import pytest
+from utils.math_problems import (
+    LEVEL_REGISTRY,
+    generate_multiplication_questions,
+    generate_problems_batch,
+    get_level_description,
+    get_level_spec,
+    get_problem
+)
+
+def test_registry_covers_served_levels():
+    for level in range(1, 6):
+        assert ('addition', level) in LEVEL_REGISTRY
+        assert ('subtraction', level) in LEVEL_REGISTRY
+    for table in range(13):
+        assert ('multiplication', table) in LEVEL_REGISTRY
+
+@pytest.mark.parametrize('operation,level', sorted(LEVEL_REGISTRY))
+def test_get_problem_answers_match(operation, level):
+    for _ in range(50):
+        problem = get_problem(operation, level)
+        num1, symbol, num2 = problem['problem'].split(' ')
+        num1, num2 = int(num1), int(num2)
+        expected = {'+': num1 + num2, '-': num1 - num2, '×': num1 * num2}[symbol]
+        assert problem['answer'] == expected
+        assert problem['operation'] == operation
+        assert problem['level'] == level
+
+def test_multiplication_tables_use_level_as_multiplicand():
+    for table in range(13):
+        num1 = int(get_problem('multiplication', table)['problem'].split(' × ')[0])
+        assert num1 == table
+
+def test_custom_generators():
+    for _ in range(50):
+        assert get_problem('addition', 3)['answer'] == 10
+        num1, num2 = map(int, get_problem('subtraction', 5)['problem'].split(' - '))
+        assert 1 <= num2 < num1
+
+def test_unknown_levels():
+    assert get_problem('multiplication', 'custom') is None
+    assert get_problem('multiplication', 13) is None
+    assert get_problem('division', 1) is None
+    assert get_level_spec('addition', 6) is None
+
+def test_level_description_without_generating():
+    assert get_level_description('multiplication', 7) == "×7 Table"
+    assert get_level_description('addition', 3) == "Make 10"
+    assert get_level_description('division', 2) == "Level 2"
+
+def test_level_spec_is_immutable():
+    spec = get_level_spec('addition', 1)
+    with pytest.raises(AttributeError):
+        spec.description = "changed"
+
+def test_generate_multiplication_questions():
+    questions = generate_multiplication_questions("3,4", num_questions=20)
+    assert len(questions) == 20
+    for question in questions:
+        num1, num2 = map(int, question['problem'].split(' × '))
+        assert num1 in (3, 4)
+        assert 0 <= num2 <= 12
+        assert question['answer'] == num1 * num2
+    assert generate_multiplication_questions("abc") == []
+
+@pytest.mark.parametrize('operation,level', sorted(LEVEL_REGISTRY))
+def test_generate_problems_batch_matches_single(operation, level):
+    problems = generate_problems_batch(operation, level, 200, seed=7)
+    assert len(problems) == 200
+    single = get_problem(operation, level)
+    for problem in problems:
+        assert problem.keys() == single.keys()
+        num1, symbol, num2 = problem['problem'].split(' ')
+        num1, num2 = int(num1), int(num2)
+        expected = {'+': num1 + num2, '-': num1 - num2, '×': num1 * num2}[symbol]
+        assert problem['answer'] == expected
+        assert type(problem['answer']) is int
+        assert problem['description'] == single['description']
+
+def test_generate_problems_batch_arrays_and_seed():
+    batch = generate_problems_batch('subtraction', 5, 1000, seed=3, as_arrays=True)
+    assert len(batch.answers) == 1000
+    assert ((batch.num2 >= 1) & (batch.num2 < batch.num1)).all()
+    assert (batch.answers == batch.num1 - batch.num2).all()
+    again = generate_problems_batch('subtraction', 5, 1000, seed=3, as_arrays=True)
+    assert (again.problems == batch.problems).all()
+    assert batch.to_dicts() == again.to_dicts()
+
+def test_generate_problems_batch_invalid_level():
+    assert generate_problems_batch('multiplication', 'custom', 10) is None
+    assert generate_problems_batch('addition', 1, 0) == []
@@ -0,0 +1,68 @@
+import pytest
+from database import db
+from models.user import User
+from services.metrics import (REQUEST_LATENCY, REQUEST_STATEMENTS, SOCKET_EVENTS, Counter, Histogram,
+                              observe_socket_event)
+
+@pytest.fixture
+def admin_client(app):
+    admin = User(username='admin', email='admin@example.com', is_teacher=True, is_admin=True)
+    db.session.add(admin)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
+
+def test_histogram_exposition():
+    histogram = Histogram('demo_seconds', 'Demo.', ['route'], buckets=(0.1, 1))
+    histogram.observe(0.05, route='a')
+    histogram.observe(0.5, route='a')
+    assert histogram.render() == [
+        '# HELP demo_seconds Demo.',
+        '# TYPE demo_seconds histogram',
+        'demo_seconds_bucket{route="a",le="0.1"} 1',
+        'demo_seconds_bucket{route="a",le="1"} 2',
+        'demo_seconds_bucket{route="a",le="+Inf"} 2',
+        'demo_seconds_sum{route="a"} 0.55',
+        'demo_seconds_count{route="a"} 2',
+    ]
+
+def test_label_values_are_escaped():
+    counter = Counter('demo_total', 'Demo.', ['path'])
+    counter.inc(path='a"b\\c')
+    assert counter.render()[-1] == 'demo_total{path="a\\"b\\\\c"} 1'
+
+def test_requests_are_timed_with_their_statements(student_client):
+    before = REQUEST_LATENCY.count(endpoint='practice.progress', method='GET', status=200)
+    statements_before = REQUEST_STATEMENTS.sum(endpoint='practice.progress')
+    assert student_client.get('/progress').status_code == 200
+    assert REQUEST_LATENCY.count(endpoint='practice.progress', method='GET', status=200) == before + 1
+    assert REQUEST_STATEMENTS.sum(endpoint='practice.progress') > statements_before
+
+def test_socket_handlers_are_counted():
+    @observe_socket_event('demo_event')
+    def handler(data):
+        if data is None:
+            raise ValueError
+    handler({})
+    with pytest.raises(ValueError):
+        handler(None)
+    assert SOCKET_EVENTS.value(event='demo_event', outcome='ok') == 1
+    assert SOCKET_EVENTS.value(event='demo_event', outcome='error') == 1
+
+def test_metrics_refuses_students(student_client):
+    assert student_client.get('/metrics').status_code == 403
+
+def test_metrics_for_admins(admin_client):
+    response = admin_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE http_request_duration_seconds histogram' in response.get_data(as_text=True)
+    assert 'db_statements_total{engine="primary"}' in response.get_data(as_text=True)
+
+def test_metrics_token(app, client):
+    app.config['METRICS_TOKEN'] = 'scrape-me'
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'}).status_code == 200
@@ -0,0 +1,87 @@
+import os
+from flask_migrate import downgrade, stamp, upgrade
+from sqlalchemy import inspect, text
+from app import create_app
+from database import db
+from models.practice_attempt import PracticeAttempt
+from models.user import User
+from models.user_fact_stat import UserFactStat
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+BASELINE = 'a14432bd1bce'
+
+def file_app(path):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'WTF_CSRF_ENABLED': False,
+        'SESSION_COOKIE_SECURE': False
+    })
+
+def test_baseline_database_upgrades_to_head(tmp_path):
+    path = tmp_path / 'fluency.db'
+
+    # A database as the first release left it: baseline tables, stamped at the first revision
+    app = file_app(path)
+    with app.app_context():
+        stamp(directory=MIGRATIONS, revision='head')
+        downgrade(directory=MIGRATIONS, revision=BASELINE)
+        assert 'num1' not in {c['name'] for c in inspect(db.engine).get_columns('practice_attempt')}
+        db.session.add(User(username='student', email='student@example.com', is_teacher=False))
+        db.session.commit()
+        db.session.execute(text(
+            "INSERT INTO practice_attempt (user_id, operation, level, problem, user_answer, "
+            "correct_answer, is_correct, time_taken, created_at) "
+            "VALUES (1, 'multiplication', 7, '7 × 3', 21, 21, 1, 2.5, CURRENT_TIMESTAMP)"
+        ))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+    # The current app starts on it (as `flask db upgrade` does) and upgrades it
+    app = file_app(path)
+    with app.app_context():
+        assert set(inspect(db.engine).get_table_names()).isdisjoint({'user_fact_stats', 'attempt_window'})
+        upgrade(directory=MIGRATIONS)
+
+        attempt = PracticeAttempt.query.one()
+        assert (attempt.num1, attempt.num2) == (7, 3)
+        [stat] = UserFactStat.query.all()
+        assert (stat.fact_id, stat.attempts, stat.correct) == (attempt.fact_id, 1, 1)
+
+        student = User.query.one()
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(student.id)
+            session['_fresh'] = True
+        assert client.get('/progress').status_code == 200
+        db.session.remove()
+        db.engine.dispose()
+
+def test_only_copied_commutative_attempts_are_dropped(tmp_path):
+    app = file_app(tmp_path / 'fluency.db')
+    with app.app_context():
+        stamp(directory=MIGRATIONS, revision='head')
+        downgrade(directory=MIGRATIONS, revision='c5e8a31f7d92')
+        db.session.add(User(username='student', email='student@example.com', is_teacher=False))
+        db.session.commit()
+        rows = [
+            # The old handlers' copy: "4 × 3" straight after "3 × 4", same answer and time
+            ('3 × 4', 3, 2.5, '2026-01-01 10:00:00'), ('4 × 3', 4, 2.5, '2026-01-01 10:00:00'),
+            # A student who really answered both orders, one after the other
+            ('3 × 4', 4, 2.0, '2026-01-01 11:00:00'), ('4 × 3', 4, 3.0, '2026-01-01 11:00:05'),
+            ('5 × 6', 6, 1.5, '2026-01-01 12:00:00'), ('6 × 5', 6, 1.5, '2026-01-01 12:00:30'),
+        ]
+        for problem, level, time_taken, created_at in rows:
+            db.session.execute(text(
+                "INSERT INTO practice_attempt (user_id, operation, level, problem, user_answer, "
+                "correct_answer, is_correct, time_taken, created_at) "
+                "VALUES (1, 'multiplication', :level, :problem, 0, 0, 1, :time_taken, :created_at)"
+            ), {'level': level, 'problem': problem, 'time_taken': time_taken, 'created_at': created_at})
+        db.session.commit()
+
+        upgrade(directory=MIGRATIONS)
+        kept = [a.id for a in PracticeAttempt.query.order_by(PracticeAttempt.id)]
+        assert kept == [1, 3, 4, 5, 6]
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,150 @@
+from database import db
+from models.practice_attempt import PracticeAttempt
+from utils.fact_catalog import fact_id
+
+def test_get_problem_single(student_client):
+    response = student_client.post('/get_problem', json={'operation': 'multiplication', 'level': 7})
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['problem'].startswith('7 × ')
+    assert data['answer'] == 7 * int(data['problem'].split(' × ')[1])
+
+def test_get_problem_batch(student_client):
+    response = student_client.post('/get_problem', json={
+        'operation': 'multiplication', 'level': 7, 'count': 5
+    })
+    data = response.get_json()
+    assert response.status_code == 200
+    assert len(data['problems']) == 5
+    for problem in data['problems']:
+        assert problem['problem'].startswith('7 × ')
+    assert data['mastery']['level'] == 7
+    assert data['mastery']['total_facts'] == 13
+    assert data['mastery']['mastered_facts'] == 0
+    assert data['mastery']['avg_time'] is None
+
+def test_get_problem_batch_is_capped(student_client):
+    response = student_client.post('/get_problem', json={
+        'operation': 'addition', 'level': 1, 'count': 1000
+    })
+    assert len(response.get_json()['problems']) == 20
+
+def test_get_problem_batch_level_up(student_client, student):
+    for i in range(13):
+        for _ in range(3):
+            db.session.add(PracticeAttempt(
+                user_id=student.id, operation='multiplication', level=2,
+                problem=f"2 × {i}", user_answer=2 * i, correct_answer=2 * i,
+                is_correct=True, time_taken=2.0
+            ))
+    db.session.commit()
+    response = student_client.post('/get_problem', json={
+        'operation': 'multiplication', 'level': 2, 'count': 5
+    })
+    data = response.get_json()
+    assert data['level_up'] is True
+    assert data['new_level'] == 3
+
+def test_check_answer_returns_next_problems(app, student_client, student):
+    from sqlalchemy import event
+    answer = {
+        'operation': 'multiplication', 'level': 3, 'problem': '3 × 4',
+        'answer': 12, 'time_taken': 2.5, 'next_count': 4
+    }
+    student_client.post('/check_answer', json=answer)
+
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = student_client.post('/check_answer', json=answer)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['is_correct'] is True
+    assert data['correct_answer'] == 12
+    assert len(data['next']['problems']) == 4
+    assert data['next']['mastery']['level'] == 3
+    # Level decisions come from the recent-outcomes window, not the attempts table
+    assert not [s for s in statements if 'ORDER BY practice_attempt.created_at DESC' in s]
+    # ... and that window is only read back when an attempt is pushed into it
+    inserts = [s for s in statements if s.startswith('INSERT INTO practice_attempt')]
+    window_reads = [s for s in statements if s.startswith('SELECT') and 'FROM attempt_window' in s]
+    assert len(window_reads) == len(inserts)
+
+def test_check_answer_without_next(student_client):
+    response = student_client.post('/check_answer', json={
+        'operation': 'addition', 'level': 1, 'problem': '4 + 1', 'answer': 6
+    })
+    data = response.get_json()
+    assert data['is_correct'] is False
+    assert 'next' not in data
+
+def test_progress_renders_multiplication_table(student_client, student):
+    for answer in (12, 12, 11):
+        db.session.add(PracticeAttempt(
+            user_id=student.id, operation='multiplication', level=3, problem='3 × 4',
+            user_answer=answer, correct_answer=12, is_correct=answer == 12, time_taken=None
+        ))
+    db.session.commit()
+    response = student_client.get('/progress')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Multiplication Table Progress' in page
+    assert '<div class="accuracy">67%</div>' in page
+
+def test_check_answer_grades_operands(student_client, student):
+    response = student_client.post('/check_answer', json={
+        'operation': 'multiplication', 'level': 7, 'problem': '7 × 3',
+        'num1': 7, 'num2': 3, 'answer': 21, 'time_taken': 2.0
+    })
+    assert response.get_json()['is_correct']
+    attempt = PracticeAttempt.query.filter_by(user_id=student.id).one()
+    assert (attempt.num1, attempt.num2) == (7, 3)
+    assert attempt.fact_id == fact_id('multiplication', 3, 7)
+
+def test_check_answer_problem_must_match_operands(student_client, student):
+    response = student_client.post('/check_answer', json={
+        'operation': 'multiplication', 'level': 7, 'problem': '7 × 8', 'num1': 1, 'num2': 1, 'answer': 1
+    })
+    assert response.status_code == 400
+    assert PracticeAttempt.query.count() == 0
+
+    # A problem string that doesn't parse is replaced by the operands' own
+    student_client.post('/check_answer', json={
+        'operation': 'division', 'level': 4, 'problem': '12 / 4', 'num1': 12, 'num2': 4, 'answer': 3
+    })
+    attempt = PracticeAttempt.query.one()
+    assert (attempt.problem, attempt.is_correct) == ('12 ÷ 4', True)
+
+def test_check_answer_parses_legacy_problem(student_client, student):
+    response = student_client.post('/check_answer', json={
+        'operation': 'subtraction', 'level': 3, 'problem': '9 - 3', 'answer': 5
+    })
+    assert not response.get_json()['is_correct']
+    assert PracticeAttempt.query.filter_by(user_id=student.id).one().fact_id == fact_id('subtraction', 9, 3)
+
+    response = student_client.post('/check_answer', json={
+        'operation': 'subtraction', 'level': 3, 'problem': 'nine minus three', 'answer': 6
+    })
+    assert response.status_code == 400
+
+def test_unknown_level_has_no_problems(student_client, student):
+    for count in (None, 3):
+        response = student_client.post('/get_problem', json={
+            'operation': 'addition', 'level': 99, 'count': count
+        })
+        assert response.status_code == 404
+        assert response.get_json()['error'] == 'No problems available'
+
+    # The attempt is still saved and graded; only the prefetch comes back empty
+    response = student_client.post('/check_answer', json={
+        'operation': 'addition', 'level': 99, 'problem': '4 + 1', 'answer': 5, 'next_count': 3
+    })
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['is_correct'] is True
+    assert data['next']['error'] == 'No problems available'
+    assert PracticeAttempt.query.filter_by(user_id=student.id).count() == 1
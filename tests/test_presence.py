@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from database import db
+from models.active_session import ActiveSession
+from models.class_ import Class
+from models.user import User
+
+@pytest.fixture
+def tracker(app):
+    return app.extensions['presence']
+
+@pytest.fixture
+def teacher_client(app):
+    teacher = User(username='teacher', email='teacher@example.com', is_teacher=True)
+    db.session.add(teacher)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(teacher.id)
+        session['_fresh'] = True
+    return client
+
+def count_writes(app):
+    writes = []
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
+            writes.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    return writes
+
+def test_requests_do_not_write_heartbeats(app, student_client, tracker):
+    writes = count_writes(app)
+    for _ in range(5):
+        student_client.get('/practice')
+    assert writes == []
+    assert [p.username for p in tracker.active()] == ['student']
+    assert tracker.active()[0].activity_type == 'practice'
+
+def test_flush_writes_each_user_once(app, tracker, student):
+    other = User(username='other', email='other@example.com', is_teacher=False)
+    db.session.add(other)
+    db.session.commit()
+    db.session.add(ActiveSession(user_id=other.id, activity_type='quiz'))
+    db.session.commit()
+
+    writes = count_writes(app)
+    for _ in range(3):
+        tracker.heartbeat(student, 'practice', 'Practice Mode')
+        tracker.heartbeat(other)
+    assert tracker.flush() == 2
+    assert len(writes) == 2  # One UPDATE batch for other, one INSERT for student
+
+    rows = {s.user_id: s for s in ActiveSession.query.all()}
+    assert rows[student.id].activity_type == 'practice'
+    assert rows[other.id].activity_type == 'quiz'  # A bare heartbeat keeps the activity
+    assert tracker.flush() == 0
+
+def test_users_deleted_elsewhere_are_dropped(app, tracker, student):
+    other = User(username='other', email='other@example.com', is_teacher=False)
+    db.session.add(other)
+    db.session.commit()
+    tracker.heartbeat(student, 'practice', 'Practice Mode')
+    tracker.heartbeat(other, 'practice', 'Practice Mode')
+    # Another worker deletes the user; this one never hears forget()
+    User.query.filter_by(id=other.id).delete()
+    db.session.commit()
+
+    assert tracker.flush() == 1
+    assert [s.user_id for s in ActiveSession.query.all()] == [student.id]
+    assert tracker.flush() == 0  # Nothing left dirty to retry
+    assert [p.username for p in tracker.active()] == ['student']
+
+def test_sees_other_workers_after_a_flush(app, tracker, student):
+    db.session.add(ActiveSession(user_id=student.id, activity_type='assignment',
+                                 last_active=datetime.utcnow() - timedelta(minutes=1)))
+    db.session.commit()
+    assert [(p.username, p.activity_type) for p in tracker.active()] == [('student', 'assignment')]
+
+    ActiveSession.query.update({'last_active': datetime.utcnow() - timedelta(hours=1)})
+    db.session.commit()
+    tracker.flush()
+    assert tracker.active() == []
+
+def test_active_students_page_reads_the_tracker(app, tracker, teacher_client, student):
+    class_ = Class('Room 7')
+    class_.teachers.append(User.query.filter_by(username='teacher').one())
+    class_.students.append(student)
+    db.session.add(class_)
+    db.session.commit()
+    tracker.heartbeat(student, 'practice', 'Practice Mode')
+    response = teacher_client.get('/active-students')
+    assert response.status_code == 200
+    assert b'student' in response.data
+    assert b'Practice Mode' in response.data
+
+@pytest.fixture
+def index(app):
+    return app.extensions['class_presence']
+
+@pytest.fixture
+def school(app):
+    """Two teachers: one with two classes sharing a student, one with a class of their own."""
+    teachers = [User(username=f'teacher{i}', email=f'teacher{i}@example.com', is_teacher=True) for i in range(2)]
+    students = [User(username=f'student{i}', email=f'student{i}@example.com', is_teacher=False) for i in range(5)]
+    classes = [Class(f'Room {i}') for i in range(3)]
+    classes[0].teachers.append(teachers[0])
+    classes[0].students.extend(students[0:3])
+    classes[1].teachers.append(teachers[0])
+    classes[1].students.extend(students[2:4])
+    classes[2].teachers.append(teachers[1])
+    classes[2].students.append(students[4])
+    db.session.add_all(teachers + students + classes)
+    db.session.commit()
+    return teachers, students, classes
+
+def test_active_by_class_intersects_rosters(app, tracker, index, school):
+    teachers, students, classes = school
+    for student in (students[0], students[2], students[4]):
+        tracker.heartbeat(student, 'practice', 'Practice Mode')
+    assert index.active_by_class(teachers[0].id) == {
+        classes[0].id: {students[0].id, students[2].id},
+        classes[1].id: {students[2].id},
+    }
+    assert [p.user_id for p in index.active_for(teachers[1].id)] == [students[4].id]
+
+def test_views_do_not_query_per_student(app, tracker, index, school):
+    teachers, students, _ = school
+    teacher_id = teachers[0].id
+    for student in students:
+        tracker.heartbeat(student, 'practice', 'Practice Mode')
+    index.active_for(teacher_id)
+    writes = count_writes(app)
+    queries = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+    for student in students:
+        tracker.heartbeat(student)  # Only moves last_active; the snapshot stands
+    assert len(index.active_for(teacher_id)) == 4
+    assert queries == [] and writes == []
+
+def test_roster_changes_reload_the_index(app, tracker, index, school):
+    teachers, students, classes = school
+    tracker.heartbeat(students[4], 'practice', 'Practice Mode')
+    assert index.active_for(teachers[0].id) == []
+    classes[0].add_student(students[4])
+    assert [p.user_id for p in index.active_for(teachers[0].id)] == [students[4].id]
+    assert students[4].id in index.students_of(teachers[0].id)
@@ -4,22 +4,6 @@ from database import db
 from models.practice_attempt import PracticeAttempt
 from models.user import User
 from services.progress_service import ProgressService
-from app import create_app
-
-@pytest.fixture
-def app():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    return app
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
-
-@pytest.fixture
-def runner(app):
-    return app.test_cli_runner()
 
 @pytest.fixture
 def test_user(app):
@@ -31,6 +15,7 @@ def test_user(app):
         )
         db.session.add(user)
         db.session.commit()
+        db.session.refresh(user)  # Load attributes before the session closes
         return user
 
 @pytest.fixture
@@ -106,6 +91,103 @@ def test_get_multiplication_table_stats(app, test_user, test_attempts):
         stats = ProgressService.get_multiplication_table_stats(test_user.id)
         
         # Check the 2×3 entry
-        assert stats[2][3]['attempts'] == 10
-        assert stats[2][3]['correct'] == 9
-        assert stats[2][3]['accuracy'] == 90.0
+        assert stats.attempts[2, 3] == 10
+        assert stats.correct[2, 3] == 9
+        assert stats.accuracy[2, 3] == 90.0
+        assert stats.average_time[2, 3] == 3.1
+        # 2 × 3 and 3 × 2 are the same fact
+        assert stats.attempts[3, 2] == 10
+        assert stats.attempts.sum() == 20
+
+def test_multiplication_table_without_times(app, test_user):
+    with app.app_context():
+        db.session.add(PracticeAttempt(
+            user_id=test_user.id, operation='multiplication', level=0, problem='0 × 7',
+            user_answer=0, correct_answer=0, is_correct=True, time_taken=None
+        ))
+        db.session.commit()
+        stats = ProgressService.get_multiplication_table_stats(test_user.id)
+        assert stats.attempts[0, 7] == 1
+        assert stats.accuracy[0, 7] == 100.0
+        assert stats.average_time[0, 7] == 0
+
+def add_timed_attempt(user_id, operation, level, is_correct, created_at, time_taken=2.0):
+    db.session.add(PracticeAttempt(
+        user_id=user_id, operation=operation, level=level, problem='2 + 3',
+        user_answer=5 if is_correct else 4, correct_answer=5,
+        is_correct=is_correct, time_taken=time_taken, created_at=created_at
+    ))
+
+def test_streak_follows_created_at(app, test_user):
+    with app.app_context():
+        now = datetime.utcnow()
+        # Inserted out of order: the miss is the oldest attempt
+        add_timed_attempt(test_user.id, 'addition', 1, True, now - timedelta(minutes=1))
+        add_timed_attempt(test_user.id, 'addition', 1, True, now)
+        add_timed_attempt(test_user.id, 'addition', 2, False, now - timedelta(minutes=5))
+        add_timed_attempt(test_user.id, 'addition', 2, True, now - timedelta(minutes=3))
+        add_timed_attempt(test_user.id, 'subtraction', 1, False, now)
+        db.session.commit()
+
+        assert ProgressService.get_current_streaks(test_user.id) == {'addition': 3}
+        assert ProgressService.get_student_stats(test_user.id, 'addition')['current_streak'] == 3
+        assert ProgressService.get_student_stats(test_user.id)['current_streak'] == 0
+
+def test_all_student_stats_in_two_queries(app, test_user, test_attempts):
+    from sqlalchemy import event
+    with app.app_context():
+        add_timed_attempt(test_user.id, 'addition', 2, True, datetime.utcnow(), time_taken=None)
+        add_timed_attempt(test_user.id, 'addition', 2, False, datetime.utcnow(), time_taken=6.0)
+        db.session.commit()
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            stats = ProgressService.get_all_student_stats(
+                test_user.id, ['addition', 'subtraction', 'multiplication', 'division']
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert len(statements) == 2
+        assert set(stats) == {'addition', 'multiplication'}
+        assert stats['multiplication'] == ProgressService.get_student_stats(test_user.id, 'multiplication')
+        addition = stats['addition']
+        assert addition['total_attempts'] == 2
+        assert addition['accuracy'] == 50.0
+        assert addition['average_time'] == 0  # The only correct answer was untimed
+        assert addition['current_streak'] == 0
+        assert addition['levels']['2']['avg_time'] == 6.0
+        assert addition['levels']['2']['description'] == 'Adding 2 to single digit'
+
+def test_get_level_stats(app, test_user, test_attempts):
+    with app.app_context():
+        stats = ProgressService.get_level_stats(test_user.id, 'multiplication', 1)
+        attempts = PracticeAttempt.query.filter_by(user_id=test_user.id, level=1).all()
+        assert stats == ProgressService.calculate_level_stats(attempts, stats['description'])
+        assert ProgressService.get_level_stats(test_user.id, 'multiplication', 2) is None
+
+def test_recent_activity_uses_each_students_last_attempts(app, test_user):
+    from services.query_budget import query_budget
+    with app.app_context():
+        other = User(username='other', email='other@example.com', is_teacher=False)
+        db.session.add(other)
+        db.session.commit()
+        now = datetime.utcnow()
+        # 5 old misses fall outside the last 4
+        for minutes in range(10, 15):
+            add_timed_attempt(test_user.id, 'multiplication', 3, False, now - timedelta(minutes=minutes))
+        for minutes, correct in ((4, True), (3, True), (2, False), (1, True)):
+            add_timed_attempt(test_user.id, 'addition', 1, correct, now - timedelta(minutes=minutes))
+        add_timed_attempt(other.id, 'subtraction', 1, False, now)
+        db.session.commit()
+        user_ids = [test_user.id, other.id, 999]
+
+        with query_budget(1):
+            recent = ProgressService.get_recent_activity(user_ids, limit=4)
+        assert recent[user_ids[0]] == (4, 3, 75.0, 'addition')
+        assert recent[user_ids[1]] == (1, 0, 0.0, 'subtraction')
+        assert 999 not in recent
+        assert ProgressService.get_recent_activity([]) == {}
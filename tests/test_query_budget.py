@@ -0,0 +1,123 @@
+import logging
+import pytest
+from database import db
+from models.class_ import Class
+from models.practice_attempt import PracticeAttempt
+from models.quiz import Quiz, QuizParticipant
+from models.user import User
+from services.query_budget import QueryBudgetExceeded, query_budget
+import websockets.quiz
+
+def login(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+def seed_classes(teacher, students, count=10):
+    classes = [Class(name=f'Room {i}', class_code=f'ROOM{i:02d}') for i in range(count)]
+    db.session.add_all(classes)
+    db.session.commit()
+    for class_ in classes:
+        class_.add_teacher(teacher, is_primary=True)
+        for student in students:
+            class_.add_student(student)
+    db.session.commit()
+    return classes
+
+def test_budget_counts_statements(app, student):
+    with query_budget(2) as counter:
+        User.query.count()
+        User.query.count()
+    assert len(counter) == 2
+
+    with pytest.raises(QueryBudgetExceeded, match='budget is 1'):
+        with query_budget(1):
+            User.query.count()
+            User.query.count()
+
+def test_budget_warns_when_not_strict(app, student, caplog):
+    @query_budget(1, strict=False)
+    def lookups():
+        User.query.count()
+        User.query.count()
+    with caplog.at_level(logging.WARNING, logger='services.query_budget'):
+        lookups()
+        lookups()
+    assert [r.getMessage() for r in caplog.records] == [
+        'test_budget_warns_when_not_strict.<locals>.lookups ran 2 SQL statements; its budget is 1'
+    ] * 2
+
+def test_every_request_has_a_budget(app, student_client):
+    app.config['QUERY_BUDGET_PER_REQUEST'] = 0
+    with pytest.raises(QueryBudgetExceeded, match='GET practice.progress'):
+        student_client.get('/progress')
+
+def test_teacher_welcome_is_flat_in_classes(app, student):
+    teacher = User(username='teacher', email='teacher@example.com', is_teacher=True)
+    db.session.add(teacher)
+    db.session.commit()
+    seed_classes(teacher, [student])
+    response = login(app, teacher).get('/welcome')
+    assert response.status_code == 200
+    assert b'Students: 1' in response.data
+
+def test_student_welcome_is_flat_in_classes(app, student):
+    teacher = User(username='teacher', email='teacher@example.com', is_teacher=True)
+    db.session.add(teacher)
+    db.session.commit()
+    seed_classes(teacher, [student])
+    response = login(app, student).get('/welcome')
+    assert response.status_code == 200
+    assert b'Teacher: teacher' in response.data
+
+def test_leaderboard_is_one_query(app, monkeypatch):
+    users = [User(username=f'player{i}', email=f'player{i}@example.com', is_teacher=False) for i in range(10)]
+    quiz = Quiz(title='Times tables', operation='multiplication', level=3, duration=60, teacher_id=1)
+    db.session.add_all(users + [quiz])
+    db.session.commit()
+    db.session.add_all([QuizParticipant(quiz_id=quiz.id, user_id=user.id, score=i) for i, user in enumerate(users)])
+    db.session.commit()
+
+    quiz_id = quiz.id
+    sent = []
+    monkeypatch.setattr(websockets.quiz, 'emit', lambda event, data, room: sent.append(data))
+    with query_budget(1):
+        websockets.quiz.send_leaderboard(quiz_id)
+    assert [row['username'] for row in sent[0]['leaderboard']][:2] == ['player9', 'player8']
+
+def test_active_students_is_flat_in_students(app):
+    teacher = User(username='teacher', email='teacher@example.com', is_teacher=True)
+    students = [User(username=f'student{i}', email=f'student{i}@example.com', is_teacher=False) for i in range(30)]
+    db.session.add_all([teacher] + students)
+    db.session.commit()
+    seed_classes(teacher, students, count=3)
+    tracker = app.extensions['presence']
+    for i, student in enumerate(students):
+        db.session.add(PracticeAttempt(
+            user_id=student.id, operation='addition', level=1, problem='2 + 3',
+            user_answer=5, correct_answer=5, is_correct=bool(i % 2), time_taken=2.0
+        ))
+        tracker.heartbeat(student, 'practice', 'Practice Mode')
+    db.session.commit()
+
+    response = login(app, teacher).get('/active-students')
+    assert response.status_code == 200
+    assert response.data.count(b'Practice Mode') == 30
+
+def test_progress_is_flat_in_levels(app, student):
+    for level in range(1, 11):
+        for operation, problem in (('addition', f'{level} + 1'), ('multiplication', f'{level} × 2')):
+            answer = level + 1 if operation == 'addition' else level * 2
+            for correct in (True, True, False):
+                db.session.add(PracticeAttempt(
+                    user_id=student.id, operation=operation, level=level, problem=problem,
+                    user_answer=answer if correct else 0, correct_answer=answer,
+                    is_correct=correct, time_taken=2.0
+                ))
+    db.session.commit()
+
+    response = login(app, student).get('/progress')
+    assert response.status_code == 200
+    assert response.data.count(b'Learning') == 20
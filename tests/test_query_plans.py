@@ -0,0 +1,148 @@
+"""Query-plan regression tests.
+
+Each case runs real code from PracticeTracker, ProgressService and
+teacher_routes, captures the SELECTs it issues, and EXPLAINs them (EXPLAIN
+QUERY PLAN on SQLite, EXPLAIN on PostgreSQL, see TEST_DATABASE_URL in
+conftest). A case fails if any of its queries reads a table by full scan.
+"""
+import re
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event, text
+from database import db
+from models.active_session import ActiveSession
+from models.class_ import Class
+from models.practice_attempt import PracticeAttempt
+from models.user import User
+from routes.teacher_routes import get_student_accuracy
+from services.progress_service import ProgressService
+from utils.practice_tracker import PracticeTracker
+
+@pytest.fixture
+def practiced(app, student):
+    """A student with some history across operations, and their teacher."""
+    now = datetime.utcnow()
+    for i in range(30):
+        for operation, level, problem, answer in (
+            ('multiplication', 3, f"3 × {i % 13}", 3 * (i % 13)),
+            ('addition', 2, f"{i % 9 + 1} + 2", i % 9 + 3),
+            ('subtraction', 1, f"{i % 9 + 1} - 1", i % 9)
+        ):
+            db.session.add(PracticeAttempt(
+                user_id=student.id, operation=operation, level=level, problem=problem,
+                user_answer=answer if i % 4 else answer + 1, correct_answer=answer,
+                is_correct=bool(i % 4), time_taken=2.0 + i % 3,
+                created_at=now - timedelta(minutes=30 - i)
+            ))
+    teacher = User(username='teacher', email='teacher@example.com', is_teacher=True)
+    class_ = Class('Room 7')
+    class_.teachers.append(teacher)
+    class_.students.append(student)
+    db.session.add_all([teacher, class_, ActiveSession(user_id=student.id, activity_type='practice')])
+    db.session.commit()
+    return student, teacher
+
+def capture_selects(fn):
+    """Run fn and return the (statement, parameters) of every SELECT it executed."""
+    captured = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and not executemany:
+            captured.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        fn()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return captured
+
+def full_scans(statement, parameters):
+    """Tables a statement's plan reads in full."""
+    tables = set(db.metadata.tables)
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+            # "SCAN t" or "SCAN t USING [COVERING] INDEX i" both read every row of t
+            scanned = [m.group(1) for m in (re.match(r'SCAN (\w+)', row[-1]) for row in plan) if m]
+        elif connection.dialect.name == 'postgresql':
+            # Small test tables always look cheapest to seq scan; only flag unavoidable ones.
+            # LOCAL: the connection goes back to the pool, and closing it rolls this back
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            plan = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).all()
+            scanned = re.findall(r'Seq Scan on (\w+)', '\n'.join(row[0] for row in plan))
+        else:
+            pytest.skip(f"No query plan check for {connection.dialect.name}")
+    # SQLAlchemy aliases tables as name_1, name_2, ...
+    return sorted({name for name in (re.sub(r'_\d+$', '', s) for s in scanned) if name in tables})
+
+def assert_no_full_scans(fn):
+    statements = capture_selects(fn)
+    assert statements, "case ran no queries"
+    failures = [(scans, statement) for statement, parameters in statements
+                for scans in [full_scans(statement, parameters)] if scans]
+    assert not failures, '\n\n'.join(f"Full scan of {', '.join(scans)}:\n{statement}"
+                                    for scans, statement in failures)
+
+def tracker_cases(student_id):
+    return {
+        'tracker.get_problem_stats': lambda: PracticeTracker.get_problem_stats(db, student_id, 'multiplication', 3),
+        'tracker.check_level_mastery': lambda: PracticeTracker.check_level_mastery(db, student_id, 'addition', 2),
+        'tracker.get_problem': lambda: PracticeTracker.get_problem('multiplication', 3, student_id, db),
+        'tracker.get_problems': lambda: PracticeTracker.get_problems('addition', 2, 5, student_id, db),
+    }
+
+def progress_cases(student_id):
+    return {
+        'progress.get_student_stats': lambda: ProgressService.get_student_stats(student_id, 'addition'),
+        'progress.get_student_stats_all_operations': lambda: ProgressService.get_student_stats(student_id),
+        'progress.get_all_student_stats': lambda: ProgressService.get_all_student_stats(
+            student_id, ['addition', 'subtraction', 'multiplication', 'division']),
+        'progress.get_level_stats': lambda: ProgressService.get_level_stats(student_id, 'multiplication', 3),
+        'progress.get_level_problem_stats': lambda: ProgressService.get_level_problem_stats(
+            student_id, 'multiplication', 3),
+        'progress.get_multiplication_table_stats': lambda: ProgressService.get_multiplication_table_stats(student_id),
+        'progress.should_change_level': lambda: ProgressService.should_change_level(student_id, 'subtraction', 1),
+        'progress.analyze_missed_problems': lambda: ProgressService.analyze_missed_problems(student_id),
+        'progress.analyze_missed_problems_by_operation': lambda: ProgressService.analyze_missed_problems(
+            student_id, 'multiplication'),
+    }
+
+CASES = sorted(list(tracker_cases(0)) + list(progress_cases(0)))
+
+@pytest.mark.parametrize('case', CASES)
+def test_service_queries_use_indexes(practiced, case):
+    student, _ = practiced
+    cases = {**tracker_cases(student.id), **progress_cases(student.id)}
+    assert_no_full_scans(cases[case])
+
+def test_teacher_dashboard_queries_use_indexes(app, practiced):
+    student, teacher = practiced
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(teacher.id)
+        session['_fresh'] = True
+
+    def dashboard():
+        assert client.get('/active-students').status_code == 200
+    # Class rosters are read whole on purpose, once per CLASS_ROSTER_SECONDS
+    app.extensions['class_presence'].rosters()
+    assert_no_full_scans(dashboard)
+    assert_no_full_scans(lambda: get_student_accuracy(student.id))
+
+def test_seeding_a_window_uses_indexes(app, practiced):
+    student, _ = practiced
+    from models.attempt_window import AttemptWindow, clear_window_cache
+    AttemptWindow.query.delete()
+    db.session.commit()
+    clear_window_cache()
+
+    def answer():
+        db.session.add(PracticeAttempt(
+            user_id=student.id, operation='addition', level=2, problem='5 + 2',
+            user_answer=7, correct_answer=7, is_correct=True, time_taken=2.0
+        ))
+        db.session.commit()
+    assert_no_full_scans(answer)
+
+def test_detects_full_scans(app, practiced):
+    """The check itself: an unindexed filter must be reported."""
+    assert full_scans('SELECT id FROM practice_attempt WHERE time_taken > 1', ()) == ['practice_attempt']
@@ -0,0 +1,120 @@
+import sqlite3
+import pytest
+from sqlalchemy import event
+from app import create_app
+from database import db, read_from_replica, replica_reads
+from models.attempt_window import clear_window_cache
+from models.practice_attempt import PracticeAttempt
+from models.user import User
+from services.progress_service import ProgressService
+
+class ReplicationStandIn:
+    """Copies the primary SQLite file onto the replica file when asked.
+    lag_seconds is what the replica reports as its lag."""
+
+    def __init__(self, primary_path, replica_path):
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.lag_seconds = 0.0
+
+    def sync(self):
+        source, target = sqlite3.connect(self.primary_path), sqlite3.connect(self.replica_path)
+        with target:
+            source.backup(target)
+        source.close()
+        target.close()
+        self.lag_seconds = 0.0
+
+    def lag(self, engine):
+        return self.lag_seconds
+
+@pytest.fixture
+def replica_app(tmp_path):
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{primary}',
+        'REPLICA_DATABASE_URI': f'sqlite:///{replica}',
+        'REPLICA_LAG_CHECK_INTERVAL': 0,
+        'WTF_CSRF_ENABLED': False,
+        'SESSION_COOKIE_SECURE': False
+    })
+    replication = ReplicationStandIn(str(primary), str(replica))
+    app.extensions['read_replica'].lag_probe = replication.lag
+    with app.app_context():
+        replication.sync()
+        app.replication = replication
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+        app.extensions['read_replica'].engine.dispose()
+    clear_window_cache()
+
+@pytest.fixture
+def replica_student_id(replica_app):
+    user = User(username='student', email='student@example.com', is_teacher=False)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def add_attempt(user_id, num2=4):
+    db.session.add(PracticeAttempt(
+        user_id=user_id, operation='multiplication', level=3, problem=f'3 × {num2}',
+        user_answer=3 * num2, correct_answer=3 * num2, is_correct=True, time_taken=2.0
+    ))
+    db.session.commit()
+
+def count_statements(engine):
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+def test_replica_reads_are_bounded_by_replication(replica_app, replica_student_id):
+    replica_app.replication.sync()
+    add_attempt(replica_student_id)
+    db.session.remove()
+
+    # Not replicated yet: the replica doesn't have it, the primary does
+    assert ProgressService.get_student_stats(replica_student_id)['total_attempts'] == 0
+    assert PracticeAttempt.query.count() == 1
+
+    replica_app.replication.sync()
+    assert ProgressService.get_student_stats(replica_student_id)['total_attempts'] == 1
+
+def test_lagging_replica_falls_back_to_primary(replica_app, replica_student_id):
+    add_attempt(replica_student_id)
+    db.session.remove()
+    replica_app.replication.lag_seconds = replica_app.config['REPLICA_MAX_LAG'] + 1
+    assert ProgressService.get_student_stats(replica_student_id)['total_attempts'] == 1
+
+def test_writes_go_to_the_primary_and_stick(replica_app, replica_student_id):
+    replica_app.replication.sync()
+    db.session.remove()
+    with replica_reads():
+        assert User.query.count() == 1  # From the replica
+        db.session.add(User(username='teacher', email='teacher@example.com', is_teacher=True))
+        db.session.commit()
+        # Having written, this session reads its own writes from the primary
+        assert User.query.count() == 2
+
+    replica = sqlite3.connect(replica_app.replication.replica_path)
+    assert replica.execute('SELECT COUNT(*) FROM user').fetchone()[0] == 1
+
+def test_dashboards_read_from_the_replica(replica_app, replica_student_id):
+    replica_app.replication.sync()
+    client = replica_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(replica_student_id)
+        session['_fresh'] = True
+    replica_statements = count_statements(replica_app.extensions['read_replica'].engine)
+    client.get('/analyze_level/multiplication/3')
+    assert any('practice_attempt' in statement or 'user_fact_stats' in statement
+               for statement in replica_statements)
+
+def test_decorator_restores_routing(replica_app, replica_student_id):
+    @read_from_replica
+    def inner():
+        return db.session.get_bind() is replica_app.extensions['read_replica'].engine
+    db.session.remove()
+    assert inner()
+    assert db.session.get_bind() is db.engine
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+import pytest
+from database import db
+from models.active_session import ActiveSession
+from models.job_lease import JobLease
+from models.quiz import Quiz, QuizAnswer, QuizParticipant, QuizQuestion
+from models.user import User
+from services.metrics import JOB_DURATION, JOB_ROWS, JOB_RUNS
+from services.query_budget import query_budget
+
+@pytest.fixture
+def scheduler(app):
+    return app.extensions['scheduler']
+
+@pytest.fixture
+def sessions(app):
+    """Three stale sessions and one current one."""
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', is_teacher=False) for i in range(4)]
+    db.session.add_all(users)
+    db.session.commit()
+    stale = datetime.utcnow() - timedelta(minutes=ActiveSession.INACTIVE_THRESHOLD + 1)
+    db.session.add_all([ActiveSession(user_id=user.id, last_active=stale) for user in users[:3]] +
+                       [ActiveSession(user_id=users[3].id)])
+    db.session.commit()
+    return users
+
+def test_stale_sessions_are_deleted_in_one_statement(app, sessions):
+    with query_budget(1):
+        assert ActiveSession.cleanup_inactive(db.session) == 3
+    assert [s.user_id for s in ActiveSession.query.all()] == [sessions[3].id]
+
+def test_prune_keeps_answered_questions(app, student):
+    old = datetime.utcnow() - timedelta(hours=2)
+    finished = Quiz(title='Done', operation='addition', level=1, duration=60, teacher_id=1,
+                    status='finished', created_at=old)
+    running = Quiz(title='Running', operation='addition', level=1, duration=60, teacher_id=1,
+                   status='active', created_at=old)
+    db.session.add_all([finished, running])
+    db.session.commit()
+    answered, unanswered, live = (QuizQuestion(quiz_id=finished.id, problem='1 + 1', answer=2),
+                                  QuizQuestion(quiz_id=finished.id, problem='2 + 2', answer=4),
+                                  QuizQuestion(quiz_id=running.id, problem='3 + 3', answer=6))
+    participant = QuizParticipant(quiz_id=finished.id, user_id=student.id)
+    db.session.add_all([answered, unanswered, live, participant])
+    db.session.commit()
+    db.session.add(QuizAnswer(participant_id=participant.id, question_id=answered.id, answer=2, correct=True))
+    db.session.commit()
+    kept = {answered.id, live.id}
+
+    assert Quiz.prune_finished(db.session) == 1
+    assert {q.id for q in QuizQuestion.query.all()} == kept
+
+def test_runs_report_duration_and_rows(app, scheduler, sessions):
+    runs, rows = JOB_RUNS.value(job='delete_stale_sessions', outcome='ok'), \
+        JOB_ROWS.value(job='delete_stale_sessions')
+    timed = JOB_DURATION.count(job='delete_stale_sessions')
+    result = scheduler.run('delete_stale_sessions')
+    assert result.rows == 3
+    assert JOB_RUNS.value(job='delete_stale_sessions', outcome='ok') == runs + 1
+    assert JOB_ROWS.value(job='delete_stale_sessions') == rows + 3
+    assert JOB_DURATION.count(job='delete_stale_sessions') == timed + 1
+
+def test_lease_lets_one_worker_run_a_job(app, scheduler):
+    assert scheduler.run('prune_finished_quizzes') is not None
+    holder = scheduler.holder
+    scheduler.holder = 'other-host:1'
+    skipped = JOB_RUNS.value(job='prune_finished_quizzes', outcome='skipped')
+    assert scheduler.run('prune_finished_quizzes') is None
+    assert JOB_RUNS.value(job='prune_finished_quizzes', outcome='skipped') == skipped + 1
+    assert scheduler.run('prune_finished_quizzes', force=True) is not None
+
+    # The first worker went away; its lease runs out and is taken over
+    JobLease.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+    assert scheduler.run('prune_finished_quizzes') is not None
+    assert db.session.get(JobLease, 'prune_finished_quizzes').holder == 'other-host:1'
+    assert not JobLease.acquire(db.session, 'prune_finished_quizzes', holder, 60)
+
+def test_run_pending_runs_each_due_job_once(app, scheduler, sessions):
+    ran = scheduler.run_pending()
+    assert sorted(ran) == ['delete_stale_sessions', 'prune_finished_quizzes', 'refresh_fact_stats']
+    assert ran['delete_stale_sessions'].rows == 3
+    assert scheduler.run_pending() == {}
+
+def test_failed_job_is_counted_and_others_still_run(app, scheduler):
+    def broken():
+        raise RuntimeError('boom')
+    scheduler.add_job('broken', broken, 60)
+    ran = scheduler.run_pending()
+    assert 'broken' not in ran and 'delete_stale_sessions' in ran
+    assert JOB_RUNS.value(job='broken', outcome='error') == 1
@@ -0,0 +1,40 @@
+from sqlalchemy import create_engine, text
+from database import configure_engine
+from utils.write_benchmark import run_write_benchmark
+
+def test_pragmas_on_file_databases(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fluency.db'}")
+    queue = configure_engine(engine, {'SQLITE_BUSY_TIMEOUT_MS': '2500'})
+    with engine.connect() as connection:
+        assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert connection.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 2500
+        assert connection.execute(text('PRAGMA cache_size')).scalar() == -64 * 1024
+    assert queue.timeout == 2.5
+
+def test_memory_databases_are_left_alone():
+    assert configure_engine(create_engine('sqlite://')) is None
+
+def test_write_queue_is_released_at_transaction_end(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fluency.db'}")
+    queue = configure_engine(engine, {})
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE t (n INTEGER)'))
+    with engine.connect() as connection:
+        connection.execute(text('INSERT INTO t VALUES (1)'))
+        assert queue._lock.locked()
+        connection.rollback()
+        assert not queue._lock.locked()
+        connection.execute(text('SELECT n FROM t')).all()
+        assert not queue._lock.locked()
+    with engine.connect() as connection:
+        connection.execute(text('INSERT INTO t VALUES (2)'))
+    # Closed without commit: the pool's reset gives the lock back
+    assert not queue._lock.locked()
+    assert queue.transactions == 3
+
+def test_concurrent_writers_do_not_fail(app, tmp_path):
+    result = run_write_benchmark(f"sqlite:///{tmp_path / 'bench.db'}", writers=6, answers=10)
+    assert result['committed'] == 60
+    assert result['failed'] == 0
+    assert result['queue_timeouts'] == 0
@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+from database import db
+from models.user import User
+from models.practice_attempt import PracticeAttempt
+from models.user_fact_stat import UserFactStat
+from services.progress_service import ProgressService
+from utils.fact_catalog import fact_id
+from utils.practice_tracker import PracticeTracker
+
+def add_attempt(user_id, problem, is_correct, time_taken, level=3, operation='multiplication'):
+    num1, num2 = map(int, problem.split(' × '))
+    db.session.add(PracticeAttempt(
+        user_id=user_id, operation=operation, level=level, problem=problem,
+        user_answer=num1 * num2 if is_correct else 0, correct_answer=num1 * num2,
+        is_correct=is_correct, time_taken=time_taken
+    ))
+
+def rollup(user_id):
+    rows = UserFactStat.query.filter_by(user_id=user_id).order_by(UserFactStat.fact_id).all()
+    return [(r.operation, r.level, r.problem, r.attempts, r.correct, r.time_sum, r.min_time, r.max_time)
+            for r in rows]
+
+def test_inserts_update_rollup(app, student):
+    add_attempt(student.id, '3 × 4', True, 2.0)
+    add_attempt(student.id, '3 × 4', False, 5.0)
+    add_attempt(student.id, '3 × 4', True, None)
+    add_attempt(student.id, '3 × 5', True, 1.5)
+    db.session.commit()
+
+    stat = db.session.get(UserFactStat, (student.id, 'multiplication', 3, fact_id('multiplication', 3, 4)))
+    assert stat.attempts == 3
+    assert stat.correct == 2
+    assert stat.time_sum == 7.0
+    assert stat.min_time == 2.0
+    assert stat.max_time == 5.0
+    assert len(rollup(student.id)) == 2
+
+def test_rollback_discards_rollup(app, student):
+    add_attempt(student.id, '3 × 4', True, 2.0)
+    db.session.flush()
+    db.session.rollback()
+    assert rollup(student.id) == []
+
+def test_rebuild_matches_incremental(app, student):
+    for i, (problem, correct, time_taken) in enumerate([
+        ('3 × 4', True, 2.0), ('3 × 4', False, 4.0), ('3 × 6', True, 0),
+        ('3 × 6', True, 3.5), ('3 × 7', False, None)
+    ]):
+        add_attempt(student.id, problem, correct, time_taken)
+    db.session.commit()
+    incremental = rollup(student.id)
+    assert UserFactStat.rebuild(db.session) == 3
+    assert rollup(student.id) == incremental
+
+def test_batched_rebuild_matches_incremental(app, student):
+    others = [User(username=f'other{i}', email=f'other{i}@example.com', is_teacher=False) for i in range(3)]
+    db.session.add_all(others)
+    db.session.commit()
+    users = [student.id] + [other.id for other in others]
+    for i, user_id in enumerate(users):
+        add_attempt(user_id, '3 × 4', True, 2.0)
+        add_attempt(user_id, f'3 × {5 + i}', False, 4.0)
+    db.session.commit()
+    incremental = {user_id: rollup(user_id) for user_id in users}
+    # A stale row for a user with no attempts left goes too
+    UserFactStat.query.filter_by(user_id=others[2].id).update({'attempts': 99})
+    PracticeAttempt.query.filter_by(user_id=others[2].id).delete()
+    db.session.commit()
+
+    assert UserFactStat.rebuild_in_batches(db.session, batch_size=2) == 6
+    assert {user_id: rollup(user_id) for user_id in users} == {**incremental, others[2].id: []}
+
+def test_generic_fallback_matches_upsert(app, student, monkeypatch):
+    add_attempt(student.id, '3 × 4', True, 2.0)
+    add_attempt(student.id, '3 × 4', False, 1.0)
+    db.session.commit()
+    upserted = rollup(student.id)
+    UserFactStat.query.delete()
+    db.session.commit()
+    monkeypatch.setattr(UserFactStat, 'upsert_statement', classmethod(lambda cls, name: None))
+    add_attempt(student.id, '3 × 4', True, 2.0)
+    add_attempt(student.id, '3 × 4', False, 1.0)
+    db.session.commit()
+    assert rollup(student.id) == upserted
+
+def test_readers_use_rollup(app, student):
+    for _ in range(3):
+        add_attempt(student.id, '3 × 4', True, 2.0)
+    add_attempt(student.id, '3 × 5', False, 6.0)
+    db.session.commit()
+
+    stats = PracticeTracker.get_problem_stats(db, student.id, 'multiplication', 3)
+    assert stats['3 × 4']['attempts'] == 3
+    assert stats['3 × 4']['accuracy'] == 1.0
+    assert stats['3 × 5']['avg_time'] == 6.0
+    assert PracticeTracker.is_problem_mastered(stats['3 × 4'])
+
+    assert PracticeAttempt.get_mastery_status(db.session, student.id, 'multiplication', 3) == 'learning'
+
+    problems = ProgressService.get_level_problem_stats(student.id, 'multiplication', 3)
+    assert problems['3 × 5']['fastest_time'] == 6.0
+    assert problems['3 × 4']['accuracy'] == 100.0
+
+def test_stale_facts_are_ignored(app, student):
+    add_attempt(student.id, '3 × 4', True, 2.0)
+    db.session.commit()
+    stat = db.session.get(UserFactStat, (student.id, 'multiplication', 3, fact_id('multiplication', 3, 4)))
+    stat.last_seen = datetime.utcnow() - timedelta(days=30)
+    db.session.commit()
+    assert PracticeTracker.get_problem_stats(db, student.id, 'multiplication', 3) == {}
+
+def test_both_orders_share_a_fact(app, student):
+    add_attempt(student.id, '7 × 3', True, 2.0, level=7)
+    add_attempt(student.id, '3 × 7', False, 4.0, level=3)
+    add_attempt(student.id, '3 × 7', True, 3.0, level=7)
+    db.session.commit()
+    assert rollup(student.id) == [
+        ('multiplication', 3, '3 × 7', 1, 0, 4.0, 4.0, 4.0),
+        ('multiplication', 7, '3 × 7', 2, 2, 5.0, 2.0, 3.0),
+    ]
+
+    # Each table sees every attempt at the fact, under its own problem string
+    assert PracticeTracker.get_problem_stats(db, student.id, 'multiplication', 7)['7 × 3']['attempts'] == 3
+    assert PracticeTracker.get_problem_stats(db, student.id, 'multiplication', 3)['3 × 7']['attempts'] == 3
+    assert ProgressService.get_level_problem_stats(student.id, 'multiplication', 7)['7 × 3']['fastest_time'] == 2.0
+
+    incremental = rollup(student.id)
+    UserFactStat.rebuild(db.session)
+    assert rollup(student.id) == incremental
+
+def test_check_answer_writes_one_row(student_client, student):
+    student_client.post('/check_answer', json={
+        'operation': 'multiplication', 'level': 7, 'problem': '7 × 3', 'answer': 21, 'time_taken': 2.0
+    })
+    assert PracticeAttempt.query.filter_by(user_id=student.id).count() == 1
+
+def test_missed_problems_merge_orders(app, student):
+    add_attempt(student.id, '7 × 3', False, 2.0, level=7)
+    add_attempt(student.id, '3 × 7', False, 2.0, level=3)
+    db.session.commit()
+    assert ProgressService.analyze_missed_problems(student.id) == [
+        {'count': 2, 'operation': 'multiplication', 'problem': '3 × 7'}
+    ]
+
+def test_last_seen_never_moves_back(app, student, monkeypatch):
+    now = datetime.utcnow()
+    key = (student.id, 'multiplication', 3, fact_id('multiplication', 3, 4))
+    db.session.add(PracticeAttempt(
+        user_id=student.id, operation='multiplication', level=3, problem='3 × 4',
+        user_answer=12, correct_answer=12, is_correct=True, time_taken=2.0, created_at=now
+    ))
+    db.session.commit()
+    for fallback in (False, True):
+        if fallback:
+            monkeypatch.setattr(UserFactStat, 'upsert_statement', classmethod(lambda cls, name: None))
+        # A late batch flush of an older answer
+        db.session.add(PracticeAttempt(
+            user_id=student.id, operation='multiplication', level=3, problem='3 × 4',
+            user_answer=12, correct_answer=12, is_correct=True, time_taken=2.0,
+            created_at=now - timedelta(days=10)
+        ))
+        db.session.commit()
+        stat = db.session.get(UserFactStat, key)
+        db.session.refresh(stat)
+        assert stat.last_seen == now
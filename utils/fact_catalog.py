@@ -0,0 +1,75 @@
+import operator
+from types import MappingProxyType
+from typing import Optional, Tuple, Union
+from utils.math_problems import OPERATORS, SYMBOLS
+
+# Every fact the app can ask is (operation, num1, num2), packed into one integer:
+#   fact_id = operation code << 2 * OPERAND_BITS | num1 << OPERAND_BITS | num2
+# Commutative facts are packed smaller operand first, so "7 × 3" and "3 × 7"
+# share an id. Problem strings are for display; grading, grouping and joins
+# use these integers.
+OPERAND_BITS = 10
+OPERAND_LIMIT = 1 << OPERAND_BITS  # Operands must be in [0, 1024)
+OPERAND_MASK = OPERAND_LIMIT - 1
+
+OPERATION_CODES = MappingProxyType({
+    'addition': 1,
+    'subtraction': 2,
+    'multiplication': 3,
+    'division': 4
+})
+OPERATION_NAMES = MappingProxyType({code: name for name, code in OPERATION_CODES.items()})
+
+# Operations where "a ○ b" and "b ○ a" are the same fact to a student
+COMMUTATIVE_OPERATIONS = frozenset({'multiplication'})
+
+CATALOG_SYMBOLS = MappingProxyType({**SYMBOLS, 'division': '÷'})
+_SOLVERS = MappingProxyType({**OPERATORS, 'division': operator.truediv})
+
+def fact_id(operation: str, num1: int, num2: int) -> Optional[int]:
+    """Pack a fact into its id, or None if it can't be catalogued."""
+    code = OPERATION_CODES.get(operation)
+    if code is None or not (0 <= num1 < OPERAND_LIMIT and 0 <= num2 < OPERAND_LIMIT):
+        return None
+    if operation in COMMUTATIVE_OPERATIONS and num1 > num2:
+        num1, num2 = num2, num1
+    return code << 2 * OPERAND_BITS | num1 << OPERAND_BITS | num2
+
+def operation_fact_range(operation: str) -> Tuple[int, int]:
+    """Lowest and highest id an operation's facts can have, for range filters."""
+    code = OPERATION_CODES[operation]
+    return code << 2 * OPERAND_BITS, (code + 1 << 2 * OPERAND_BITS) - 1
+
+def fact_operands(fact: int) -> Tuple[int, int]:
+    return fact >> OPERAND_BITS & OPERAND_MASK, fact & OPERAND_MASK
+
+def unpack_fact(fact: int) -> Tuple[str, int, int]:
+    """The (operation, num1, num2) a fact id stands for, in canonical order."""
+    return (OPERATION_NAMES[fact >> 2 * OPERAND_BITS], *fact_operands(fact))
+
+def format_problem(operation: str, num1: int, num2: int) -> str:
+    return f"{num1} {CATALOG_SYMBOLS[operation]} {num2}"
+
+def fact_problem(fact: int) -> str:
+    """Display string for a fact id (canonical operand order)."""
+    return format_problem(*unpack_fact(fact))
+
+def parse_problem(operation: str, problem: str) -> Optional[Tuple[int, int]]:
+    """Operands of a problem string like "7 × 3", or None if it doesn't parse.
+
+    Only for input that arrives as text (older clients, historical rows).
+    """
+    symbol = CATALOG_SYMBOLS.get(operation)
+    if symbol is None or not problem:
+        return None
+    parts = problem.split(symbol)
+    if len(parts) != 2:
+        return None
+    try:
+        return int(parts[0].strip()), int(parts[1].strip())
+    except ValueError:
+        return None
+
+def solve(operation: str, num1: int, num2: int) -> Union[int, float]:
+    """The correct answer to a fact."""
+    return _SOLVERS[operation](num1, num2)
@@ -0,0 +1,174 @@
+import random
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from utils.math_problems import LEVEL_REGISTRY, OPERATORS, SYMBOLS, NumberSpec
+from utils.fact_catalog import fact_id
+
+# Selection weights
+UNATTEMPTED_WEIGHT = 1.0  # Weight of a fact the student hasn't tried yet
+ERROR_WEIGHT = 4.0        # Extra weight per unit of error rate on an attempted fact
+MAX_CACHED_SELECTORS = 2048
+
+class FactUniverse(NamedTuple):
+    """Every distinct fact a level can produce, in a fixed order."""
+    operation: str
+    level: int
+    description: str
+    operands: Tuple[Tuple[int, int], ...]
+    problems: Tuple[str, ...]
+    answers: Tuple[int, ...]
+    index: Dict[str, int]  # problem string -> position
+    fact_ids: Tuple[int, ...]  # Catalog id of each problem
+
+    def fact(self, i: int) -> Dict[str, object]:
+        num1, num2 = self.operands[i]
+        return {'problem': self.problems[i], 'answer': self.answers[i], 'num1': num1, 'num2': num2}
+
+def _operand_values(spec: NumberSpec, num1: int) -> range:
+    """Enumerate the values an operand spec can take (num2 may depend on num1)."""
+    if spec.type == 'range':
+        low, high = spec.value
+        return range(low, high + 1)
+    elif spec.type in ('single', 'set'):
+        return spec.value
+    elif spec.type == 'complement':
+        return (spec.value[0] - num1,)
+    elif spec.type == 'below':
+        return range(spec.value[0], num1)
+    raise ValueError(f"Unknown number specification type: {spec.type}")
+
+@lru_cache(maxsize=None)
+def get_fact_universe(operation: str, level: int) -> Optional[FactUniverse]:
+    """Get the finite set of facts for a served level, built once per process."""
+    spec = LEVEL_REGISTRY.get((operation, level))
+    if spec is None:
+        return None
+    symbol = SYMBOLS[operation]
+    apply = OPERATORS[operation]
+    operands = tuple(
+        (num1, num2)
+        for num1 in _operand_values(spec.num1, 0)
+        for num2 in _operand_values(spec.num2, num1)
+    )
+    problems = tuple(f"{num1} {symbol} {num2}" for num1, num2 in operands)
+    answers = tuple(apply(num1, num2) for num1, num2 in operands)
+    index = {problem: i for i, problem in enumerate(problems)}
+    fact_ids = tuple(fact_id(operation, num1, num2) for num1, num2 in operands)
+    return FactUniverse(operation, level, spec.description, operands, problems, answers, index, fact_ids)
+
+class AliasTable:
+    """Walker/Vose alias table: O(n) to build, O(1) per weighted sample."""
+    __slots__ = ('_prob', '_alias', '_n')
+
+    def __init__(self, weights: List[float]):
+        n = len(weights)
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            raise ValueError("AliasTable needs at least one positive weight")
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Whatever is left over is 1.0 up to rounding error
+        self._prob = prob
+        self._alias = alias
+        self._n = n
+
+    def sample(self, rng: random.Random = random) -> int:
+        i = int(rng.random() * self._n)
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+class FactSelector:
+    """Samples a level's unmastered facts, weighted toward those a student misses.
+
+    Attempted, unmastered facts each get their own weight in the alias table.
+    All unattempted facts share one "fresh" entry, drawn uniformly by
+    rejection, so the table stays as small as the student's history even for
+    levels with thousands of facts.
+    """
+    __slots__ = ('universe', 'signature', '_table', '_entries', '_attempted')
+
+    FRESH = -1  # Table entry standing for "any unattempted fact"
+
+    def __init__(self, universe: FactUniverse, problem_stats: Dict[str, Dict],
+                 is_mastered: Callable[[Dict], bool], signature: Tuple):
+        self.universe = universe
+        self.signature = signature
+        attempted = set()
+        entries, weights = [], []
+        for problem, stats in problem_stats.items():
+            i = universe.index.get(problem)
+            if i is None:
+                continue  # Not a fact of this level (e.g. older level definitions)
+            attempted.add(i)
+            if not is_mastered(stats):
+                entries.append(i)
+                weights.append(UNATTEMPTED_WEIGHT + ERROR_WEIGHT * (1 - stats['accuracy']))
+        fresh = len(universe.problems) - len(attempted)
+        if fresh:
+            entries.append(self.FRESH)
+            weights.append(UNATTEMPTED_WEIGHT * fresh)
+        self._attempted = attempted
+        self._entries = entries
+        # Everything mastered: fall back to uniform review of the whole level
+        self._table = AliasTable(weights) if entries else None
+
+    def sample(self, rng: random.Random = random) -> int:
+        """Return the index of a fact in the universe."""
+        n = len(self.universe.problems)
+        if self._table is None:
+            return int(rng.random() * n)
+        entry = self._entries[self._table.sample(rng)]
+        if entry != self.FRESH:
+            return entry
+        while True:
+            i = int(rng.random() * n)
+            if i not in self._attempted:
+                return i
+
+def stats_signature(problem_stats: Dict[str, Dict]) -> Tuple:
+    """Cheap fingerprint of a user's fact stats, used to decide when to rebuild."""
+    return tuple(sorted((problem, stats['attempts'], stats['correct'])
+                        for problem, stats in problem_stats.items()))
+
+_selectors: 'OrderedDict[Tuple[int, str, int], FactSelector]' = OrderedDict()
+_selectors_lock = threading.Lock()
+
+def get_fact_selector(user_id: int, operation: str, level: int, problem_stats: Dict[str, Dict],
+                      is_mastered: Callable[[Dict], bool]) -> Optional[FactSelector]:
+    """Get the cached selector for a user's level, rebuilding it if their stats changed."""
+    universe = get_fact_universe(operation, level)
+    if universe is None:
+        return None
+    key = (user_id, operation, level)
+    signature = stats_signature(problem_stats)
+    with _selectors_lock:
+        selector = _selectors.get(key)
+        if selector is not None and selector.signature == signature:
+            _selectors.move_to_end(key)
+            return selector
+    selector = FactSelector(universe, problem_stats, is_mastered, signature)
+    with _selectors_lock:
+        _selectors[key] = selector
+        _selectors.move_to_end(key)
+        while len(_selectors) > MAX_CACHED_SELECTORS:
+            _selectors.popitem(last=False)
+    return selector
+
+def select_fact(user_id: int, operation: str, level: int, problem_stats: Dict[str, Dict],
+                is_mastered: Callable[[Dict], bool]) -> Optional[Dict[str, object]]:
+    """Pick the next fact for a user, favouring unmastered and frequently missed facts."""
+    selector = get_fact_selector(user_id, operation, level, problem_stats, is_mastered)
+    if selector is None:
+        return None
+    return selector.universe.fact(selector.sample())
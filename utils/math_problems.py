@@ -1,9 +1,25 @@
+import operator
 import random
-from typing import Dict, Union, Optional, Tuple, List
+import numpy as np
+from types import MappingProxyType
+from typing import Callable, Dict, NamedTuple, Union, Optional, Tuple, List
 
 # Type hint for a problem
 Problem = Dict[str, Union[str, int, float]]
 
+# Operation symbols and functions, shared by every generator
+SYMBOLS = {
+    'addition': '+',
+    'subtraction': '-',
+    'multiplication': '×'
+}
+
+OPERATORS = {
+    'addition': operator.add,
+    'subtraction': operator.sub,
+    'multiplication': operator.mul
+}
+
 # Define level configurations for each operation
 ADDITION_LEVELS = {
     1: {
@@ -18,7 +34,8 @@ ADDITION_LEVELS = {
     },
     3: {
         'description': "Make 10",
-        'custom_generator': lambda: (random.randint(1, 9), lambda x: 10 - x)
+        'num1': {'type': 'range', 'value': (1, 9)},
+        'num2': {'type': 'complement', 'value': 10}  # num2 = 10 - num1
     },
     4: {
         'description': "Add single digit to double digit",
@@ -56,23 +73,18 @@ SUBTRACTION_LEVELS = {
     5: {
         'description': "Subtract double digit from double digit",
         'num1': {'type': 'range', 'value': (11, 99)},
-        'custom_generator': lambda num1: (num1, lambda x: random.randint(1, x-1))
+        'num2': {'type': 'below', 'value': 1}  # value <= num2 < num1
     }
 }
 
 MULTIPLICATION_LEVELS = {
     'standard': {  # Standard multiplication tables 0-12
-        1: {
-            'description': "×1 Table",
-            'num1': {'type': 'single', 'value': [1]},
+        table: {
+            'description': f"×{table} Table",
+            'num1': {'type': 'single', 'value': [table]},
             'num2': {'type': 'range', 'value': (0, 12)}
-        },
-        2: {
-            'description': "×2 Table",
-            'num1': {'type': 'single', 'value': [2]},
-            'num2': {'type': 'range', 'value': (0, 12)}
-        },
-        # ... more standard levels
+        }
+        for table in range(13)
     },
     'custom': {  # For teacher-defined multiplication
         'description': "Custom multiplication",
@@ -80,15 +92,152 @@ MULTIPLICATION_LEVELS = {
     }
 }
 
-def get_random_number(number_spec):
-    """Get a random number based on range, set, or single number specification"""
-    if number_spec['type'] == 'range':
-        min_val, max_val = number_spec['value']
-        return random.randint(min_val, max_val)
-    elif number_spec['type'] == 'single':
-        return number_spec['value'][0]  # Return the single number
-    else:  # type == 'set'
-        return random.choice(number_spec['value'])
+class NumberSpec(NamedTuple):
+    """Immutable form of a ``{'type': ..., 'value': ...}`` operand specification."""
+    type: str
+    value: Tuple[int, ...]
+
+class LevelSpec(NamedTuple):
+    """A compiled level: its operand specifications and a ready-made generator."""
+    operation: str
+    level: Union[int, str]
+    description: str
+    num1: NumberSpec
+    num2: NumberSpec
+    generate: Callable[[], Problem]
+
+def _freeze_number_spec(number_spec: dict) -> NumberSpec:
+    value = number_spec['value']
+    if isinstance(value, int):
+        value = (value,)
+    return NumberSpec(number_spec['type'], tuple(value))
+
+def _compile_draw(spec: NumberSpec) -> Callable[[int], int]:
+    """Build a draw function for an operand.
+
+    Draw functions take the already drawn first operand, which only the
+    ``complement`` and ``below`` specifications use.
+    """
+    randint = random.randint
+    if spec.type == 'range':
+        low, high = spec.value
+        return lambda num1: randint(low, high)
+    elif spec.type == 'single':
+        number = spec.value[0]
+        return lambda num1: number
+    elif spec.type == 'complement':
+        total = spec.value[0]
+        return lambda num1: total - num1
+    elif spec.type == 'below':
+        low = spec.value[0]
+        return lambda num1: randint(low, num1 - 1)
+    elif spec.type == 'set':
+        choice = random.choice
+        numbers = spec.value
+        return lambda num1: choice(numbers)
+    raise ValueError(f"Unknown number specification type: {spec.type}")
+
+def compile_level(operation: str, level: Union[int, str], level_config: dict) -> LevelSpec:
+    """Compile a level configuration dict into an immutable LevelSpec."""
+    description = level_config['description']
+    num1 = _freeze_number_spec(level_config['num1'])
+    num2 = _freeze_number_spec(level_config['num2'])
+    draw1 = _compile_draw(num1)
+    draw2 = _compile_draw(num2)
+    symbol = SYMBOLS[operation]
+    apply = OPERATORS[operation]
+
+    def generate() -> Problem:
+        a = draw1(0)
+        b = draw2(a)
+        return {
+            'problem': f"{a} {symbol} {b}",
+            'answer': apply(a, b),
+            'num1': a,
+            'num2': b,
+            'description': description,
+            'operation': operation,
+            'level': level
+        }
+
+    return LevelSpec(operation, level, description, num1, num2, generate)
+
+def _build_registry() -> Dict[Tuple[str, int], LevelSpec]:
+    """Compile every level the app serves, keyed by (operation, level)."""
+    registry = {}
+    for operation, levels in (('addition', ADDITION_LEVELS),
+                              ('subtraction', SUBTRACTION_LEVELS),
+                              ('multiplication', MULTIPLICATION_LEVELS['standard'])):
+        for level, level_config in levels.items():
+            registry[(operation, level)] = compile_level(operation, level, level_config)
+    return registry
+
+# Compiled once at import; get_problem dispatches straight through these
+LEVEL_REGISTRY = MappingProxyType(_build_registry())
+_GENERATORS = MappingProxyType({key: spec.generate for key, spec in LEVEL_REGISTRY.items()})
+
+def get_level_spec(operation: str, level: int) -> Optional[LevelSpec]:
+    """Get the compiled spec for a level, or None if the app doesn't serve it"""
+    return LEVEL_REGISTRY.get((operation, level))
+
+def get_level_description(operation: str, level: int) -> str:
+    """Get a level's description without generating a problem"""
+    spec = LEVEL_REGISTRY.get((operation, level))
+    return spec.description if spec else f"Level {level}"
+
+class ProblemBatch(NamedTuple):
+    """A batch of problems for one level, stored as parallel arrays."""
+    operation: str
+    level: Union[int, str]
+    description: str
+    num1: np.ndarray
+    num2: np.ndarray
+    answers: np.ndarray
+    problems: np.ndarray
+
+    def to_dicts(self) -> List[Problem]:
+        """Expand the batch into the same dicts get_problem returns"""
+        operation, level, description = self.operation, self.level, self.description
+        return [
+            {
+                'problem': problem,
+                'answer': answer,
+                'num1': num1,
+                'num2': num2,
+                'description': description,
+                'operation': operation,
+                'level': level
+            }
+            for problem, answer, num1, num2 in zip(self.problems.tolist(), self.answers.tolist(),
+                                                   self.num1.tolist(), self.num2.tolist())
+        ]
+
+def _draw_array(spec: NumberSpec, n: int, rng: np.random.Generator,
+                num1: Optional[np.ndarray] = None) -> np.ndarray:
+    """Vectorized counterpart of _compile_draw: draw n operands at once."""
+    if spec.type == 'range':
+        low, high = spec.value
+        return rng.integers(low, high + 1, size=n)
+    elif spec.type == 'single':
+        return np.full(n, spec.value[0], dtype=np.int64)
+    elif spec.type == 'complement':
+        return spec.value[0] - num1
+    elif spec.type == 'below':
+        return rng.integers(spec.value[0], num1)
+    elif spec.type == 'set':
+        return rng.choice(np.asarray(spec.value, dtype=np.int64), size=n)
+    raise ValueError(f"Unknown number specification type: {spec.type}")
+
+def _generate_batch(spec: LevelSpec, n: int, rng: np.random.Generator) -> ProblemBatch:
+    num1 = _draw_array(spec.num1, n, rng)
+    num2 = _draw_array(spec.num2, n, rng, num1)
+    answers = OPERATORS[spec.operation](num1, num2)
+    problems = np.char.add(
+        np.char.add(num1.astype(str), f" {SYMBOLS[spec.operation]} "),
+        num2.astype(str)
+    )
+    return ProblemBatch(spec.operation, spec.level, spec.description,
+                        num1, num2, answers, problems)
 
 def parse_number_input(input_str: str) -> List[int]:
     """Parse a string containing comma-separated numbers or a range.
@@ -133,66 +282,43 @@ def generate_multiplication_questions(multiplicands: str, num_questions: int = 1
         return []
     
     # Create a custom level configuration
-    custom_level = {
+    custom_level = compile_level('multiplication', 'custom', {
+        'description': MULTIPLICATION_LEVELS['custom']['description'],
         'num1': {'type': 'set', 'value': numbers},
         'num2': {'type': 'range', 'value': (0, 12)}
-    }
+    })
     
-    questions = []
-    for _ in range(num_questions):
-        problem = generate_problem('multiplication', 'custom', custom_level)
-        questions.append(problem)
-    
-    return questions
+    return _generate_batch(custom_level, num_questions, np.random.default_rng()).to_dicts()
 
 def generate_problem(operation: str, level: int, level_config: dict) -> Problem:
-    """Generate a problem based on operation and level configuration"""
-    if 'custom_generator' in level_config:
-        if callable(level_config['custom_generator']):
-            # For simple custom generators (like Make 10)
-            num1, num2_func = level_config['custom_generator']()
-            num2 = num2_func(num1) if callable(num2_func) else num2_func
-        else:
-            # For more complex custom generators
-            num1 = get_random_number(level_config['num1'])
-            num2_func = level_config['custom_generator'](num1)
-            num2 = num2_func(num1) if callable(num2_func) else num2_func
-    else:
-        num1 = get_random_number(level_config['num1'])
-        num2 = get_random_number(level_config['num2'])
-
-    # Define operation symbols
-    symbols = {
-        'addition': '+',
-        'subtraction': '-',
-        'multiplication': '×'
-    }
-    
-    # Define operation functions
-    operations = {
-        'addition': lambda x, y: x + y,
-        'subtraction': lambda x, y: x - y,
-        'multiplication': lambda x, y: x * y
-    }
-    
-    return {
-        'problem': f"{num1} {symbols[operation]} {num2}",
-        'answer': operations[operation](num1, num2),
-        'description': level_config['description'],
-        'operation': operation,
-        'level': level
-    }
+    """Generate a problem from an ad-hoc level configuration.
+
+    Levels the app serves are precompiled; use get_problem for those.
+    """
+    return compile_level(operation, level, level_config).generate()
 
 def get_problem(operation: str, level: int) -> Optional[Problem]:
     """Get a problem based on operation and level"""
-    if operation == 'addition' and level in ADDITION_LEVELS:
-        return generate_problem(operation, level, ADDITION_LEVELS[level])
-    elif operation == 'subtraction' and level in SUBTRACTION_LEVELS:
-        return generate_problem(operation, level, SUBTRACTION_LEVELS[level])
-    elif operation == 'multiplication':
-        if level == 'custom':
-            return None  # Custom levels need multiplicand input
-        elif level in MULTIPLICATION_LEVELS['standard']:
-            return generate_problem(operation, level, MULTIPLICATION_LEVELS['standard'][level])
+    generate = _GENERATORS.get((operation, level))
+    if generate is None:
+        return None  # Invalid operation or level (custom levels need multiplicand input)
+    return generate()
+
+def generate_problems_batch(operation: str, level: int, n: int, seed: Optional[int] = None,
+                            as_arrays: bool = False) -> Optional[Union[List[Problem], ProblemBatch]]:
+    """Generate n problems for a level in one vectorized pass.
     
-    return None  # Invalid operation or level
+    Args:
+        operation: Operation name, as for get_problem
+        level: Level number, as for get_problem
+        n: Number of problems to generate
+        seed: Optional seed for reproducible batches
+        as_arrays: Return a ProblemBatch of parallel arrays instead of dicts
+    Returns:
+        List of Problem dictionaries (or a ProblemBatch), or None for an invalid level
+    """
+    spec = LEVEL_REGISTRY.get((operation, level))
+    if spec is None:
+        return None
+    batch = _generate_batch(spec, n, np.random.default_rng(seed))
+    return batch if as_arrays else batch.to_dicts()
@@ -1,7 +1,7 @@
-from datetime import datetime, timedelta
-from typing import Dict, Union, Optional, List, Tuple
+from typing import Dict, Union, Optional, Tuple
 from utils.math_problems import get_problem as get_math_problem
-from sqlalchemy import or_
+from utils.fact_universe import get_fact_selector, select_fact
+from services.mastery_engine import MasteryEngine, get_mastery_engine
 import logging
 
 # Configure logging
@@ -14,190 +14,132 @@ Problem = Dict[str, Union[str, int, bool, float]]
 class PracticeTracker:
     """Tracks user practice attempts and manages problem selection based on mastery."""
     
-    # Problem mastery thresholds
-    MIN_ATTEMPTS = 3  # Minimum attempts before considering mastery
-    MASTERY_THRESHOLD = 0.8  # 80% accuracy threshold
-    DAYS_TO_LOOK_BACK = 7  # Only look at last 7 days of attempts
-    
-    # Level mastery thresholds (from ProgressService)
-    LEVEL_UP_ACCURACY = 0.9   # 90% accuracy needed to level up
-    LEVEL_UP_TIME = 5.0       # Must solve in under 5 seconds to level up
-    RECENT_ATTEMPTS_TO_CHECK = 10  # Check last 10 attempts for level up
+    # Thresholds live in the mastery engine; kept here for existing callers
+    MIN_ATTEMPTS = MasteryEngine.MIN_ATTEMPTS
+    MASTERY_THRESHOLD = MasteryEngine.MASTERY_THRESHOLD
+    DAYS_TO_LOOK_BACK = MasteryEngine.DAYS_TO_LOOK_BACK
+    LEVEL_UP_ACCURACY = MasteryEngine.LEVEL_UP_ACCURACY
+    LEVEL_UP_TIME = MasteryEngine.LEVEL_UP_TIME
+    RECENT_ATTEMPTS_TO_CHECK = MasteryEngine.RECENT_ATTEMPTS_TO_CHECK
 
     @staticmethod
     def get_problem_stats(db, user_id: int, operation: str, level: int) -> Dict[str, Dict]:
-        """Get statistics for all attempted problems at this level."""
-        from models.practice_attempt import PracticeAttempt
-        week_ago = datetime.utcnow() - timedelta(days=PracticeTracker.DAYS_TO_LOOK_BACK)
-        
-        # Get all attempts for this level in the last week
-        attempts = db.session.query(
-            PracticeAttempt.problem,
-            PracticeAttempt.correct_answer,
-            PracticeAttempt.is_correct,
-            PracticeAttempt.time_taken
-        ).filter(
-            PracticeAttempt.user_id == user_id,
-            PracticeAttempt.operation == operation,
-            PracticeAttempt.level == level,
-            PracticeAttempt.created_at >= week_ago
-        ).all()
-
-        # Group attempts by problem
-        problems = {}
-        for attempt in attempts:
-            prob = attempt.problem
-            if prob not in problems:
-                problems[prob] = {
-                    'attempts': 0,
-                    'correct': 0,
-                    'total_time': 0,
-                    'answer': attempt.correct_answer
-                }
-            problems[prob]['attempts'] += 1
-            if attempt.is_correct:
-                problems[prob]['correct'] += 1
-            if attempt.time_taken:
-                problems[prob]['total_time'] += attempt.time_taken
-
-        # Calculate accuracy and average time for each problem
-        for prob in problems:
-            stats = problems[prob]
-            stats['accuracy'] = stats['correct'] / stats['attempts']
-            stats['avg_time'] = stats['total_time'] / stats['attempts']
-            
-        return problems
+        """Get statistics for all problems at this level practiced in the last week."""
+        return get_mastery_engine().state(user_id, operation, level).problem_stats
 
     @staticmethod
     def is_problem_mastered(stats: Dict) -> bool:
         """Check if a problem has been mastered."""
-        return (stats['attempts'] >= PracticeTracker.MIN_ATTEMPTS and 
-                stats['accuracy'] >= PracticeTracker.MASTERY_THRESHOLD)
+        return MasteryEngine.is_fact_mastered(stats)
 
     @staticmethod
     def check_level_mastery(db, user_id: int, operation: str, level: int) -> Tuple[bool, float, float]:
         """
         Check if a student has mastered the current level.
-        A level is mastered when:
-        1. Recent performance shows high accuracy and speed (90% accuracy, <5s per problem)
-        2. All problems in the level have been mastered (80% accuracy over at least 3 attempts)
+        See MasteryEngine for the criteria.
         
         Returns: (should_level_up, accuracy, avg_time)
         """
-        from models.practice_attempt import PracticeAttempt
-        import logging
-        
-        logging.info(f"\nChecking level mastery for {operation} level {level}")
-        
-        # First check recent performance
-        recent_attempts = db.session.query(PracticeAttempt).filter_by(
-            user_id=user_id,
-            operation=operation,
-            level=level
-        ).order_by(
-            PracticeAttempt.created_at.desc()
-        ).limit(PracticeTracker.RECENT_ATTEMPTS_TO_CHECK).all()
-
-        logging.info(f"Found {len(recent_attempts)} recent attempts")
-        
-        if len(recent_attempts) < PracticeTracker.RECENT_ATTEMPTS_TO_CHECK:
-            logging.info("Not enough recent attempts for level mastery")
-            return False, 0, float('inf')
-
-        # Calculate recent accuracy and average time
-        correct_count = sum(1 for a in recent_attempts if a.is_correct)
-        accuracy = correct_count / len(recent_attempts)
-        
-        correct_times = [a.time_taken for a in recent_attempts if a.is_correct and a.time_taken]
-        avg_time = sum(correct_times) / len(correct_times) if correct_times else float('inf')
-        
-        logging.info(f"Recent performance: accuracy={accuracy:.1%}, avg_time={avg_time:.1f}s")
-
-        # Check if recent performance meets level up criteria
-        recent_mastery = (accuracy >= PracticeTracker.LEVEL_UP_ACCURACY and 
-                         avg_time < PracticeTracker.LEVEL_UP_TIME)
-        
-        if not recent_mastery:
-            logging.info("Recent performance does not meet level up criteria")
-            return False, accuracy, avg_time
-
-        # Then check if all problems in the level are mastered
-        problem_stats = PracticeTracker.get_problem_stats(db, user_id, operation, level)
-        
-        # For multiplication, we need to check all combinations for this level
-        if operation == 'multiplication':
-            required_problems = set()
-            for i in range(0, 13):  # 0-12 for each level
-                problem = f"{level} × {i}"  # Only check problems at this level
-                required_problems.add(problem)
-            
-            logging.info(f"Required problems for multiplication level {level}: {required_problems}")
-            
-            # Check each required problem
-            for problem in required_problems:
-                if problem not in problem_stats:
-                    logging.info(f"Problem {problem} has not been attempted yet")
-                    return False, accuracy, avg_time
-                
-                stats = problem_stats[problem]
-                if not PracticeTracker.is_problem_mastered(stats):
-                    logging.info(f"Problem {problem} is not yet mastered: "
-                               f"{stats['attempts']} attempts, {stats['accuracy']:.1%} accuracy")
-                    return False, accuracy, avg_time
-        
-        # For other operations, check if we have enough mastered problems
-        else:
-            mastered_count = sum(1 for stats in problem_stats.values() 
-                               if PracticeTracker.is_problem_mastered(stats))
-            min_mastered = 10  # Require at least 10 mastered problems for non-multiplication
-            
-            logging.info(f"Mastered {mastered_count} problems out of {len(problem_stats)}")
-            
-            if mastered_count < min_mastered:
-                logging.info(f"Not enough mastered problems (need {min_mastered})")
-                return False, accuracy, avg_time
-
-        logging.info("All criteria met - student has mastered this level!")
-        return True, accuracy, avg_time
+        decision = get_mastery_engine().decide(user_id, operation, level)
+        return decision.mastered, decision.accuracy, decision.avg_time
 
     @staticmethod
     def get_problem(operation: str, level: int, user_id: Optional[int] = None, 
-                db = None) -> Problem:
-        """Get a problem, excluding mastered ones."""
-        import random
-        from utils.math_problems import get_problem as get_math_problem
-        import logging
-
+                db = None) -> Optional[Problem]:
+        """Get a problem, favouring facts the student hasn't mastered yet."""
         # If no user tracking needed, return a random problem
         if not user_id or not db:
             problem_data = get_math_problem(operation, level)
+            if problem_data is None:
+                return None  # Not a level the registry knows
             return {
                 'problem': problem_data['problem'],
-                'answer': problem_data['answer']
+                'answer': problem_data['answer'],
+                'num1': problem_data['num1'],
+                'num2': problem_data['num2']
             }
 
+        # One fetch serves both the mastery check and fact selection
+        engine = get_mastery_engine()
+        problem_stats = engine.state(user_id, operation, level).problem_stats
+
         # First check if student should level up
-        should_level_up, accuracy, avg_time = PracticeTracker.check_level_mastery(
-            db, user_id, operation, level
-        )
-        
-        if should_level_up:
-            logging.info(f"Student has mastered level {level} "
-                        f"(accuracy: {accuracy:.1%}, avg_time: {avg_time:.1f}s)")
-            max_level = 5 if operation == 'addition' else 12
-            new_level = min(level + 1, max_level)
-            if new_level != level:
-                return {
-                    'level_up': True,
-                    'new_level': new_level,
-                    'accuracy': accuracy * 100,
-                    'avg_time': avg_time,
-                    'message': f'Great job! You have mastered level {level}!'
-                }
+        level_up = PracticeTracker.get_level_up(operation, level, engine.decide(user_id, operation, level))
+        if level_up:
+            return level_up
+
+        # Pick from the facts the student hasn't mastered, weighted by error rate
+        fact = select_fact(user_id, operation, level, problem_stats,
+                           PracticeTracker.is_problem_mastered)
+        if fact is not None:
+            return fact
 
-        # Get a new problem
         problem_data = get_math_problem(operation, level)
+        if problem_data is None:
+            return None
         return {
             'problem': problem_data['problem'],
-            'answer': problem_data['answer']
-        }
\ No newline at end of file
+            'answer': problem_data['answer'],
+            'num1': problem_data['num1'],
+            'num2': problem_data['num2']
+        }
+
+    @staticmethod
+    def get_level_up(operation: str, level: int, decision) -> Optional[Dict]:
+        """Build the level-up payload, or None if the student stays on this level."""
+        if not decision.mastered:
+            return None
+        new_level = min(level + 1, MasteryEngine.max_level(operation))
+        if new_level == level:
+            return None
+        logging.info(f"Student has mastered level {level} "
+                    f"(accuracy: {decision.accuracy:.1%}, avg_time: {decision.avg_time:.1f}s)")
+        return {
+            'level_up': True,
+            'new_level': new_level,
+            'accuracy': decision.accuracy * 100,
+            'avg_time': decision.avg_time,
+            'message': f'Great job! You have mastered level {level}!'
+        }
+
+    @staticmethod
+    def get_problems(operation: str, level: int, count: int, user_id: int, db) -> Optional[Dict]:
+        """Get the next `count` problems plus a snapshot of the student's mastery.
+        
+        Uses the same engine state and decision as get_problem, so a client can
+        queue several problems for the cost of one request. Returns the level-up
+        payload instead when the student has mastered the level, and None for a
+        level there are no problems for.
+        """
+        engine = get_mastery_engine()
+        problem_stats = engine.state(user_id, operation, level).problem_stats
+        decision = engine.decide(user_id, operation, level)
+        level_up = PracticeTracker.get_level_up(operation, level, decision)
+        if level_up:
+            return level_up
+        accuracy, avg_time = decision.accuracy, decision.avg_time
+
+        selector = get_fact_selector(user_id, operation, level, problem_stats,
+                                     PracticeTracker.is_problem_mastered)
+        if selector is not None:
+            problems = [selector.universe.fact(selector.sample()) for _ in range(count)]
+            total_facts = len(selector.universe.problems)
+        else:
+            problems = []
+            for _ in range(count):
+                problem_data = get_math_problem(operation, level)
+                if problem_data is None:
+                    return None  # Not a level the registry knows
+                problems.append({key: problem_data[key] for key in ('problem', 'answer', 'num1', 'num2')})
+            total_facts = None
+
+        return {
+            'problems': problems,
+            'mastery': {
+                'level': level,
+                'accuracy': accuracy * 100,
+                'avg_time': avg_time if avg_time != float('inf') else None,
+                'mastered_facts': engine.mastered_fact_count(operation, level, problem_stats),
+                'total_facts': total_facts
+            }
+        }
@@ -0,0 +1,76 @@
+"""Concurrent answer-submission benchmark for a database engine profile.
+
+Each simulated writer commits its answers one transaction at a time, the
+way check_answer does, so every commit also writes user_fact_stats and
+attempt_window through the attempt hooks.
+"""
+import threading
+import time
+from typing import Dict
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from database import configure_engine, db, engine_options
+from models.attempt_window import AttemptWindow
+from models.practice_attempt import PracticeAttempt
+from models.user import User
+from models.user_fact_stat import UserFactStat
+
+TABLES = [User.__table__, PracticeAttempt.__table__, UserFactStat.__table__, AttemptWindow.__table__]
+
+def run_write_benchmark(database_url: str, writers: int = 8, answers: int = 25,
+                        profile: bool = True, environ: Dict = None) -> Dict:
+    """Run `writers` concurrent writers of `answers` attempts each.
+
+    With profile=False the engine gets neither pragmas nor the write queue,
+    for comparison. Returns counts of committed and failed ("database is
+    locked") answers and the throughput.
+    """
+    environ = {} if environ is None else environ
+    engine = create_engine(database_url, **engine_options(database_url, environ))
+    queue = configure_engine(engine, environ) if profile else None
+    db.metadata.create_all(engine, tables=TABLES)
+    with Session(engine) as session:
+        users = [User(username=f'bench{time.monotonic_ns()}_{i}', email=f'bench{i}@example.com', is_teacher=False)
+                 for i in range(writers)]
+        session.add_all(users)
+        session.commit()
+        user_ids = [user.id for user in users]
+
+    committed, failed = [0] * writers, [0] * writers
+    start = threading.Barrier(writers)
+
+    def write(index: int) -> None:
+        start.wait()
+        with Session(engine) as session:
+            for n in range(answers):
+                num2 = n % 13
+                session.add(PracticeAttempt(
+                    user_id=user_ids[index], operation='multiplication', level=7,
+                    problem=f"7 × {num2}", user_answer=7 * num2, correct_answer=7 * num2,
+                    is_correct=True, time_taken=2.0
+                ))
+                try:
+                    session.commit()
+                    committed[index] += 1
+                except OperationalError:
+                    session.rollback()
+                    failed[index] += 1
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    engine.dispose()
+
+    return {
+        'writers': writers,
+        'committed': sum(committed),
+        'failed': sum(failed),
+        'seconds': elapsed,
+        'answers_per_second': sum(committed) / elapsed if elapsed else 0.0,
+        'queue_timeouts': queue.timeouts if queue is not None else None
+    }
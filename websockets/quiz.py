@@ -6,7 +6,10 @@ from models.quiz import Quiz, QuizParticipant, QuizQuestion, QuizAnswer
 from models.user import User
 from models.practice_attempt import PracticeAttempt
 from utils.math_problems import get_problem
+from utils.fact_catalog import fact_id
 from utils.practice_tracker import PracticeTracker
+from services.attempt_buffer import save_attempt, save_quiz_answer
+from services.metrics import observe_socket_event
 from database import db
 import random
 import logging
@@ -26,12 +29,14 @@ def generate_quiz_problem(operation: str, level: int = None) -> dict:
             level = 1
     
     problem = get_problem(operation, level)  # Ensure this function returns a valid problem
-    logger.debug(f"Generated problem: {problem['problem']}")  # Log the generated problem
-    print("Generated problem in quiz.py: ", problem)
     if problem:
+        logger.debug(f"Generated problem: {problem['problem']}")
         return {
             'text': problem['problem'],
-            'answer': problem['answer']
+            'answer': problem['answer'],
+            'num1': problem['num1'],
+            'num2': problem['num2'],
+            'fact_id': fact_id(operation, problem['num1'], problem['num2'])
         }
     return None
 
@@ -45,8 +50,10 @@ def get_correct_answer(quiz_id, question_id):
 
 def send_leaderboard(quiz_id):
     """Send the current leaderboard to participants"""
-    participants = QuizParticipant.query.filter_by(quiz_id=quiz_id).all()
-    leaderboard = [{'username': User.query.get(p.user_id).username, 'score': p.score} for p in participants]
+    rows = db.session.query(User.username, QuizParticipant.score).join(
+        User, User.id == QuizParticipant.user_id
+    ).filter(QuizParticipant.quiz_id == quiz_id).all()
+    leaderboard = [{'username': username, 'score': score} for username, score in rows]
     
     # Sort leaderboard by score
     leaderboard.sort(key=lambda x: x['score'], reverse=True)
@@ -55,6 +62,7 @@ def send_leaderboard(quiz_id):
     logger.debug(f"Sent leaderboard for quiz {quiz_id}: {leaderboard}")
 
 @socketio.on('join_quiz')
+@observe_socket_event('join_quiz')
 def handle_join_quiz(data):
     """Handle when a user joins a quiz"""
     logger.debug(f"Received join_quiz event with data: {data}")
@@ -99,6 +107,9 @@ def handle_join_quiz(data):
     question = QuizQuestion(
         quiz_id=quiz_id,
         problem=problem['text'],
+        num1=problem['num1'],
+        num2=problem['num2'],
+        fact_id=problem['fact_id'],
         answer=problem['answer'],
         level=quiz.level
     )
@@ -122,6 +133,7 @@ def handle_join_quiz(data):
     send_leaderboard(quiz_id)
 
 @socketio.on('start_quiz')
+@observe_socket_event('start_quiz')
 def handle_start_quiz(data):
     """Handle when a teacher starts a quiz"""
     logger.debug(f"Received start_quiz event with data: {data}")
@@ -154,6 +166,9 @@ def handle_start_quiz(data):
     question = QuizQuestion(
         quiz_id=quiz_id,
         problem=problem['text'],
+        num1=problem['num1'],
+        num2=problem['num2'],
+        fact_id=problem['fact_id'],
         answer=problem['answer'],
         level=quiz.level
     )
@@ -171,6 +186,7 @@ def handle_start_quiz(data):
     logger.debug(f"Quiz {quiz_id} started by {current_user.username}")
 
 @socketio.on('submit_answer')
+@observe_socket_event('submit_answer')
 def handle_submit_answer(data):
     """Handle when a user submits an answer"""
     logger.debug(f"Received submit_answer event with data: {data}")
@@ -181,10 +197,6 @@ def handle_submit_answer(data):
    
     logger.debug(f"Submitted answer: {submitted_answer} (type: {type(submitted_answer)})")
     logger.debug(f"Correct answer: {correct_answer} (type: {type(correct_answer)})")
-    print("Submitted answer: ", submitted_answer)
-    print("Correct answer: ", correct_answer)
-    print("data: ", data)
-    print("=====================================")
     
     # Get the quiz to know the operation and level
     quiz = Quiz.query.get(quiz_id)
@@ -215,7 +227,7 @@ def handle_submit_answer(data):
             correct=is_correct,
             time_taken=data.get('time_taken', 0)
         )
-        db.session.add(answer)
+        save_quiz_answer(answer)
         
         # Update quiz score if correct
         if is_correct:
@@ -232,24 +244,9 @@ def handle_submit_answer(data):
             is_correct=is_correct,
             time_taken=data.get('time_taken', 0)
         )
-        db.session.add(practice_attempt)
-        
-        # For multiplication, add commutative case
-        if quiz.operation == 'multiplication':
-            num1, num2 = map(int, question.problem.split('×'))
-            if num1 != num2:  # Only if numbers are different
-                commutative_problem = f"{num2} × {num1}"
-                commutative_attempt = PracticeAttempt(
-                    user_id=current_user.id,
-                    operation=quiz.operation,
-                    level=max(num1, num2),
-                    problem=commutative_problem,
-                    user_answer=submitted_answer,
-                    correct_answer=correct_answer,
-                    is_correct=is_correct,
-                    time_taken=data.get('time_taken', 0)
-                )
-                db.session.add(commutative_attempt)
+        if question.num1 is not None:
+            practice_attempt.set_operands(question.num1, question.num2)
+        save_attempt(practice_attempt)
         
         db.session.commit()
         
@@ -261,6 +258,9 @@ def handle_submit_answer(data):
             new_question = QuizQuestion(
                 quiz_id=quiz_id,
                 problem=problem['text'],
+                num1=problem['num1'],
+                num2=problem['num2'],
+                fact_id=problem['fact_id'],
                 answer=problem['answer'],
                 level=quiz.level
             )
@@ -280,11 +280,10 @@ def handle_submit_answer(data):
             send_leaderboard(quiz_id)
             emit('answer_feedback', {'correct': True}, room=f"quiz_{quiz_id}")
     else:
-        print("Incorrect answer")
-        print("=====================================")
         emit('answer_feedback', {'correct': False}, room=f"quiz_{quiz_id}")
 
 @socketio.on('pause_quiz')
+@observe_socket_event('pause_quiz')
 def handle_pause_quiz(data):
     """Handle when a teacher pauses a quiz"""
     logger.debug(f"Received pause_quiz event with data: {data}")
@@ -313,6 +312,7 @@ def handle_pause_quiz(data):
     logger.debug(f"Quiz {quiz_id} paused by {current_user.username}")
 
 @socketio.on('resume_quiz')
+@observe_socket_event('resume_quiz')
 def handle_resume_quiz(data):
     """Handle when a teacher resumes a quiz"""
     logger.debug(f"Received resume_quiz event with data: {data}")
@@ -339,6 +339,9 @@ def handle_resume_quiz(data):
     question = QuizQuestion(
         quiz_id=quiz_id,
         problem=problem['text'],
+        num1=problem['num1'],
+        num2=problem['num2'],
+        fact_id=problem['fact_id'],
         answer=problem['answer'],
         level=quiz.level
     )
@@ -361,6 +364,7 @@ def handle_resume_quiz(data):
     logger.debug(f"Quiz {quiz_id} resumed by {current_user.username}")
 
 @socketio.on('end_quiz')
+@observe_socket_event('end_quiz')
 def handle_end_quiz(data):
     """Handle when a teacher ends a quiz"""
     logger.debug(f"Received end_quiz event with data: {data}")
@@ -389,6 +393,7 @@ def handle_end_quiz(data):
     logger.debug(f"Quiz {quiz_id} ended by {current_user.username}")
 
 @socketio.on('restart_quiz')
+@observe_socket_event('restart_quiz')
 def handle_restart_quiz(data):
     """Handle when a teacher restarts a quiz"""
     logger.debug(f"Received restart_quiz event with data: {data}")
@@ -10,32 +10,28 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 logger.info("Eventlet monkey patching applied")
 
-# Import the application after monkey patching
+# psycopg2 blocks in C; have it wait on the eventlet hub instead. This must
+# happen before the app's engine opens its first connection.
+from database import make_psycopg2_green
+if make_psycopg2_green():
+    logger.info("psycopg2 configured to cooperate with eventlet")
+
+# Import the application after monkey patching. create_app sizes the
+# connection pool from DB_POOL_* (see database.engine_options) before the
+# engine is built.
 from app import app as application
 
-# Configure SQLAlchemy to work better with eventlet
-try:
-    with application.app_context():
-        # Use NullPool for SQLAlchemy to avoid threading issues with eventlet
-        from sqlalchemy.pool import NullPool
-        from flask_sqlalchemy import SQLAlchemy
-        from database import db
-        
-        # Get the engine options from the app config
-        engine_options = application.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
-        
-        # Add NullPool to the options
-        engine_options['poolclass'] = NullPool
-        
-        # Update the app config
-        application.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
-        
-        logger.info("SQLAlchemy configured with NullPool for eventlet compatibility")
-except Exception as e:
-    logger.exception("Error configuring SQLAlchemy: %s", e)
+# Maintenance jobs run on a green thread in each worker; leases pick one per job
+application.extensions['scheduler'].start()
+
+engine_options = application.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+if engine_options:
+    logger.info("SQLAlchemy pool: size=%s max_overflow=%s recycle=%ss pre_ping=%s",
+                engine_options.get('pool_size'), engine_options.get('max_overflow'),
+                engine_options.get('pool_recycle'), engine_options.get('pool_pre_ping'))
 
 # This is required for Gunicorn to find the application
 if __name__ == "__main__":
     # This block will only execute when running this file directly
     # When running through Gunicorn, Gunicorn will import the 'application' variable
-    eventlet.wsgi.server(eventlet.listen(('0.0.0.0', 5000)), application)
\ No newline at end of file
+    eventlet.wsgi.server(eventlet.listen(('0.0.0.0', 5000)), application)